@@ -157,6 +157,19 @@ def _impl(ctx):
         ],
     )
 
+    # Include the module's precompiled bits/stdc++.h ahead of every C++ source, enabled with
+    # '--features=prebuilt_pch'.  GCC picks the variant in bits/stdc++.h.gch/ compiled with
+    # matching flags, and with -Winvalid-pch reports why others were rejected.
+    prebuilt_pch_feature = feature(
+        name = "prebuilt_pch",
+        flag_sets = [
+            flag_set(
+                actions = [ACTION_NAMES.cpp_compile],
+                flag_groups = [flag_group(flags = ["-include", "bits/stdc++.h", "-Winvalid-pch"])],
+            ),
+        ],
+    )
+
     features = [
         feature(
             name = "default_compile_flags",
@@ -227,6 +240,7 @@ def _impl(ctx):
         dbg_feature,
         supports_pic_feature,
         force_pic_flags_feature,
+        prebuilt_pch_feature,
         feature(
             name = "default_link_flags",
             enabled = True,
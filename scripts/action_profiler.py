@@ -0,0 +1,376 @@
+#!/usr/bin/python
+"""
+Attribute the time of Bazel builds using the compiler suite modules to toolchain components.
+
+Given the json execution log of a build (--execution_log_json_file) and optionally its
+profile (--profile), the profiler keeps the spawns whose inputs or command come from a
+suite module, and aggregates their sandbox setup time, execution time and input counts
+
+* per platform, told apart by the suite module the spawn uses (riscv64 or x86_64)
+* per action mnemonic, such as CppCompile, CppLink or CppArchive
+* per tool: cc1 or cc1plus for gcc compiling C or C++, as for assembler sources,
+  cpp for preprocessing, collect2/ld for gcc linking, and the program name otherwise
+
+and lists the slowest actions and the largest input sets, whose staging the setup time
+measures.  The profile adds the time Bazel spent around each action, by trace category,
+and the critical path.
+
+    bazel build --platforms=//platforms:riscv64 --execution_log_json_file=/tmp/exec.json \\
+        --profile=/tmp/profile.json.gz //...
+    scripts/action_profiler.py --execution-log /tmp/exec.json --profile /tmp/profile.json.gz
+
+A spawn runs gcc through a wrapper script, so its execution time covers the wrapper,
+the gcc driver and the driver's subprocesses together.  With --replay N and the build's
+execution root, the N slowest gcc spawns of each platform and mnemonic are run again
+there with gcc's -time option, writing their outputs to a scratch directory, which
+splits their time between cc1plus, as, collect2 and the wrapper and driver startup:
+
+    scripts/action_profiler.py --execution-log /tmp/exec.json --replay 5 --execroot $(bazel info execution_root)
+"""
+import os
+import re
+import sys
+import json
+import gzip
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+import logging
+from toolchain_benchmark import SUITES, read_execution_log, duration
+logger = logging
+
+C_SOURCES = (".c",)
+CXX_SOURCES = (".cc", ".cpp", ".cxx", ".c++", ".C")
+ASM_SOURCES = (".s", ".S", ".sx")
+# the lines gcc -time writes for each subprocess: "# cc1plus 0.52 0.04", user and system seconds
+TIME_LINE = re.compile(r"^# (\S+) ([0-9.]+) ([0-9.]+)$", re.M)
+# profile action names start with the progress message, e.g. "Compiling bench/lib0/f1.cc"
+PROGRESS_MNEMONICS = {"Compiling": "CppCompile", "Linking": "CppLink"}
+
+def suite_of(path):
+    """
+    The suite module an execution root path belongs to, including its component modules, or None
+    """
+    if not path.startswith("external/"):
+        return None
+    repo = path.split("/", 2)[1].rstrip("+")
+    for suite in SUITES.values():
+        if repo == suite or repo.startswith(suite + "_"):
+            return suite
+    return None
+
+def is_gcc_driver(program):
+    name = os.path.basename(program)
+    return name in ("gcc", "g++", "cc", "c++") or name.endswith(("-gcc", "-g++"))
+
+def spawn_tool(args):
+    """
+    The toolchain component doing the work of a command
+    """
+    if not args:
+        return "unknown"
+    if not is_gcc_driver(args[0]):
+        return os.path.basename(args[0])
+    if "-E" in args:
+        return "cpp"
+    if "-c" not in args and "-S" not in args:
+        return "collect2/ld"
+    sources = [a for a in args[1:] if not a.startswith("-") and a.endswith(C_SOURCES + CXX_SOURCES + ASM_SOURCES)]
+    language = args[args.index("-x") + 1] if "-x" in args[:-1] else None
+    if language in ("c++", "c++-header") or any(s.endswith(CXX_SOURCES) for s in sources):
+        return "cc1plus"
+    if language in ("assembler", "assembler-with-cpp") or any(s.endswith(ASM_SOURCES) for s in sources):
+        return "as"
+    return "cc1"
+
+def _size(digest):
+    # protobuf json writes int64 values as strings
+    return int((digest or {}).get("sizeBytes", 0) or 0)
+
+def spawn_record(spawn):
+    """
+    The fields of an execution log spawn the profiler aggregates, or None if it uses no suite
+    """
+    args = spawn.get("commandArgs", [])
+    inputs = spawn.get("inputs", [])
+    suites = {suite_of(i.get("path", "")) for i in inputs}
+    suites.add(suite_of(args[0]) if args else None)
+    suites.discard(None)
+    if not suites:
+        return None
+    platforms = sorted(p for p, s in SUITES.items() if s in suites)
+    metrics = spawn.get("metrics", {})
+    outputs = spawn.get("listedOutputs") or [o.get("path", "") for o in spawn.get("actualOutputs", [])]
+    return {
+        "suites": sorted(suites),
+        "platform": "+".join(platforms),
+        "mnemonic": spawn.get("mnemonic", "unknown"),
+        "tool": spawn_tool(args),
+        "program": args[0] if args else "",
+        "target": spawn.get("targetLabel", ""),
+        "output": outputs[0] if outputs else "",
+        "runner": spawn.get("runner", ""),
+        "cached": bool(spawn.get("cacheHit")) or spawn.get("runner", "").endswith("cache hit"),
+        "setup": duration(metrics.get("setupTime")),
+        "execution": duration(metrics.get("executionWallTime") or spawn.get("walltime")),
+        "total": duration(metrics.get("totalTime") or spawn.get("walltime")),
+        "inputs": len(inputs) or int(metrics.get("inputFiles", 0) or 0),
+        "suite_inputs": sum(1 for i in inputs if suite_of(i.get("path", ""))),
+        "input_bytes": sum(_size(i.get("digest")) for i in inputs) or int(metrics.get("inputBytes", 0) or 0),
+        "args": args,
+        "env": {e["name"]: e.get("value", "") for e in spawn.get("environmentVariables", [])},
+    }
+
+def _stats(values):
+    values = sorted(values)
+    if not values:
+        return {"median_s": 0.0, "p90_s": 0.0, "sum_s": 0.0}
+    return {
+        "median_s": round(statistics.median(values), 4),
+        "p90_s": round(values[min(len(values) - 1, int(len(values) * 0.9))], 4),
+        "sum_s": round(sum(values), 3),
+    }
+
+def aggregate(records, key):
+    """
+    Action counts, latencies and input counts of executed spawns grouped by a key function
+    """
+    groups = {}
+    for record in records:
+        groups.setdefault(key(record), []).append(record)
+    summary = {}
+    for name, members in sorted(groups.items()):
+        executed = [r for r in members if not r["cached"]]
+        summary[name] = {
+            "count": len(members),
+            "cached": len(members) - len(executed),
+            "setup": _stats(r["setup"] for r in executed),
+            "execution": _stats(r["execution"] for r in executed),
+            "total": _stats(r["total"] for r in executed),
+            "inputs_median": statistics.median(r["inputs"] for r in members),
+            "inputs_max": max(r["inputs"] for r in members),
+        }
+    return summary
+
+def load_profile(path):
+    """
+    The trace events of a Bazel json profile, which may be gzip compressed
+    """
+    with open(path, "rb") as pf:
+        data = pf.read()
+    if data[:2] == b"\x1f\x8b":
+        data = gzip.decompress(data)
+    profile = json.loads(data)
+    return profile["traceEvents"] if isinstance(profile, dict) else profile
+
+def profile_mnemonic(event):
+    args = event.get("args") or {}
+    if args.get("mnemonic"):
+        return args["mnemonic"]
+    return PROGRESS_MNEMONICS.get(event.get("name", "").split(" ", 1)[0], "unknown")
+
+def summarize_profile(events, top=10):
+    """
+    Per mnemonic action time, the time within actions by trace category, and the critical path
+    """
+    complete = [e for e in events if e.get("ph") == "X" and "dur" in e]
+    actions = {}
+    inside = {}
+    by_thread = {}
+    for event in complete:
+        by_thread.setdefault((event.get("pid"), event.get("tid")), []).append(event)
+        if event.get("cat") == "action processing":
+            actions.setdefault(profile_mnemonic(event), []).append(event["dur"] / 1e6)
+    # attribute the events directly nested in an action span on the same thread to the action
+    for thread_events in by_thread.values():
+        thread_events.sort(key=lambda e: (e["ts"], -e["dur"]))
+        stack = []
+        for event in thread_events:
+            while stack and stack[-1]["ts"] + stack[-1]["dur"] <= event["ts"]:
+                stack.pop()
+            if stack and stack[-1].get("cat") == "action processing":
+                per_category = inside.setdefault(profile_mnemonic(stack[-1]), {})
+                category = event.get("cat") or event.get("name", "unknown")
+                per_category[category] = round(per_category.get(category, 0.0) + event["dur"] / 1e6, 3)
+            stack.append(event)
+    critical = [e for e in complete if e.get("cat") == "critical path component"]
+    critical.sort(key=lambda e: -e["dur"])
+    return {
+        "actions": {m: {"count": len(d), **_stats(d)} for m, d in sorted(actions.items())},
+        "inside_actions": inside,
+        "critical_path_s": round(sum(e["dur"] for e in critical) / 1e6, 3),
+        "critical_path_top": [{"name": e.get("name", ""), "s": round(e["dur"] / 1e6, 3)}
+                              for e in critical[:top]],
+    }
+
+def replay_command(args, scratch):
+    """
+    A gcc spawn's command with -time added and its outputs redirected to a scratch directory
+    """
+    command = [args[0], "-time"]
+    redirect = {"-o", "-MF", "-MQ", "-MT"}
+    i = 1
+    while i < len(args):
+        arg = args[i]
+        if arg in redirect and i + 1 < len(args):
+            if arg == "-o":
+                command += [arg, f"{scratch}/{len(command)}.out"]
+            elif arg == "-MF":
+                command += [arg, f"{scratch}/{len(command)}.d"]
+            else:
+                command += [arg, args[i + 1]]
+            i += 2
+            continue
+        command.append(arg)
+        i += 1
+    return command
+
+def replay(records, execroot, count):
+    """
+    Run the slowest gcc spawns of each platform and mnemonic again with -time in the execution
+    root, returning per tool user and system seconds and the unattributed wrapper and driver time
+    """
+    groups = {}
+    for record in records:
+        if is_gcc_driver(record["program"]) or "/wrappers/" in record["program"]:
+            groups.setdefault((record["platform"], record["mnemonic"]), []).append(record)
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="action_profiler.") as scratch:
+        for (platform, mnemonic), members in sorted(groups.items()):
+            members.sort(key=lambda r: -r["execution"])
+            totals = {"spawns": 0, "failed": 0, "wall_s": 0.0, "tools": {}}
+            for record in members[:count]:
+                env = dict(record["env"]) or dict(os.environ)
+                start = time.monotonic()
+                result = subprocess.run(replay_command(record["args"], scratch), cwd=execroot, env=env,
+                                        capture_output=True, encoding="utf8", errors="replace")
+                wall = time.monotonic() - start
+                if result.returncode != 0:
+                    totals["failed"] += 1
+                    error = result.stderr.strip().splitlines()
+                    logger.warning(f"replaying {record['output'] or record['target']} failed: " +
+                                   (error[-1] if error else f"exit status {result.returncode}"))
+                    continue
+                totals["spawns"] += 1
+                totals["wall_s"] += wall
+                for tool, user, system in TIME_LINE.findall(result.stderr):
+                    totals["tools"][tool] = totals["tools"].get(tool, 0.0) + float(user) + float(system)
+            if totals["spawns"]:
+                attributed = sum(totals["tools"].values())
+                totals["wrapper_and_driver_s"] = round(max(0.0, totals["wall_s"] - attributed), 3)
+                totals["wall_s"] = round(totals["wall_s"], 3)
+                totals["tools"] = {t: round(s, 3) for t, s in sorted(totals["tools"].items())}
+            results[f"{platform} {mnemonic}"] = totals
+    return results
+
+def profile_build(spawns, events=None, top=10, suites=None):
+    """
+    The report of the spawns of an execution log using a suite module, or one of the named
+    suites, and of a profile's trace events
+    """
+    records = [r for r in (spawn_record(s) for s in spawns)
+               if r is not None and (not suites or set(r["suites"]) & set(suites))]
+    executed = [r for r in records if not r["cached"]]
+
+    def brief(record):
+        return {key: record[key] for key in ("platform", "mnemonic", "tool", "target", "output", "runner",
+                                             "setup", "execution", "total", "inputs", "suite_inputs",
+                                             "input_bytes")}
+
+    report = {
+        "spawns": len(spawns),
+        "suite_spawns": len(records),
+        "platforms": aggregate(records, lambda r: r["platform"]),
+        "mnemonics": aggregate(records, lambda r: f"{r['platform']} {r['mnemonic']}"),
+        "tools": aggregate(records, lambda r: f"{r['platform']} {r['tool']}"),
+        "programs": aggregate(records, lambda r: r["program"]),
+        "slowest": [brief(r) for r in sorted(executed, key=lambda r: -r["total"])[:top]],
+        "largest_inputs": [brief(r) for r in sorted(records, key=lambda r: -r["inputs"])[:top]],
+    }
+    if events is not None:
+        report["profile"] = summarize_profile(events, top)
+    return report, records
+
+def print_report(report, out=sys.stdout):
+    """
+    Print the aggregates of a report as text tables
+    """
+    def table(title, groups):
+        print(f"\n{title}", file=out)
+        print(f"  {'':40} {'actions':>8} {'cached':>7} {'setup s':>9} {'exec s':>9} {'exec p90':>9} " +
+              f"{'inputs':>7} {'max in':>7}", file=out)
+        for name, g in sorted(groups.items(), key=lambda item: -item[1]["total"]["sum_s"]):
+            print(f"  {name[:40]:40} {g['count']:8} {g['cached']:7} {g['setup']['sum_s']:9.2f} " +
+                  f"{g['execution']['sum_s']:9.2f} {g['execution']['p90_s']:9.3f} " +
+                  f"{g['inputs_median']:7.0f} {g['inputs_max']:7}", file=out)
+
+    def actions(title, records):
+        print(f"\n{title}", file=out)
+        for r in records:
+            print(f"  {r['total']:8.3f}s setup {r['setup']:7.3f}s {r['inputs']:6} inputs " +
+                  f"({r['suite_inputs']} from the suite)  {r['platform']} {r['mnemonic']} {r['tool']} " +
+                  f"{r['output'] or r['target']}", file=out)
+
+    print(f"{report['suite_spawns']} of {report['spawns']} spawns use a suite module", file=out)
+    table("per platform", report["platforms"])
+    table("per platform and mnemonic", report["mnemonics"])
+    table("per platform and tool", report["tools"])
+    table("per program", report["programs"])
+    actions("slowest actions", report["slowest"])
+    actions("largest input sets", report["largest_inputs"])
+    profile = report.get("profile")
+    if profile:
+        print("\nprofile: action processing time per mnemonic", file=out)
+        for mnemonic, s in profile["actions"].items():
+            print(f"  {mnemonic:40} {s['count']:8} {s['sum_s']:9.2f}s  median {s['median_s']:.3f}s", file=out)
+        print("\nprofile: time inside actions per trace category", file=out)
+        for mnemonic, categories in sorted(profile["inside_actions"].items()):
+            parts = ", ".join(f"{c} {s:.2f}s" for c, s in sorted(categories.items(), key=lambda i: -i[1]))
+            print(f"  {mnemonic}: {parts}", file=out)
+        print(f"\nprofile: critical path {profile['critical_path_s']}s", file=out)
+        for component in profile["critical_path_top"]:
+            print(f"  {component['s']:8.3f}s {component['name']}", file=out)
+    for group, totals in sorted(report.get("replay", {}).items()):
+        if not totals["spawns"]:
+            continue
+        parts = ", ".join(f"{t} {s:.2f}s" for t, s in totals["tools"].items())
+        print(f"\nreplay of {totals['spawns']} {group} spawns, {totals['wall_s']}s: {parts}, " +
+              f"wrapper and driver {totals['wrapper_and_driver_s']}s", file=out)
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Attribute Bazel build time to compiler suite components")
+    parser.add_argument("--execution-log", required=True, help="json execution log of the build")
+    parser.add_argument("--profile", help="json profile of the same build, optionally gzip compressed")
+    parser.add_argument("--suite", action="append", choices=sorted(SUITES.values()),
+                        help="only profile actions using these suites, by default all of them")
+    parser.add_argument("--top", type=int, default=10, help="slowest actions and largest input sets listed")
+    parser.add_argument("--replay", type=int, default=0, metavar="N",
+                        help="rerun the N slowest gcc spawns of each platform and mnemonic with -time")
+    parser.add_argument("--execroot", help="the build's execution root, for --replay")
+    parser.add_argument("--json", help="also write the report to this json file")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.replay and not args.execroot:
+        logger.error("--replay needs the build's --execroot")
+        sys.exit(1)
+    try:
+        spawns = read_execution_log(args.execution_log)
+        events = load_profile(args.profile) if args.profile else None
+    except (OSError, ValueError, KeyError) as e:
+        logger.error(f"unable to read the build logs: {e}")
+        sys.exit(1)
+    report, records = profile_build(spawns, events, args.top, args.suite)
+    if args.replay:
+        report["replay"] = replay([r for r in records if not r["cached"]], args.execroot, args.replay)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf8") as jf:
+            json.dump(report, jf, indent=1, sort_keys=True)
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
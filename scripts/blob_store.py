@@ -0,0 +1,154 @@
+"""
+A content-addressed store of processed files, shared by every suite version.
+
+Suite versions share most of their binaries, so once a file has been stripped for one
+version, any other version importing the same content can hard link the stripped
+result instead of stripping it again.  Blobs are keyed by the sha256 and mode of the
+file as imported, under a directory per operation, for instance "stripped with the
+host strip".  An operation's directory name includes a hash of the tool's contents,
+so a new binutils release never reuses blobs made by the old one.
+
+    <root>/<operation>-<tool hash>/<first two hex digits>/<sha256>-<mode>
+    <root>/<operation>-<tool hash>/<first two hex digits>/<sha256>-<mode>.json
+
+The json sidecar holds the sha256 of the processed blob, so later stages don't hash it
+again, and any operation-specific values such as a build-id.  Source hashes are cached
+in <root>/source_hashes.json by path, size and modification time.
+"""
+import os
+import json
+import shutil
+import hashlib
+import threading
+import logging
+from suite_manifest import file_sha256
+logger = logging
+
+class BlobStore():
+    """
+    Processed files keyed by operation and source content, hard linked into module trees
+    """
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self.lock = threading.Lock()
+        # "path\0size\0mtime_ns" => sha256 of files hashed in this or earlier runs
+        self.index_file = f"{root}/source_hashes.json"
+        self.index = {}
+        if os.path.exists(self.index_file):
+            with open(self.index_file, encoding="utf8") as jf:
+                self.index = json.load(jf)
+        # tool path => sha256 of the tool
+        self.tools = {}
+
+    def operation(self, name, tool, *extra):
+        """
+        The directory name of an operation run with a tool, plus any extra settings
+        """
+        path = shutil.which(tool) or tool
+        with self.lock:
+            if path not in self.tools:
+                self.tools[path] = file_sha256(path) if os.path.exists(path) else path
+        sha256 = hashlib.sha256(self.tools[path].encode("utf8"))
+        for value in extra:
+            sha256.update(f"\0{value}".encode("utf8"))
+        return f"{name}-{sha256.hexdigest()[:16]}"
+
+    def source_key(self, path, origin=None):
+        """
+        The store key of a file about to be processed, from its content hash and mode.
+        origin is the file it was imported from, whose size and modification time it shares,
+        so unchanged sources are never hashed twice.
+        """
+        st = os.stat(path)
+        cache_key = f"{origin or os.path.abspath(path)}\0{st.st_size}\0{st.st_mtime_ns}"
+        with self.lock:
+            sha256 = self.index.get(cache_key)
+        if sha256 is None:
+            sha256 = file_sha256(path)
+            with self.lock:
+                self.index[cache_key] = sha256
+        return f"{sha256}-{st.st_mode & 0o7777:o}"
+
+    def path(self, operation, key):
+        """
+        The path of a blob in the store
+        """
+        return f"{self.root}/{operation}/{key[:2]}/{key}"
+
+    def lookup(self, operation, key):
+        """
+        The metadata of a stored blob, or None when the store doesn't hold it
+        """
+        blob = self.path(operation, key)
+        try:
+            with open(blob + ".json", encoding="utf8") as jf:
+                metadata = json.load(jf)
+        except OSError:
+            metadata = None
+        if metadata is None or not os.path.exists(blob):
+            return None
+        return metadata
+
+    def link(self, operation, key, destinations):
+        """
+        Replace every destination path with a hard link to a stored blob
+        """
+        for destination in destinations:
+            _link(self.path(operation, key), destination)
+
+    def put(self, operation, key, source, **metadata):
+        """
+        Store a processed file by hard linking it into the store, with its metadata,
+        returning the metadata including the blob's sha256
+        """
+        blob = self.path(operation, key)
+        os.makedirs(os.path.dirname(blob), exist_ok=True)
+        metadata["sha256"] = file_sha256(source)
+        _link(source, blob)
+        tmp = f"{blob}.json.{threading.get_ident()}"
+        with open(tmp, "w", encoding="utf8") as jf:
+            json.dump(metadata, jf, sort_keys=True)
+        os.replace(tmp, blob + ".json")
+        return metadata
+
+    def save(self):
+        """
+        Save the source hash cache
+        """
+        with self.lock:
+            tmp = f"{self.index_file}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf8") as jf:
+                json.dump(self.index, jf, sort_keys=True)
+            os.replace(tmp, self.index_file)
+
+    def collect_garbage(self):
+        """
+        Remove blobs no module tree links to any more, returning the bytes freed
+        """
+        freed = 0
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                blob = os.path.join(dirpath, name)
+                if name.endswith(".json") or blob == self.index_file:
+                    continue
+                st = os.lstat(blob)
+                if st.st_nlink == 1:
+                    freed += st.st_size
+                    os.remove(blob)
+                    if os.path.exists(blob + ".json"):
+                        os.remove(blob + ".json")
+        logger.info(f"removed unreferenced blobs totalling {freed} bytes from {self.root}")
+        return freed
+
+def _link(source, destination):
+    """
+    Atomically replace destination with a hard link to source, copying across file systems
+    """
+    tmp = f"{destination}.blob{threading.get_ident()}"
+    try:
+        os.link(source, tmp)
+    except OSError:
+        shutil.copy2(source, tmp)
+    os.replace(tmp, destination)
@@ -0,0 +1,235 @@
+"""
+Write a module's Bazel BUILD file from the files actually imported into it.
+
+Instead of broad globs, every Bazel action class gets its own filegroup with an
+explicit file list, so a compile action stages headers, the compiler and the
+assembler, but not the linker inputs or sanitizer runtimes, and an archive action
+stages just ar.  Precompiled headers get their own pch_files group, staged only by
+toolchains using them.  compiler_files remains as the union of all groups, for
+toolchains not yet using the split groups, and the std_includes, lib, libexec and
+c++_std_includes targets of the hand-written BUILD files remain for toolchains written
+against them.  Files split into component modules are left out, and reached through an
+alias per component instead.
+
+Patterns are matched against paths relative to the module root.  "**" matches any
+number of directories, "*" and "?" match within a single path component, and
+{target}, {gcc_version} and {tool_prefix} are replaced by the suite's settings.
+"""
+import re
+
+# (filegroup name, comment, included patterns or :filegroup references, excluded patterns)
+FILEGROUPS = (
+    ("preprocess_files", "The preprocessor and compilers, and the system and C++ headers", [
+        "bin/{tool_prefix}cpp",
+        "bin/{tool_prefix}gcc",
+        "bin/{tool_prefix}g++",
+        "libexec/gcc/{target}/{gcc_version}/cc1",
+        "libexec/gcc/{target}/{gcc_version}/cc1plus",
+        "usr/include/**",
+        "include/**",
+        "{target}/include/**",
+        "{target}/sys-include/**",
+        "lib/gcc/{target}/{gcc_version}/include/**",
+        "lib/gcc/{target}/{gcc_version}/include-fixed/**",
+    ], [
+        "**/*.gch",
+        "**/*.gch/*",
+    ]),
+    ("pch_files", "Precompiled headers, add these to the compiler files of toolchains enabling " +
+                  "the prebuilt_pch feature", [
+        "**/*.gch",
+        "**/*.gch/*",
+    ], []),
+    ("assemble_files", "The assembler, as found by gcc", [
+        # Bazel's assemble actions run the gcc driver, which runs as, so a toolchain whose
+        # as_files is just this group still needs the driver
+        "bin/{tool_prefix}gcc",
+        "bin/{tool_prefix}as",
+        "{target}/bin/as",
+        "libexec/gcc/{target}/{gcc_version}/as",
+    ], []),
+    ("compile_files", "Compiling needs the preprocessor, compilers and assembler", [
+        ":preprocess_files",
+        ":assemble_files",
+    ], []),
+    ("link_files", "gcc as a linker driver, collect2, ld, startup files and libraries, " +
+                   "without the sanitizer runtimes", [
+        "bin/{tool_prefix}gcc",
+        "bin/{tool_prefix}g++",
+        "bin/{tool_prefix}ld",
+        "bin/{tool_prefix}ld.bfd",
+        "{target}/bin/ld",
+        "{target}/bin/ld.bfd",
+        "libexec/gcc/{target}/{gcc_version}/collect2",
+        "libexec/gcc/{target}/{gcc_version}/ld",
+        "libexec/gcc/{target}/{gcc_version}/liblto_plugin.so*",
+        "lib/gcc/{target}/{gcc_version}/*.o",
+        "lib/gcc/{target}/{gcc_version}/*.a",
+        "lib/gcc/{target}/{gcc_version}/*.so*",
+        "lib/*",
+        "lib64/*",
+        "usr/lib/**",
+        "usr/lib64/**",
+        "{target}/lib/**",
+        "{target}/lib64/**",
+    ], [
+        "**/lib*san.so*",
+        "**/libsanitizer.spec",
+    ]),
+    ("sanitizer_runtime_files", "Runtimes linked with -fsanitize=..., add these to the linker files " +
+                                "of toolchains supporting sanitizers", [
+        "lib*/lib*san.so*",
+        "lib*/libsanitizer.spec",
+        "{target}/lib*/lib*san.so*",
+        "{target}/lib*/libsanitizer.spec",
+    ], []),
+    ("ar_files", "The archiver", [
+        "bin/{tool_prefix}ar",
+        "bin/{tool_prefix}ranlib",
+        "{target}/bin/ar",
+        "{target}/bin/ranlib",
+        "libexec/gcc/{target}/{gcc_version}/ar",
+        "libexec/gcc/{target}/{gcc_version}/ranlib",
+    ], []),
+    ("objcopy_files", "objcopy and objdump", [
+        "bin/{tool_prefix}objcopy",
+        "bin/{tool_prefix}objdump",
+        "{target}/bin/objcopy",
+        "{target}/bin/objdump",
+    ], []),
+    ("strip_files", "The target's strip", [
+        "bin/{tool_prefix}strip",
+        "{target}/bin/strip",
+        "libexec/gcc/{target}/{gcc_version}/strip",
+    ], []),
+)
+
+# the targets of the hand-written module BUILD files, covering the layouts of both suites,
+# defined alongside FILEGROUPS but not part of compiler_files or the unused file count
+LEGACY_FILEGROUPS = (
+    ("std_includes", "GCC's own headers and libraries, and the system headers", [
+        "lib/gcc/{target}/{gcc_version}/**",
+        "usr/include/**",
+    ], [
+        "**/*.gch",
+        "**/*.gch/*",
+    ]),
+    ("libexec", "The compiler proper and the tools gcc runs", [
+        "libexec/gcc/{target}/{gcc_version}/**",
+    ], []),
+    ("lib", "GCC's libraries, startup files and the C, math and C++ runtime libraries", [
+        "lib/gcc/{target}/{gcc_version}/**",
+        "lib/crt1.o",
+        "lib/crti.o",
+        "lib/crtn.o",
+        "lib/libc.so",
+        "lib/libc.so.6",
+        "lib/libm.so",
+        "lib/libm.so.6",
+        "lib/libmvec.so",
+        "lib/libmvec.so.1",
+        "lib/libc_nonshared.a",
+        "lib/ld-linux-*.so.*",
+        "lib64/ld-linux-*.so.*",
+        "{target}/lib/libgcc_s.so*",
+        "{target}/lib/libstdc++.so*",
+        "lib64/libgcc_s.so*",
+        "lib64/libstdc++.so*",
+    ], [
+        "**/*.gch",
+        "**/*.gch/*",
+    ]),
+    ("c++_std_includes", "The C++ standard library headers", [
+        "{target}/include/c++/{gcc_version}/**",
+        "include/c++/{gcc_version}/**",
+        "include/bits/**",
+        "include/stdlib.h",
+    ], [
+        "**/*.gch",
+        "**/*.gch/*",
+    ]),
+)
+
+# files belonging to the Bazel module itself rather than the compiler suite
+MODULE_FILES = ("BUILD", "BUILD.bazel", "MODULE.bazel", ".gitignore")
+
+def pattern_regex(pattern):
+    """
+    Convert a path pattern into a regular expression
+    """
+    regex = ""
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            regex += "(?:.*/)?"
+            i += 3
+        elif pattern.startswith("**", i):
+            regex += ".*"
+            i += 2
+        elif pattern[i] == "*":
+            regex += "[^/]*"
+            i += 1
+        elif pattern[i] == "?":
+            regex += "[^/]"
+            i += 1
+        else:
+            regex += re.escape(pattern[i])
+            i += 1
+    return re.compile(regex + r"\Z")
+
+def classify(files, variables, filegroups=FILEGROUPS):
+    """
+    Assign relative file paths to filegroups, returning the group => files mapping
+    and the files no group selected
+    """
+    files = sorted(f for f in files if f not in MODULE_FILES)
+    groups = {}
+    used = set()
+    for name, _, includes, excludes in filegroups:
+        included = [pattern_regex(p.format_map(variables)) for p in includes if not p.startswith(":")]
+        excluded = [pattern_regex(p.format_map(variables)) for p in excludes]
+        members = [f for f in files
+                   if any(r.match(f) for r in included) and not any(r.match(f) for r in excluded)]
+        groups[name] = members
+        used.update(members)
+    return groups, [f for f in files if f not in used]
+
+def render(groups, unused, header, filegroups=FILEGROUPS, aliases=None, union=True, legacy=None):
+    """
+    The text of a BUILD file defining each filegroup with an explicit file list, the
+    compiler_files union of them unless union is False, the LEGACY_FILEGROUPS from the
+    legacy group => files mapping, and an alias for each name => label in aliases
+    """
+    lines = [f"# {line}" if line else "#" for line in header.splitlines()]
+    lines += ["", 'package(default_visibility = ["//visibility:public"])', ""]
+    lines += _filegroups(groups, filegroups)
+    if union:
+        lines += ["# Every file used by some action, for toolchains not using the split filegroups",
+                  "filegroup(", '    name = "compiler_files",', "    srcs = ["]
+        lines += [f'        ":{name}",' for name, _, _, _ in filegroups]
+        lines += ["    ],", ")", ""]
+    if legacy:
+        lines += ["# The targets of earlier hand-written BUILD files, for toolchains still using them", ""]
+        lines += _filegroups(legacy, LEGACY_FILEGROUPS)
+    if aliases:
+        lines += ["# Files published as separate component modules, fetched only when a target uses them"]
+        for name, actual in sorted(aliases.items()):
+            lines += ["alias(", f'    name = "{name}",', f'    actual = "{actual}",', ")", ""]
+    if unused:
+        lines += [f"# {len(unused)} imported files are not used by any filegroup, for example:"]
+        lines += [f"#   {f}" for f in unused[:20]]
+        lines += [""]
+    return "\n".join(lines)
+
+def _filegroups(groups, filegroups):
+    """
+    The lines defining each filegroup with its :filegroup references and explicit file list
+    """
+    lines = []
+    for name, comment, includes, _ in filegroups:
+        references = [p for p in includes if p.startswith(":")]
+        lines += [f"# {comment}", "filegroup(", f'    name = "{name}",', "    srcs = ["]
+        lines += [f'        "{ref}",' for ref in references]
+        lines += [f'        "{f}",' for f in groups[name]]
+        lines += ["    ],", ")", ""]
+    return lines
@@ -7,16 +7,29 @@ The overall procedure is something like
 * configure, build, and install binutils with an appropriate target
 * configure, build, and install gcc with the same target
 * configure, build, and install glibc with the same target
-* edit the version-dependent generator script to select files for inclusion in the module
-* execute that generator script to:
-    * remove previously imported files from the module source directory
-    * rsync selected files into the module source directory
-    * strip executables to reduce the size of the module
-    * use rdfind to change duplicates into hard links
-    * use tar to create a compressed module file in the module tarball directory
-    * use openssl to generate a base64 digest of that tarball
+* edit the version-dependent suite specification (suites/*.toml) to select files for inclusion in the module
+* execute scripts/generate_suites.py with that specification to:
+    * remove previously imported files from the module source directory, unless this is
+      an incremental run reusing the files recorded in the previous run's manifest
+    * import selected files into the module source directory, evaluating rsync filter rules
+      natively and hard linking or cloning files where possible, or with rsync itself
+    * optionally report or prune shared objects no toolchain entry point needs
+    * strip executables in parallel to reduce the size of the module
+    * report or remove headers no source of a user corpus includes
+    * replace duplicate files with hard links
+    * write the module's BUILD file, with explicit per-action filegroups of the imported files
+    * optionally split components like the sanitizer runtimes into separate modules, fetched lazily
+    * optionally keep the debug information of stripped binaries in a separate debug module
+    * reuse binaries stripped for other suite versions from a content-addressed blob store
+    * use tar and xz, zstd, or gzip to create a compressed module file in the module tarball directory,
+      by default reproducibly so identical module contents give byte-identical tarballs
+    * compute the base64 sha256 digest of that tarball while it is written
 * edit the base64 digest into the module file
 
+Each stage's wall and CPU time, and its file and byte counts, mostly from the shared tree
+scan, are written to generator_metrics.json next to the module's source.json.  CPU time is
+process-wide, so it is left out when generators run concurrently.
+
 """
 import sys
 import os
@@ -25,6 +38,28 @@ import subprocess
 import tempfile
 import shutil
 import logging
+import concurrent.futures
+import hashlib
+import base64
+import fnmatch
+import re
+import contextlib
+import glob
+import stat
+import json
+import urllib.parse
+from suite_manifest import Manifest
+from hardlink_dedup import Deduplicator
+from elf_closure import DependencyClosure
+from elf_info import read_elf
+from include_closure import IncludeClosure
+from precompiled_headers import PrecompiledHeaders
+from import_engine import ImportEngine
+from stage_metrics import StageMetrics, instrumented, tree_size
+import build_writer
+import module_delta
+import tarball_index
+from tree_scan import TreeScan, host_elf_machine, target_elf_machine
 logging.basicConfig(level=logging.INFO)
 logger = logging
 
@@ -41,6 +76,19 @@ class Generator():
     TARBALL_DIR = f"{BZLMOD_DIR}/tarballs"
     # packaged modules go here
     MOD_DIR = f"{BZLMOD_DIR}/modules"
+    # supported compression backends and the tarball suffix Bazel uses to recognize each
+    COMPRESSION_SUFFIXES = {
+        "xz": "tar.xz",
+        "zstd": "tar.zst",
+        "gzip": "tar.gz",
+    }
+    # xz block size for reproducible tarballs, so the output doesn't depend on the thread count
+    XZ_BLOCK_SIZE = "24MiB"
+    # shared objects loaded by path rather than through DT_NEEDED, so never pruned by default
+    PRUNE_KEEP = ("libexec/gcc/*/*/liblto_plugin.so*",)
+    # delimit the bazel_dep entries of split components in the module's MODULE.bazel
+    COMPONENT_DEPS_BEGIN = "# component modules, maintained by scripts/compiler_suite_generator.py"
+    COMPONENT_DEPS_END = "# end of component modules"
 
     def __init__(self, module_name, mod_version, build_target):
         """
@@ -58,12 +106,308 @@ class Generator():
         # module metadata gets installed here so bzlmod can find and verify the tarball
         self.bzlmod_module_dir = f"{self.MOD_DIR}/{self.mod_name}/{self.mod_version}"
         self.digest = ""
+        # maximum number of concurrent worker processes, e.g. strip jobs
+        self.jobs = os.cpu_count() or 1
+        # an optional job_scheduler.JobScheduler sharing a core budget with other generators
+        self.scheduler = None
+        # tarball compression backend, level (None for the backend default) and zstd long mode
+        self.compression = "xz"
+        self.compression_level = None
+        self.compression_long = False
+        # sort tarball entries and normalize their metadata so identical inputs give identical tarballs
+        self.reproducible = True
+        # incremental runs reuse unchanged files recorded in the previous run's manifest
+        self.incremental = False
+        self.manifest_file = f"{self.TOP_DIR}/src/{self.mod_name}.manifest.json"
+        self.previous = Manifest.load(self.manifest_file)
+        # the directory files were imported from
+        self.import_dir = None
+        # relative path => (size, mtime_ns) of the source of each file the native engine imported
+        self.import_sources = {}
+        # hash of the settings and build_writer rules the BUILD file was written from
+        self.build_inputs = ""
+        # relative path => stripped state, and the stripped files carried over from the previous run
+        self.stripped = {}
+        self.reused = set()
+        # files removed by dependency pruning
+        self.pruned = set()
+        # hard links added after the import, destination => source relative path
+        self.added_links = {}
+        # whether the import changed anything in the module source directory
+        self.tree_changed = True
+        # (st_dev, st_ino) => (st_size, st_mtime_ns, content sha256) of files hashed by earlier
+        # stages of this run, valid while the file's size and modification time are unchanged
+        self.hashes = {}
+        # component name => path patterns of files published as the module <name>_<component>
+        self.components = {}
+        # extract debug information into the <module>_debug module before stripping
+        self.split_debug = False
+        # "native" imports with scripts/import_engine.py, "rsync" runs rsync
+        self.import_engine = "native"
+        # processed files shared with other suite versions, see set_blob_store
+        self.blob_store = None
+        # files hard linked to stripped blobs from the store in this run
+        self.from_store = set()
+        # stat, ELF and hash information about the module source directory, shared by the stages
+        self.tree = None
+        # strip every ELF binary found in the tree, except those matching strip_exclude patterns
+        self.strip_auto = False
+        self.strip_exclude = ""
+        # base URL of scripts/registry_server.py serving BZLMOD_DIR, used in source.json instead of file://
+        self.registry_url = None
+        # publish a delta from this earlier version of the module, see set_delta_base
+        self.delta_base = None
+        # per-stage timing and size records
+        self.metrics = StageMetrics(self.mod_src_dir, self._tree_size)
         result = subprocess.run(["mkdir", "-p", self.mod_src_dir],
                 check=True, capture_output=True, encoding="utf8")
         if result.returncode != 0:
             logger.error("unable to create module source directory: " + result.stderr)
             sys.exit()
 
+    @classmethod
+    def from_spec(cls, spec):
+        """
+        Create a generator configured from a suite_spec.SuiteSpec
+        """
+        generator = cls(spec.name, spec.version, spec.target)
+        generator.set_target_prefix(spec.target_strip_prefix)
+        generator.set_compression(spec.compression, spec.compression_level, spec.long_range)
+        generator.set_reproducible(spec.reproducible)
+        generator.set_components(spec.components)
+        generator.set_split_debug(spec.split_debug)
+        generator.set_delta_base(spec.delta_base)
+        generator.set_strip_auto(spec.strip_auto, spec.strip_exclude)
+        return generator
+
+    def generate(self, spec):
+        """
+        Run every stage of the pipeline for a suite_spec.SuiteSpec
+        """
+        self.clean_mod_src()
+        self.rsync_to_mod_src(spec.sysroot, spec.import_rules,
+                              self._file_list(spec.strip) + self._file_list(spec.strip_target))
+        self.update_module_version()
+        self.copy_bazel_files()
+        if spec.prune_roots:
+            self.prune_unreferenced(spec.prune_roots, spec.prune_remove)
+        if spec.header_corpus:
+            self.prune_headers(spec.header_corpus, spec.include_dirs, spec.tool_prefix,
+                               spec.header_flags, spec.header_prune_remove, spec.header_keep)
+        self.strip_all(spec.strip, spec.strip_target)
+        if spec.pch_headers and spec.pch_variants:
+            self.build_precompiled_headers(spec.pch_headers, spec.pch_variants, spec.include_dirs,
+                                           spec.tool_prefix)
+        self.remove_duplicates()
+        if spec.links:
+            self.link_files(spec.links)
+        self.write_build_file(spec.gcc_version, spec.tool_prefix)
+        self.make_tarball()
+
+    def update_module_version(self):
+        """
+        Make the version in the module source directory's MODULE.bazel match this generator's,
+        and its dependencies on split component modules match the configured components
+        """
+        module_file = f"{self.mod_src_dir}/MODULE.bazel"
+        with open(module_file, encoding="utf8") as mf:
+            text = mf.read()
+        updated = re.sub(r'(\bversion\s*=\s*)"[^"]*"', f'\\g<1>"{self.mod_version}"', text, count=1)
+        updated = re.sub(f"\n*{re.escape(self.COMPONENT_DEPS_BEGIN)}\n.*?{re.escape(self.COMPONENT_DEPS_END)}\n",
+                         "\n", updated, flags=re.DOTALL)
+        if self._published_components():
+            updated = updated.rstrip("\n") + f"\n\n{self.COMPONENT_DEPS_BEGIN}\n"
+            for component in self._published_components():
+                updated += (f'bazel_dep(name = "{self.component_module(component)}", ' +
+                            f'version = "{self.mod_version}")\n')
+            updated += f"{self.COMPONENT_DEPS_END}\n"
+        if updated != text:
+            with open(module_file, "w", encoding="utf8") as mf:
+                mf.write(updated)
+            logger.info(f"set the version in {module_file} to {self.mod_version}")
+
+    def set_components(self, components):
+        """
+        Publish the files matching each component's patterns as a separate module named
+        <module>_<component>, for instance {"sanitizers": "lib64/lib*san.so*"}.  Patterns are a
+        multiline string, matched as in scripts/build_writer.py.
+        """
+        self.components = {name: self._file_list(patterns) for name, patterns in components.items()}
+
+    def set_split_debug(self, enabled):
+        """
+        When enabled, the debug information of every stripped binary is first extracted into
+        <relative path>.debug, with a .build-id/xx/yyyy.debug link, in the <module>_debug module,
+        and the stripped binary gets a .gnu_debuglink section naming it.  Point gdb's
+        debug-file-directory at the extracted debug module to symbolize toolchain crashes.
+        """
+        self.split_debug = enabled
+
+    def set_import_engine(self, engine):
+        """
+        Import files with the native engine, hard linking or cloning them where possible,
+        or with rsync
+        """
+        if engine not in ("native", "rsync"):
+            raise ValueError(f"unknown import engine {engine}")
+        self.import_engine = engine
+
+    def set_blob_store(self, store):
+        """
+        Reuse stripped binaries across suite versions through a blob_store.BlobStore, normally
+        BlobStore(f"{Generator.BZLMOD_DIR}/blobs") shared by every generator, or stop using one with None
+        """
+        self.blob_store = store
+
+    def set_strip_auto(self, enabled, exclude=""):
+        """
+        Strip every ELF executable and shared object in the module, not just those in the strip
+        lists, choosing the host or target strip by ELF machine type.  exclude is a multiline
+        string of fnmatch patterns naming binaries to leave unstripped.
+        """
+        self.strip_auto = enabled
+        self.strip_exclude = exclude
+
+    def tree_scan(self):
+        """
+        The shared TreeScan of the module source directory, walking it on first use
+        """
+        if self.tree is None:
+            self.tree = TreeScan(self.mod_src_dir, self.jobs).scan()
+        return self.tree
+
+    def _tree_size(self):
+        """
+        The files and bytes of the module source directory from the tree scan, or None
+        before there is one, so stage metrics never walk the tree themselves
+        """
+        return self.tree.size() if self.tree is not None else None
+
+    def _tree_touched(self, paths, rewritten=False):
+        """
+        Tell the tree scan, if there is one yet, about paths a stage changed.  Files rewritten
+        in place keep their inode and may keep their size and modification time, so their
+        cached hashes are dropped.
+        """
+        paths = list(paths)
+        if rewritten:
+            for rel in paths:
+                try:
+                    st = os.lstat(f"{self.mod_src_dir}/{rel}")
+                except OSError:
+                    continue
+                self.hashes.pop((st.st_dev, st.st_ino), None)
+            if self.tree is not None:
+                self.tree.forget(paths)
+        if self.tree is not None:
+            self.tree.refresh(paths)
+
+    def _remember_hash(self, path, sha256):
+        """
+        Record the content hash of a file as of its current size and modification time
+        """
+        st = os.stat(path)
+        self.hashes[(st.st_dev, st.st_ino)] = (st.st_size, st.st_mtime_ns, sha256)
+
+    def _valid_hashes(self):
+        """
+        The hashes recorded by earlier stages that still match the tree scan's entries,
+        keyed by (st_dev, st_ino)
+        """
+        valid = {}
+        for st in self.tree_scan().entries.values():
+            key = (st.st_dev, st.st_ino)
+            if key in self.hashes and self.hashes[key][:2] == (st.st_size, st.st_mtime_ns):
+                valid[key] = self.hashes[key][2]
+        return valid
+
+    def set_registry_url(self, url):
+        """
+        Publish source.json URLs below the base URL of an HTTP server for the registry, such as
+        scripts/registry_server.py, rather than file:// URLs.  None restores file:// URLs.
+        """
+        self.registry_url = url.rstrip("/") if url else None
+
+    def tarball_url(self, tarball_name):
+        """
+        The URL clients download a tarball from
+        """
+        if self.registry_url:
+            return f"{self.registry_url}/{urllib.parse.quote(os.path.relpath(tarball_name, self.BZLMOD_DIR))}"
+        return "file://" + tarball_name
+
+    @classmethod
+    def add_registry_mirror(cls, url):
+        """
+        Add a mirror to the registry's bazel_registry.json.  Bazel tries mirrors before each
+        source URL, appending the URL's authority and path, which scripts/registry_server.py
+        also understands for file:// URLs.
+        """
+        config_file = f"{cls.BZLMOD_DIR}/bazel_registry.json"
+        config = {"mirrors": []}
+        if os.path.exists(config_file):
+            with open(config_file, encoding="utf8") as cf:
+                config = json.load(cf)
+        mirrors = config.setdefault("mirrors", [])
+        if url not in mirrors:
+            mirrors.append(url)
+            with open(config_file + ".tmp", "w", encoding="utf8") as cf:
+                json.dump(config, cf, indent=4)
+                cf.write("\n")
+            os.replace(config_file + ".tmp", config_file)
+            logger.info(f"added mirror {url} to {config_file}")
+
+    def set_delta_base(self, version):
+        """
+        Publish a delta from an earlier version of this module alongside the tarball, holding
+        only the files changed since, which scripts/module_delta.py turns back into this
+        version's tarball.  Deltas need reproducible tarballs; an empty version disables them.
+        """
+        self.delta_base = version or None
+
+    def _published_components(self):
+        """
+        The sorted names of the components published as separate modules, including debug
+        """
+        return sorted(list(self.components) + (["debug"] if self.split_debug else []))
+
+    def published_modules(self):
+        """
+        The names of every module a generation publishes: the suite and its split components
+        """
+        return [self.mod_name] + [self.component_module(c) for c in self._published_components()]
+
+    def component_module(self, component):
+        """
+        The name of the module holding a split component
+        """
+        return f"{self.mod_name}_{component}"
+
+    def component_files(self):
+        """
+        Map each component to the sorted relative paths of the files and symbolic links it
+        holds.  A file matching several components goes to the first.
+        """
+        regexes = {name: [build_writer.pattern_regex(p) for p in patterns]
+                   for name, patterns in self.components.items()}
+        split = {name: [] for name in self.components}
+        for rel in self._tree_files():
+            for name, patterns in regexes.items():
+                if any(r.match(rel) for r in patterns):
+                    split[name].append(rel)
+                    break
+        return split
+
+    def _tree_files(self):
+        """
+        The sorted relative paths of the files and symbolic links in the module source directory
+        """
+        files = []
+        for dirpath, dirnames, filenames in os.walk(self.mod_src_dir):
+            for name in filenames + [d for d in dirnames if os.path.islink(os.path.join(dirpath, d))]:
+                files.append(os.path.relpath(os.path.join(dirpath, name), self.mod_src_dir))
+        return sorted(files)
+
     def set_target_prefix(self, prefix):
         """
         The target prefix is the path prefix for common tools like gcc,
@@ -71,10 +415,134 @@ class Generator():
         """
         self.target_prefix = prefix
 
+    def set_jobs(self, jobs):
+        """
+        Limit the number of concurrent worker processes, defaulting to the number of cores
+        """
+        self.jobs = max(1, int(jobs))
+
+    def set_cpu_metrics(self, enabled):
+        """
+        Record the CPU time of each stage, which measures the whole process and so is only
+        meaningful when no other generator runs concurrently in it
+        """
+        self.metrics.process_cpu = enabled
+
+    def set_scheduler(self, scheduler):
+        """
+        Reserve cores from a job_scheduler.JobScheduler shared with concurrently running generators
+        """
+        self.scheduler = scheduler
+
+    def _cores(self, wanted, minimum=None):
+        """
+        A context manager reserving up to wanted cores from the scheduler, if there is one,
+        and yielding the number reserved
+        """
+        if self.scheduler is None:
+            return contextlib.nullcontext(wanted)
+        return self.scheduler.reserve(wanted, minimum)
+
+    def set_incremental(self, incremental=True):
+        """
+        Keep previously imported files, skipping work for anything unchanged since the last run
+        """
+        self.incremental = incremental
+
+    def set_compression(self, backend, level=None, long_range=False):
+        """
+        Select the tarball compression backend - "xz", "zstd", or "gzip" - and optionally its
+        compression level.  long_range enables zstd long distance matching, which helps with the
+        many near-duplicate binaries in a compiler suite.  All backends use up to self.jobs
+        threads where the compressor supports it.
+        """
+        if backend not in self.COMPRESSION_SUFFIXES:
+            logger.error(f"unknown compression backend {backend}, expected one of " +
+                         ", ".join(self.COMPRESSION_SUFFIXES))
+            sys.exit()
+        if long_range and backend != "zstd":
+            logger.warning(f"long range mode is only supported by zstd, ignoring it for {backend}")
+            long_range = False
+        self.compression = backend
+        self.compression_level = level
+        self.compression_long = long_range
+
+    def set_reproducible(self, reproducible=True):
+        """
+        Generate tarballs with sorted entries, a fixed modification time (SOURCE_DATE_EPOCH
+        or the epoch), root ownership, and normalized permissions, so the same module contents
+        always give the same tarball and integrity digest.  Hard links are kept as hard links.
+        """
+        self.reproducible = reproducible
+
+    def tarball_name(self, module=None):
+        """
+        The full path of the tarball for this module version and compression backend, or
+        for the named component module
+        """
+        suffix = self.COMPRESSION_SUFFIXES[self.compression]
+        return f"{self.TARBALL_DIR}/{module or self.mod_name}-{self.mod_version}.{suffix}"
+
+    @staticmethod
+    def integrity(sha256):
+        """
+        Format a hashlib sha256 object as the Subresource Integrity string Bazel expects in source.json
+        """
+        return "sha256-" + base64.b64encode(sha256.digest()).decode("ascii")
+
+    def _compressor_command(self, threads):
+        """
+        The command line compressing a tar stream from stdin to stdout with the given number of threads
+        """
+        level = [] if self.compression_level is None else [f"-{self.compression_level}"]
+        if self.compression == "xz":
+            if self.reproducible:
+                # single and multithreaded xz output differ, so always use multithreaded mode
+                # ("+N" even for one thread) with a fixed block size
+                return (["xz", f"-T+{threads}"] + level +
+                        [f"--block-size={self.XZ_BLOCK_SIZE}", "-c"])
+            return ["xz", f"-T{threads}"] + level + ["-c"]
+        if self.compression == "zstd":
+            if self.compression_level is not None and self.compression_level > 19:
+                level = ["--ultra"] + level
+            # a 128 MiB window is the largest zstd decoders accept without extra options
+            long_range = ["--long=27"] if self.compression_long else []
+            return ["zstd", f"-T{threads}", "-q"] + level + long_range + ["-c"]
+        # don't record the (nonexistent) input file name and time in the gzip header
+        no_name = ["-n"] if self.reproducible else []
+        # pigz is a parallel drop-in replacement for gzip
+        if shutil.which("pigz"):
+            return ["pigz", "-p", str(threads)] + level + no_name + ["-c"]
+        return ["gzip"] + level + no_name + ["-c"]
+
+    def _tar_command(self, root=None, exclude_file=None):
+        """
+        The command line writing the module source directory, or root, to stdout as an
+        uncompressed tar stream.  exclude_file lists ./relative paths to leave out.
+        """
+        command = ["tar", "cf", "-", "-C", root or self.mod_src_dir] + self._tar_options()
+        if exclude_file:
+            command += ["--anchored", "--no-wildcards", f"--exclude-from={exclude_file}"]
+        return command + ["."]
+
+    def _tar_options(self):
+        """
+        The tar options normalizing entry order and metadata in reproducible mode
+        """
+        if not self.reproducible:
+            return []
+        mtime = int(os.environ.get("SOURCE_DATE_EPOCH", "0"))
+        return ["--format=gnu", "--sort=name", f"--mtime=@{mtime}",
+                "--owner=0", "--group=0", "--numeric-owner", "--mode=u=rwX,go=rX"]
+
+    @instrumented("clean", walk=True)
     def clean_mod_src(self):
         """
         Remove all previously imported binary and bazel files
         """
+        if self.incremental:
+            logger.info("incremental run, keeping previously imported files in " + self.mod_src_dir)
+            return
         for sub in ("bin", "lib", "include", "usr", "lib64", "libexec", self.build_target):
             target_dir = f"{self.mod_src_dir}/{sub}"
             logger.info("Cleaning " + target_dir)
@@ -91,24 +559,283 @@ class Generator():
                 logger.error("removal of existing file failed: " + result.stderr)
                 sys.exit()
 
-    def rsync_to_mod_src(self, src_dir, rsync_data):
+    @instrumented("import", walk=True)
+    def rsync_to_mod_src(self, src_dir, rsync_data, modified=()):
         """
         Add selected files to the module
         rsync -ravH --include-from=file src_dir/ mod_src_dir/
+        Incremental runs also delete files no longer selected, while leaving alone the
+        Bazel files, added links, and stripped files whose source has not changed.
+        The native import engine evaluates the same filter rules without rsync, hard linking
+        files not in modified, the relative paths later stripped in place.
         """
+        self.import_dir = src_dir
+        self.tree = None
+        options = ["-ravH", "--itemize-changes"]
+        if self.incremental:
+            reusable = self._reusable_stripped(src_dir)
+            protected = ["BUILD", "MODULE.bazel", ".gitignore"] + sorted(self.previous.added_links)
+            # precompiled headers are compiled after the import, and again whenever it changes something
+            protected += sorted(rel for rel in self.previous.files if ".gch/" in rel or rel.endswith(".gch"))
+            # P protects a file from deletion, H hides it from the transfer
+            rsync_data = ("".join(f"P /{f}\n" for f in protected) +
+                          "".join(f"P /{f}\nH /{f}\n" for f in sorted(reusable)) +
+                          rsync_data)
+            options += ["--delete-excluded"]
+            logger.info(f"reusing {len(reusable)} previously stripped files")
+        if self.import_engine == "native":
+            with self._cores(self.jobs, 1) as threads:
+                engine = ImportEngine(src_dir, self.mod_src_dir, rsync_data, threads,
+                                      delete=self.incremental, modified=modified,
+                                      previous=self._previous_imports() if self.incremental else None)
+                changes = engine.run()
+            self.import_sources = engine.sources
+            if self.incremental:
+                self.tree_changed = bool(changes)
+            self.metrics.note(files=len(changes), linked=engine.linked, cloned=engine.cloned,
+                              copied=engine.copied)
+            logger.info("selectively imported " + src_dir + " into " + self.mod_src_dir)
+            # every later stage shares this scan, which also gives the import's size afterwards
+            self.tree_scan()
+            return
         with tempfile.NamedTemporaryFile(mode="w", encoding="utf8", delete_on_close=False) as fp:
             fp.write(rsync_data)
             fp.close()
             logger.info("tempfile name = " + fp.name)
-            result = subprocess.run(["rsync", "-ravH", "--include-from=" + fp.name,
-                                     f"{src_dir}/",
-                                     f"{self.mod_src_dir}/"],
-                    check=True, capture_output=True, encoding="utf8")
+            with self._cores(1):
+                result = subprocess.run(["rsync"] + options + ["--include-from=" + fp.name,
+                                         f"{src_dir}/",
+                                         f"{self.mod_src_dir}/"],
+                        check=True, capture_output=True, encoding="utf8")
             print(result.stdout)
             if result.returncode != 0:
                 logger.error("rsync import failed: " + result.stderr)
                 sys.exit()
+            # itemized lines starting with '.' only report unchanged content
+            changes = [line for line in result.stdout.splitlines()
+                       if line.startswith(("*deleting", ">f", "cL", "hf", "cd"))]
+            if self.incremental:
+                self.tree_changed = bool(changes)
+            self.metrics.note(files=len(changes))
             logger.info("selectively imported " + src_dir + " into " + self.mod_src_dir)
+        self.tree_scan()
+
+    def _reusable_stripped(self, src_dir):
+        """
+        Find the files stripped in the previous run whose source and stripped copies are both unchanged
+        """
+        reusable = set()
+        for rel, entry in self.previous.files.items():
+            state = entry["stripped"]
+            # rsync filter rules can't name paths containing wildcards
+            if not state or any(c in rel for c in "*?[\\"):
+                continue
+            try:
+                src = os.stat(f"{src_dir}/{rel}")
+                dst = os.stat(f"{self.mod_src_dir}/{rel}")
+            except OSError:
+                continue
+            if ((src.st_size, src.st_mtime_ns) == (state["source_size"], state["source_mtime_ns"]) and
+                    (dst.st_size, dst.st_mtime_ns) == (entry["size"], entry["mtime_ns"])):
+                reusable.add(rel)
+                self.stripped[rel] = state
+        self.reused = reusable
+        return reusable
+
+    def _unchanged(self, stage):
+        """
+        Whether an incremental run imported no changes, so a stage depending only on the
+        imported files can leave the previous run's results in place
+        """
+        if self.incremental and not self.tree_changed:
+            logger.info(f"no imported files changed, skipping {stage}")
+            return True
+        return False
+
+    def _previous_imports(self):
+        """
+        The (source size, source mtime_ns, size, mtime_ns) of every file the previous run
+        imported natively, as its manifest recorded them after the last stage
+        """
+        return {rel: (*entry["source"], entry["size"], entry["mtime_ns"])
+                for rel, entry in self.previous.files.items() if entry.get("source")}
+
+    def link_files(self, links):
+        """
+        Add hard links within the module, for instance to put binutils tools on gcc's search path.
+        links is a sequence of (existing file, new link) paths relative to the module source directory.
+        """
+        for src, dst in links:
+            src_path = f"{self.mod_src_dir}/{src}"
+            dst_path = f"{self.mod_src_dir}/{dst}"
+            if os.path.lexists(dst_path):
+                if os.path.samefile(src_path, dst_path):
+                    self.added_links[dst] = src
+                    continue
+                os.remove(dst_path)
+                self.tree_changed = True
+            os.link(src_path, dst_path)
+            self._tree_touched([dst])
+            self.tree_changed = True
+            self.added_links[dst] = src
+            logger.info(f"added a hard link {src} => {dst}")
+
+    @instrumented("prune")
+    def prune_unreferenced(self, roots, remove=False, keep=PRUNE_KEEP):
+        """
+        Report, or with remove=True delete, shared objects outside the ELF dependency closure
+        of the roots.  roots is a multiline string of fnmatch patterns selecting the toolchain
+        entry binaries and target runtime libraries, relative to the module source directory.
+        Files matching a keep pattern are never pruned.
+        """
+        if self._unchanged("dependency pruning"):
+            return []
+        closure = DependencyClosure(self.mod_src_dir, self.import_dir, self.tree_scan())
+        patterns = self._file_list(roots)
+        closure.close(rel for rel in sorted(list(closure.elf) + list(closure.symlinks))
+                      if any(fnmatch.fnmatch(rel, pattern) for pattern in patterns))
+        for needed, users in sorted(closure.unresolved.items()):
+            logger.info(f"{needed}, needed by {', '.join(sorted(users))}, is not part of the module")
+        unused = closure.unreferenced(keep)
+        total = 0
+        for rel in unused:
+            path = f"{self.mod_src_dir}/{rel}"
+            if not os.path.islink(path):
+                total += os.path.getsize(path)
+            if remove:
+                os.remove(path)
+                self.pruned.add(rel)
+                self._tree_touched([rel])
+                self.tree_changed = True
+            logger.info(("pruned " if remove else "unreferenced ") + rel)
+        self.metrics.note(files=len(unused), prunable_bytes=total, bytes_saved=total if remove else 0)
+        logger.info(f"{len(unused)} files totalling {total} bytes are outside the dependency " +
+                    f"closure of {len(closure.reached)} of the module's {len(closure.elf)} ELF files")
+        return unused
+
+    @instrumented("headers")
+    def prune_headers(self, corpus, include_dirs, tool_prefix="", flags=(), remove=False, keep=""):
+        """
+        Report, or with remove=True delete, headers outside the include closure of a corpus.
+        corpus lists source files or glob patterns, and header names like <vector>.
+        include_dirs is a multiline string of the module's include directories in search order,
+        and keep a multiline string of fnmatch patterns of headers never excluded.
+        The exclusions are also written as rsync filter rules to src/<module>.header_exclusions,
+        ready to be placed ahead of the include rules of the suite's import setting.
+        """
+        if self._unchanged("header pruning"):
+            return []
+        entries = []
+        for entry in corpus:
+            matches = [entry] if entry.startswith("<") else sorted(glob.glob(entry, recursive=True))
+            if not matches:
+                logger.warning(f"header corpus entry {entry} matches no files")
+            entries += matches
+        closure = IncludeClosure(self.mod_src_dir, self._file_list(include_dirs), tool_prefix, flags)
+        with self._cores(self.jobs, 1) as jobs:
+            closure.scan(entries, jobs)
+        for entry, error in sorted(closure.failed.items()):
+            logger.warning(f"unable to preprocess {entry}: {error}")
+        if not entries or (closure.failed and not closure.reached):
+            logger.error("no header corpus entry could be preprocessed, keeping every header")
+            return []
+        if closure.failed and remove:
+            # a failed entry leaves the closure incomplete, so removal could break its users
+            logger.error("the include closure is incomplete, reporting rather than removing headers")
+            remove = False
+        unused = closure.unreachable(self._file_list(keep))
+        total = 0
+        for rel in unused:
+            path = f"{self.mod_src_dir}/{rel}"
+            if not os.path.islink(path):
+                total += os.path.getsize(path)
+            if remove:
+                os.remove(path)
+                self.pruned.add(rel)
+                self._tree_touched([rel])
+                self.tree_changed = True
+        with open(f"{self.TOP_DIR}/src/{self.mod_name}.header_exclusions", "w", encoding="utf8") as ef:
+            ef.write(f"# headers of {self.mod_name} {self.mod_version} unreachable from " +
+                     f"{len(entries)} corpus sources\n")
+            ef.writelines(f"- /{rel}\n" for rel in unused)
+        self.metrics.note(files=len(unused), prunable_bytes=total, bytes_saved=total if remove else 0,
+                          corpus=len(entries), reached=len(closure.reached))
+        logger.info(f"{len(unused)} headers totalling {total} bytes are " +
+                    ("removed, being " if remove else "") +
+                    f"outside the include closure of {len(entries)} corpus sources, " +
+                    f"which reach {len(closure.reached)} headers")
+        return unused
+
+    @instrumented("pch")
+    def build_precompiled_headers(self, headers, variants, include_dirs, tool_prefix=""):
+        """
+        Compile headers such as bits/stdc++.h with the module's own g++ into one precompiled
+        header per (name, flags) variant, <header>.gch/<name>.gch next to the header.
+        headers and include_dirs are multiline strings, the include directories in the
+        search order of the toolchain's -isystem options.  write_build_file lists the
+        variants in the pch_files filegroup rather than with the headers.  With a blob
+        store, variants already compiled from the same compiler and headers are reused.
+        """
+        if self._unchanged("precompiled headers"):
+            return []
+        pch = PrecompiledHeaders(self.mod_src_dir, self._file_list(include_dirs), tool_prefix)
+        with self._cores(self.jobs, 1) as jobs:
+            written = pch.build(self._file_list(headers), variants, jobs, self.blob_store)
+        for (header, name), error in sorted(pch.failed.items()):
+            logger.warning(f"unable to precompile {header} for the {name} variant: {error}")
+        self._tree_touched(written)
+        self.tree_changed = True
+        total = sum(os.path.getsize(f"{self.mod_src_dir}/{rel}") for rel in written)
+        self.metrics.note(files=len(written), reused=len(pch.reused), failed=len(pch.failed),
+                          pch_bytes=total)
+        logger.info(f"wrote {len(written)} precompiled headers totalling {total} bytes, " +
+                    f"{len(pch.reused)} of them from the blob store")
+        return written
+
+    @instrumented("build_file")
+    def write_build_file(self, gcc_version, tool_prefix):
+        """
+        Replace the module's BUILD file with one listing exactly the imported files used by
+        each class of Bazel action, so actions stage as few sandbox inputs as possible
+        """
+        self.build_inputs = self._build_inputs(gcc_version, tool_prefix)
+        if (self.build_inputs == self.previous.build_inputs and os.path.exists(f"{self.mod_src_dir}/BUILD") and
+                self._unchanged("writing the BUILD file")):
+            return
+        # the module's own BUILD and MODULE.bazel are not imported, and BUILD only exists after the first run
+        files = [f for f in self._tree_files() if f not in build_writer.MODULE_FILES]
+        split = set()
+        for component_files in self.component_files().values():
+            split.update(component_files)
+        variables = {"target": self.build_target, "gcc_version": gcc_version, "tool_prefix": tool_prefix}
+        kept = [f for f in files if f not in split]
+        groups, unused = build_writer.classify(kept, variables)
+        legacy, _ = build_writer.classify(kept, variables, build_writer.LEGACY_FILEGROUPS)
+        aliases = {f"{component}_files": f"@{self.component_module(component)}//:files"
+                   for component in self._published_components()}
+        header = (f"Generated by scripts/compiler_suite_generator.py for {self.mod_name} " +
+                  f"{self.mod_version}\nfrom the {len(files)} files imported into the module.  " +
+                  "Edit suites/*.toml or scripts/build_writer.py rather than this file.")
+        with open(f"{self.mod_src_dir}/BUILD", "w", encoding="utf8") as bf:
+            bf.write(build_writer.render(groups, unused, header, aliases=aliases, legacy=legacy))
+        self._tree_touched(["BUILD"], rewritten=True)
+        for name, members in groups.items():
+            logger.info(f"filegroup {name} lists {len(members)} files")
+        if unused:
+            logger.info(f"{len(unused)} imported files are not used by any filegroup")
+        self.metrics.note(files=len(files))
+
+    def _build_inputs(self, gcc_version, tool_prefix):
+        """
+        Hash everything the BUILD file depends on besides the imported files
+        """
+        sha256 = hashlib.sha256()
+        with open(build_writer.__file__, "rb") as bf:
+            sha256.update(bf.read())
+        settings = [self.mod_name, self.mod_version, self.build_target, gcc_version, tool_prefix,
+                    sorted(self.components.items()), self._published_components()]
+        sha256.update(json.dumps(settings).encode("utf8"))
+        return sha256.hexdigest()
 
     def copy_bazel_files(self):
         """
@@ -123,93 +850,567 @@ class Generator():
               f"{self.mod_src_dir} to {self.bzlmod_module_dir}")
         shutil.copy(module_file, f"{self.bzlmod_module_dir}/MODULE.bazel")
 
+    @instrumented("dedup")
     def remove_duplicates(self):
         """
         Find duplicates and replace with hard links
         """
-        result = subprocess.run(["rdfind",
-                                 "-makehardlinks",
-                                 "true",
-                                 "-makeresultsfile",
-                                 "false",
-                                 self.mod_src_dir],
-                    check=True, capture_output=True, encoding="utf8")
-        if result.returncode != 0:
-            logger.error("duplicate removal failed: " + result.stderr)
-            sys.exit()
-        logger.info("removed duplicates from " + self.mod_src_dir)
+        if self._unchanged("duplicate removal"):
+            return
+        tree = self.tree_scan()
+        with self._cores(self.jobs, 1) as threads:
+            dedup = Deduplicator(self.mod_src_dir, threads, self._known_hashes(), tree.inodes())
+            saved = dedup.run()
+        tree.refresh(os.path.relpath(path, self.mod_src_dir) for path in dedup.relinked)
+        tree.add_hashes(dedup.hashes)
+        self.metrics.note(files=dedup.links, bytes_saved=saved)
+        logger.info(f"removed duplicates from {self.mod_src_dir}, replacing {dedup.links} files " +
+                    f"with hard links and saving {saved} bytes")
+
+    def _known_hashes(self):
+        """
+        Content hashes of files recorded in the previous manifest and unchanged since,
+        keyed by inode
+        """
+        tree = self.tree_scan()
+        known = {**self._valid_hashes(), **tree.known_hashes()}
+        for rel, entry in self.previous.files.items():
+            st = tree.entries.get(rel)
+            if st is None or not stat.S_ISREG(st.st_mode):
+                continue
+            if (st.st_size, st.st_mtime_ns) == (entry["size"], entry["mtime_ns"]):
+                known.setdefault((st.st_dev, st.st_ino), entry["sha256"])
+        return known
 
     def strip_binaries(self, strip_data):
         """
         Strip all host binaries for minimal size, using the host computer"s strip
         """
-        for file in strip_data.splitlines():
-            if not file or not file.strip():
-                continue
-            result = subprocess.run(["strip", f"{self.mod_src_dir}/{file}"],
-                    check=False, capture_output=True, encoding="utf8")
-            if result.returncode != 0:
-                logger.error("host binary stripping failed: " + result.stderr)
-                sys.exit()
-            logger.info("stripped binary " + file)
+        self.strip_all(strip_data, "")
 
     def strip_target_binaries(self, strip_data):
         """
         Strip all target binaries for minimal size, using the target"s strip
         """
-        for file in strip_data.splitlines():
-            if not file or not file.strip():
-                continue
-            result = subprocess.run([self.target_prefix +"strip", f"{self.mod_src_dir}/{file}"],
-                    check=False, capture_output=True, encoding="utf8")
-            if result.returncode != 0:
-                logger.error("target binary stripping failed: " + result.stderr)
-                sys.exit()
-            logger.info("stripped binary " + file)
+        self.strip_all("", strip_data)
 
-    def make_tarball(self):
+    @instrumented("strip")
+    def strip_all(self, strip_data, target_strip_data):
         """
-        Create the tarball and update the base64 checksum in the associated source.json file
+        Strip host and target binaries together, spreading the strip jobs over self.jobs workers.
+        Every failure is logged before exiting.
         """
-        tarball_name = f"{self.TARBALL_DIR}/{self.mod_name}-{self.mod_version}.tar.xz"
-        if os.path.exists(tarball_name):
-            logger.info("Removing previous tarball")
-            os.remove(tarball_name)
-        logger.info("Generating tarball - this will take a while")
-        result = subprocess.run(f"cd {self.mod_src_dir} && " +
-                                f"tar cJf {self.TARBALL_DIR}/{self.mod_name}-{self.mod_version}.tar.xz .",
-                    shell=True, check=True, capture_output=True, encoding="utf8")
-        if result.returncode != 0:
-            logger.error("tarball generation failed: " + result.stderr)
+        if self._unchanged("stripping"):
+            # every stripped file was kept, so carry its stripped state over
+            self.stripped.update({rel: entry["stripped"] for rel, entry in self.previous.files.items()
+                                  if entry["stripped"]})
+            return
+        tree = self.tree_scan()
+        kinds = self._route_strip(tree, self._file_list(strip_data), self._file_list(target_strip_data))
+        tools = {"host": "strip", "target": self.target_prefix + "strip"}
+        requests = [(kind, tools[kind], file) for file, kind in kinds.items()]
+        if self.reused:
+            logger.info(f"skipping {len(self.reused)} files already stripped in the previous run")
+        requests = [request for request in requests
+                    if request[2] not in self.reused and request[2] not in self.pruned]
+        debug_root = f"{self.TOP_DIR}/src/{self.component_module('debug')}"
+        if self.split_debug and not self.incremental:
+            shutil.rmtree(debug_root, ignore_errors=True)
+        shared = self._shared_outside(tree)
+        # hard linked paths share an inode, so strip them serially within a single job
+        jobs = {}
+        for kind, tool, file in requests:
+            st = tree.entries.get(file)
+            if st is not None:
+                key, size = (st.st_dev, st.st_ino), st.st_size
+            else:
+                # let strip report the missing file
+                key, size = file, 0
+            jobs.setdefault(key, (size, [], shared.get(key, [])))[1].append((kind, tool, file))
+        # strip may rewrite a file in place, so refresh every path sharing a stripped inode
+        touched = [rel for rel, st in tree.entries.items() if (st.st_dev, st.st_ino) in jobs]
+        # start with the largest files, like cc1plus, so they don't trail the pool
+        ordered = sorted(jobs.values(), key=lambda job: job[0], reverse=True)
+        failures = 0
+        stripped = 0
+        saved = 0
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.jobs) as pool:
+            futures = {pool.submit(self._strip_group, group, detach): size for size, group, detach in ordered}
+            for future in concurrent.futures.as_completed(futures):
+                done = []
+                for kind, file, result in future.result():
+                    if result.returncode != 0:
+                        logger.error(f"{kind} binary stripping failed for {file}: " + result.stderr)
+                        failures += 1
+                    else:
+                        self._record_stripped(kind, file)
+                        stripped += 1
+                        done.append(file)
+                        logger.info("stripped binary " + file)
+                # the paths of a group shared one inode of the recorded size, so count its savings once
+                if done:
+                    saved += futures[future] - os.path.getsize(f"{self.mod_src_dir}/{done[0]}")
+        tree.refresh(touched)
+        if self.blob_store:
+            self.blob_store.save()
+            self.metrics.note(store_hits=len(self.from_store))
+        if self.split_debug:
+            self._remove_stale_debug(debug_root)
+            self.metrics.note(debug_bytes=tree_size(debug_root)[1])
+        self.metrics.note(files=stripped, bytes_saved=saved)
+        if failures:
+            logger.error(f"{failures} of {len(requests)} binaries could not be stripped")
             sys.exit()
-        logger.info("generated tarball " + tarball_name)
-        # we need a sha256-base64 hash for the signature, so use openssl once to hash and again to encode the
-        # hash
-        result = subprocess.run(f"openssl dgst -binary -sha256 < {tarball_name} |" +
-                                " openssl base64 -A",
-                    shell=True, check=True, capture_output=True, encoding="utf8")
-        if result.returncode != 0:
-            logger.error("digest generation failed: " + result.stderr)
-            sys.exit()
-        logger.info("generated sha256 digest " + result.stdout)
-        digest = result.stdout.strip()
 
+    def _route_strip(self, tree, host_files, target_files):
+        """
+        Choose the strip for every file to strip, returning relative path => "host" or "target".
+        Listed binaries built for the other machine are moved to its strip, and with strip_auto
+        every ELF binary the lists miss is added.
+        """
+        kinds = {file: "host" for file in host_files}
+        kinds.update({file: "target" for file in target_files})
+        machines = {"host": host_elf_machine(), "target": target_elf_machine(self.build_target)}
+        for file, kind in kinds.items():
+            info = tree.elf(file)
+            other = "target" if kind == "host" else "host"
+            if info and info.machine != machines[kind] and info.machine == machines[other]:
+                logger.warning(f"{file} is a {info.machine_name} binary, stripping it with the {other} strip")
+                kinds[file] = other
+        host, target = tree.classify(machines["target"], self._file_list(self.strip_exclude))
+        missed = [file for file in host + target if file not in kinds]
+        if self.strip_auto:
+            kinds.update({file: "host" for file in host if file in missed})
+            kinds.update({file: "target" for file in target if file in missed})
+            self.metrics.note(auto_files=len(missed))
+            logger.info(f"stripping {len(missed)} ELF binaries missing from the strip lists")
+        elif missed:
+            logger.info(f"{len(missed)} ELF binaries are not in the strip lists, for instance " +
+                        ", ".join(missed[:5]))
+        return kinds
+
+    def _shared_outside(self, tree):
+        """
+        Map the inodes of files also hard linked from outside the module, for instance by the
+        native import engine, to their paths within the module
+        """
+        groups = {}
+        for rel, st in tree.entries.items():
+            if stat.S_ISREG(st.st_mode) and st.st_nlink > 1:
+                groups.setdefault((st.st_dev, st.st_ino), []).append(rel)
+        return {key: paths for key, paths in groups.items()
+                if tree.entries[paths[0]].st_nlink > len(paths)}
+
+    def _detach(self, paths):
+        """
+        Give paths hard linked from outside the module their own copy, so stripping it in
+        place can't change the installation it was imported from.  The paths keep sharing
+        the copy.
+        """
+        first = f"{self.mod_src_dir}/{paths[0]}"
+        shutil.copy2(first, first + ".detach")
+        os.replace(first + ".detach", first)
+        for rel in paths[1:]:
+            os.link(first, f"{self.mod_src_dir}/{rel}.detach")
+            os.replace(f"{self.mod_src_dir}/{rel}.detach", f"{self.mod_src_dir}/{rel}")
+
+    def _strip_group(self, group, detach=()):
+        """
+        Strip a group of paths sharing the same inode, one after the other.  With split_debug
+        the debug information is extracted before the first strip, and linked after the last.
+        With a blob store, a group whose source was stripped before, by this or another suite
+        version, is hard linked to the stored result instead.  detach lists every path of the
+        inode, when it is also linked from outside the module.
+        """
+        first_kind, first_tool, first = group[0]
+        operation = key = None
+        if self.blob_store and os.path.isfile(f"{self.mod_src_dir}/{first}"):
+            operation = self._strip_operation(first_kind, first_tool, first)
+            key = self.blob_store.source_key(f"{self.mod_src_dir}/{first}",
+                                             f"{self.import_dir}/{first}" if self.import_dir else None)
+            if self._fetch_stripped(operation, key, group):
+                return [(kind, file, subprocess.CompletedProcess([tool, file], 0, "", ""))
+                        for kind, tool, file in group]
+        if detach:
+            self._detach(detach)
+        results = []
+        debug_file = None
+        build_id = None
+        for kind, tool, file in group:
+            # objcopy sits next to the strip of the same binutils
+            objcopy = tool[:-len("strip")] + "objcopy"
+            with self._cores(1):
+                if self.split_debug and not results:
+                    debug_file, build_id, result = self._extract_debug(objcopy, file)
+                    if result is not None and result.returncode != 0:
+                        results.append((kind, file, result))
+                        return results
+                result = subprocess.run([tool, f"{self.mod_src_dir}/{file}"],
+                        check=False, capture_output=True, encoding="utf8")
+                if result.returncode == 0 and debug_file and file == group[-1][2]:
+                    result = subprocess.run([objcopy, f"--add-gnu-debuglink={debug_file}",
+                                             f"{self.mod_src_dir}/{file}"],
+                                            check=False, capture_output=True, encoding="utf8")
+            results.append((kind, file, result))
+        if operation and all(result.returncode == 0 for _, _, result in results):
+            if debug_file:
+                self.blob_store.put(operation, key + ".debug", debug_file)
+            metadata = self.blob_store.put(operation, key, f"{self.mod_src_dir}/{first}",
+                                           debug=debug_file is not None, build_id=build_id)
+            self._remember_hash(f"{self.mod_src_dir}/{first}", metadata["sha256"])
+        return results
+
+    def _strip_operation(self, kind, tool, file):
+        """
+        The blob store operation stripping a file with a tool.  A .gnu_debuglink names the
+        debug file, so with split_debug the operation depends on the file name too.
+        """
+        if self.split_debug:
+            return self.blob_store.operation(f"strip-{kind}-debuglink", tool, os.path.basename(file))
+        return self.blob_store.operation(f"strip-{kind}", tool)
+
+    def _fetch_stripped(self, operation, key, group):
+        """
+        Hard link the stored stripped blob, and its debug file, to every path of a group,
+        returning False if the store doesn't hold them
+        """
+        metadata = self.blob_store.lookup(operation, key)
+        if metadata is None:
+            return False
+        first = group[0][2]
+        if metadata["debug"]:
+            debug_file = f"{self.TOP_DIR}/src/{self.component_module('debug')}/{first}.debug"
+            os.makedirs(os.path.dirname(debug_file), exist_ok=True)
+            self.blob_store.link(operation, key + ".debug", [debug_file])
+        self.blob_store.link(operation, key, [f"{self.mod_src_dir}/{file}" for _, _, file in group])
+        if metadata["debug"] and metadata["build_id"]:
+            self._link_build_id(debug_file, metadata["build_id"])
+        self._remember_hash(f"{self.mod_src_dir}/{first}", metadata["sha256"])
+        self.from_store.update(file for _, _, file in group)
+        logger.info(f"reused the stored stripped copy of {first}")
+        return True
+
+    def _extract_debug(self, objcopy, file):
+        """
+        Copy the debug information of a binary into the debug module, returning the debug file
+        path, the build-id and the objcopy result, or (None, None, None) when the binary carries
+        no debug information
+        """
+        info = read_elf(f"{self.mod_src_dir}/{file}")
+        if info is None or not info.has_debug_info:
+            return None, None, None
+        debug_root = f"{self.TOP_DIR}/src/{self.component_module('debug')}"
+        debug_file = f"{debug_root}/{file}.debug"
+        os.makedirs(os.path.dirname(debug_file), exist_ok=True)
+        result = subprocess.run([objcopy, "--only-keep-debug", f"{self.mod_src_dir}/{file}", debug_file],
+                                check=False, capture_output=True, encoding="utf8")
+        if result.returncode == 0 and info.build_id:
+            self._link_build_id(debug_file, info.build_id)
+        return debug_file, info.build_id, result
+
+    def _link_build_id(self, debug_file, build_id):
+        """
+        Link .build-id/xx/yyyy.debug to a debug file, the layout gdb searches under its
+        debug-file-directory
+        """
+        debug_root = f"{self.TOP_DIR}/src/{self.component_module('debug')}"
+        link = f"{debug_root}/.build-id/{build_id[:2]}/{build_id[2:]}.debug"
+        os.makedirs(os.path.dirname(link), exist_ok=True)
+        if os.path.lexists(link):
+            os.remove(link)
+        os.symlink(os.path.relpath(debug_file, os.path.dirname(link)), link)
+
+    def _remove_stale_debug(self, debug_root):
+        """
+        Remove debug files whose binary is no longer in the module, and dangling build-id links
+        """
+        for links in (False, True):
+            for dirpath, _, filenames in os.walk(debug_root):
+                for name in filenames:
+                    path = os.path.join(dirpath, name)
+                    rel = os.path.relpath(path, debug_root)
+                    if rel.startswith(".build-id/") != links:
+                        continue
+                    if links and not os.path.exists(path):
+                        os.remove(path)
+                    elif (not links and rel.endswith(".debug") and
+                          not os.path.exists(f"{self.mod_src_dir}/{rel[:-len('.debug')]}")):
+                        os.remove(path)
+
+    def _record_stripped(self, kind, file):
+        """
+        Remember that a file was stripped, along with the state of the source it was imported from
+        """
+        state = {"kind": kind, "source_size": None, "source_mtime_ns": None}
+        if self.import_dir:
+            try:
+                st = os.stat(f"{self.import_dir}/{file}")
+                state["source_size"], state["source_mtime_ns"] = st.st_size, st.st_mtime_ns
+            except OSError:
+                pass
+        self.stripped[file] = state
+
+    @staticmethod
+    def _file_list(file_data):
+        """
+        Convert a multiline string of relative paths into a list, skipping blank lines
+        """
+        return [file.strip() for file in file_data.splitlines() if file.strip()]
+
+    def make_tarball(self):
+        """
+        Create the tarball and update the base64 checksum in the associated source.json file,
+        then write the metrics report of all stages
+        """
+        with self.metrics.stage("tarball"):
+            self._make_tarball()
+        self.write_metrics()
+
+    def write_metrics(self):
+        """
+        Write the stage metrics next to the module's source.json
+        """
+        report = f"{self.bzlmod_module_dir}/generator_metrics.json"
+        pathlib.Path(self.bzlmod_module_dir).mkdir(parents=True, exist_ok=True)
+        self.metrics.write(report, module=self.mod_name, version=self.mod_version, jobs=self.jobs,
+                           compression=self.compression, compression_level=self.compression_level,
+                           incremental=self.incremental, reproducible=self.reproducible)
+        logger.info("wrote generator metrics to " + report)
+
+    def _make_tarball(self):
+        """
+        Create or reuse the tarball and write source.json and MODULE.bazel into the bzlmod repo
+        """
+        tarball_name = self.tarball_name()
+        manifest = Manifest(self.manifest_file)
+        tree = self.tree_scan()
+        self._tree_touched(build_writer.MODULE_FILES, rewritten=True)
+        tree.add_hashes(self._valid_hashes())
+        with self._cores(self.jobs, 1) as threads:
+            manifest.scan(self.mod_src_dir, self.previous, self.stripped, threads, tree=tree,
+                          sources=self.import_sources)
+        manifest.added_links = self.added_links
+        manifest.build_inputs = self.build_inputs
+        manifest.compute_fingerprint(self.compression, self.compression_level, self.compression_long,
+                                     self.reproducible, sorted(self.components.items()), self.split_debug)
+        split = self.component_files()
+        previous_tarballs = [self.previous.tarball] + [c["tarball"] for c in self.previous.components.values()]
+        if (self.incremental and manifest.fingerprint == self.previous.fingerprint and
+                all(os.path.exists(t) for t in previous_tarballs)):
+            logger.info("module contents are unchanged, reusing tarball " + self.previous.tarball)
+            self._reuse_tarball(self.previous.tarball, tarball_name)
+            self.digest = self.previous.integrity
+            for component, previous in self.previous.components.items():
+                self._reuse_tarball(previous["tarball"], self.tarball_name(self.component_module(component)))
+            manifest.components = self.previous.components
+        else:
+            with tempfile.NamedTemporaryFile("w", encoding="utf8", suffix=".exclude") as ef:
+                ef.writelines(f"./{rel}\n" for files in split.values() for rel in files)
+                ef.flush()
+                self.digest = self._write_tarball(tarball_name, exclude_file=ef.name if split else None,
+                                                  components={self.component_module(c): files
+                                                              for c, files in split.items()})
+            for component, files in split.items():
+                module = self.component_module(component)
+                component_tarball = self.tarball_name(module)
+                root = self._stage_component(component, files)
+                manifest.components[component] = {
+                    "tarball": component_tarball,
+                    "integrity": self._write_tarball(component_tarball, root=root),
+                }
+            if self.split_debug:
+                root = self._stage_debug()
+                debug_tarball = self.tarball_name(self.component_module("debug"))
+                manifest.components["debug"] = {
+                    "tarball": debug_tarball,
+                    "integrity": self._write_tarball(debug_tarball, root=root),
+                }
+        manifest.tarball = tarball_name
+        manifest.integrity = self.digest
+        tarball_bytes = os.path.getsize(tarball_name)
+        tree_bytes = sum(entry["size"] for entry in manifest.files.values() if not entry["link"])
+        self.metrics.note(files=len(manifest.files), tarball_bytes=tarball_bytes,
+                          compression_ratio=round(tree_bytes / max(tarball_bytes, 1), 3))
+        manifest.save()
+        self.previous = manifest
+        self._write_registry_entry(self.mod_name, tarball_name, self.digest, self.mod_src_dir)
+        # the files of the main tarball, kept in the registry as the base of later deltas
+        published = module_delta.published_manifest(manifest, split.values(),
+                                                    f"{self.bzlmod_module_dir}/manifest.json")
+        published.save()
+        if self.delta_base:
+            self._write_delta(published)
+        for component, entry in manifest.components.items():
+            module = self.component_module(component)
+            self._write_registry_entry(module, entry["tarball"], entry["integrity"],
+                                       f"{self.TOP_DIR}/src/{module}")
+
+    def _write_delta(self, published):
+        """
+        Write the delta tarball from the delta base version and its description,
+        delta-from-<base>.json next to source.json
+        """
+        if not self.reproducible:
+            logger.warning("deltas need reproducible tarballs, not writing a delta from " + self.delta_base)
+            return
+        base = Manifest.load(f"{self.MOD_DIR}/{self.mod_name}/{self.delta_base}/manifest.json")
+        if not base.integrity:
+            logger.warning(f"no manifest for {self.mod_name} {self.delta_base} in the registry, " +
+                           "not writing a delta")
+            return
+        suffix = self.COMPRESSION_SUFFIXES[self.compression]
+        delta_tarball = f"{self.TARBALL_DIR}/{self.mod_name}-{self.delta_base}-to-{self.mod_version}.delta.{suffix}"
+        with self._cores(self.jobs, max(1, self.jobs // 2)) as threads:
+            delta = module_delta.make_delta(base, published, self.mod_src_dir, delta_tarball,
+                                            self._tar_options(), self._compressor_command(threads),
+                                            os.path.basename(published.tarball))
+        delta["delta_url"] = self.tarball_url(delta_tarball)
+        delta_file = f"{self.bzlmod_module_dir}/delta-from-{self.delta_base}.json"
+        with open(delta_file, "w", encoding="utf8") as df:
+            json.dump(delta, df, indent=1, sort_keys=True)
+        delta_bytes = os.path.getsize(delta_tarball)
+        self.metrics.note(delta_base=self.delta_base, delta_files=len(delta["changed"]),
+                          delta_bytes=delta_bytes)
+        logger.info(f"wrote {delta_file}: {len(delta['changed'])} changed and {len(delta['removed'])} " +
+                    f"removed paths, {delta_bytes} bytes")
+
+    @staticmethod
+    def _reuse_tarball(previous, tarball_name):
+        """
+        Hard link an unchanged previous tarball and its index to the current name
+        """
+        if previous != tarball_name:
+            for old, new in ((previous, tarball_name),
+                             (tarball_index.index_path(previous), tarball_index.index_path(tarball_name))):
+                if os.path.exists(new):
+                    os.remove(new)
+                if os.path.exists(old):
+                    os.link(old, new)
+
+    def _write_registry_entry(self, module, tarball_name, digest, src_dir):
+        """
+        Write a module version's source.json and copy its MODULE.bazel from src_dir into the bzlmod repo
+        """
         source_file = f"""{{
-    "url": "file://{tarball_name}",
-    "integrity": "sha256-{digest}",
+    "url": "{self.tarball_url(tarball_name)}",
+    "integrity": "{digest}",
     "strip_prefix": "",
     "patches": [],
     "patch_strip": 0
 }}
 """
-        if not os.path.exists(f"{self.MOD_DIR}/{self.mod_name}/{self.mod_version}"):
-            os.mkdir(f"{self.MOD_DIR}/{self.mod_name}/{self.mod_version}")
-        with open(f"{self.MOD_DIR}/{self.mod_name}/{self.mod_version}/source.json",
-                  "w", encoding="utf8") as sf:
+        version_dir = f"{self.MOD_DIR}/{module}/{self.mod_version}"
+        pathlib.Path(version_dir).mkdir(parents=True, exist_ok=True)
+        with open(f"{version_dir}/source.json", "w", encoding="utf8") as sf:
             sf.write(source_file)
-        logger.info("updated module source.json with new digest " + digest)
+        logger.info(f"updated {module} source.json with new digest " + digest)
         # copy the MODULE.bazel file from the src directory into the module repo directory
-        src_dir = f"{self.TOP_DIR}/src/{self.mod_name}"
-        shutil.copy(src_dir + "/MODULE.bazel",
-                    f"{self.MOD_DIR}/{self.mod_name}/{self.mod_version}/MODULE.bazel")
-        logger.info("copied MODULE.bazel from source to bzlmod repo")
+        shutil.copy(src_dir + "/MODULE.bazel", f"{version_dir}/MODULE.bazel")
+        logger.info(f"copied {module} MODULE.bazel from source to bzlmod repo")
+
+    def _stage_component(self, component, files):
+        """
+        Hard link a component's files into src/<module>_<component> along with its generated
+        MODULE.bazel and BUILD files, returning that directory
+        """
+        module = self.component_module(component)
+        root = f"{self.TOP_DIR}/src/{module}"
+        shutil.rmtree(root, ignore_errors=True)
+        os.makedirs(root)
+        for rel in files:
+            src, dst = f"{self.mod_src_dir}/{rel}", f"{root}/{rel}"
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            if os.path.islink(src):
+                os.symlink(os.readlink(src), dst)
+            else:
+                os.link(src, dst)
+        self._write_component_bazel_files(component, root, files)
+        logger.info(f"staged {len(files)} files of component {module} in {root}")
+        return root
+
+    def _stage_debug(self):
+        """
+        Add MODULE.bazel and BUILD files to the debug files extracted while stripping,
+        returning the debug module's directory
+        """
+        root = f"{self.TOP_DIR}/src/{self.component_module('debug')}"
+        os.makedirs(root, exist_ok=True)
+        files = []
+        for dirpath, dirnames, filenames in os.walk(root):
+            for name in filenames + [d for d in dirnames if os.path.islink(os.path.join(dirpath, d))]:
+                rel = os.path.relpath(os.path.join(dirpath, name), root)
+                if rel not in build_writer.MODULE_FILES:
+                    files.append(rel)
+        self._write_component_bazel_files("debug", root, sorted(files))
+        logger.info(f"staged {len(files)} debug files in {root}")
+        return root
+
+    def _write_component_bazel_files(self, component, root, files):
+        """
+        Write the MODULE.bazel and BUILD files of a component module
+        """
+        module = self.component_module(component)
+        with open(f"{root}/MODULE.bazel", "w", encoding="utf8") as mf:
+            mf.write(f'module(\n    name = "{module}",\n    version = "{self.mod_version}",\n)\n')
+        header = (f"Generated by scripts/compiler_suite_generator.py: the {component} component of " +
+                  f"{self.mod_name} {self.mod_version}")
+        groups = {"files": files}
+        filegroups = (("files", f"Every file of the {component} component", [], []),)
+        with open(f"{root}/BUILD", "w", encoding="utf8") as bf:
+            bf.write(build_writer.render(groups, [], header, filegroups=filegroups, union=False))
+
+    def _write_tarball(self, tarball_name, root=None, exclude_file=None, components=None):
+        """
+        Compress the module source directory, or root, into tarball_name, returning its
+        integrity digest.  exclude_file lists ./relative paths to leave out, and the index
+        records components, the paths left out by component module name.
+        """
+        if os.path.exists(tarball_name):
+            logger.info("Removing previous tarball")
+            os.remove(tarball_name)
+        # compression is the CPU bound stage, so wait for at least half the wanted cores
+        with self._cores(self.jobs, max(1, self.jobs // 2)) as threads:
+            compressor = self._compressor_command(threads)
+            logger.info(f"Generating tarball with {' '.join(compressor)} - this may take a while")
+            # hash the compressed stream as it is written, so the tarball is never read back
+            sha256 = hashlib.sha256()
+            # index the uncompressed stream on its way from tar to the compressor
+            indexer = tarball_index.TarIndexer()
+            with open(tarball_name, "wb") as tf:
+                tar = subprocess.Popen(self._tar_command(root, exclude_file),
+                                       stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+                compress = subprocess.Popen(compressor, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                            stderr=subprocess.PIPE)
+
+                def pump():
+                    try:
+                        while chunk := tar.stdout.read(1 << 20):
+                            indexer.feed(chunk)
+                            compress.stdin.write(chunk)
+                        compress.stdin.close()
+                    except BrokenPipeError:
+                        # the compressor failed, so stop tar as well and report both below
+                        tar.stdout.close()
+
+                # drain stderr in the background so a chatty compressor can't stall the pipeline
+                with concurrent.futures.ThreadPoolExecutor(max_workers=3) as pool:
+                    pumped = pool.submit(pump)
+                    tar_err = pool.submit(tar.stderr.read)
+                    compress_err = pool.submit(compress.stderr.read)
+                    while chunk := compress.stdout.read(1 << 20):
+                        sha256.update(chunk)
+                        tf.write(chunk)
+                    pumped.result()
+                    tar.wait()
+                    compress.wait()
+        if tar.returncode != 0 or compress.returncode != 0:
+            logger.error("tarball generation failed: " +
+                         tar_err.result().decode("utf8", "replace") +
+                         compress_err.result().decode("utf8", "replace"))
+            sys.exit()
+        logger.info("generated tarball " + tarball_name)
+        digest = self.integrity(sha256)
+        logger.info("generated sha256 digest " + digest)
+        tarball_index.save(indexer.index(digest, self.stripped, components), tarball_name)
+        return digest
+
@@ -0,0 +1,154 @@
+"""
+Find shared objects in a module source directory that no toolchain entry point needs.
+
+Starting from the entry binaries (gcc, cc1, cc1plus, as, ld, collect2, ...) and the
+target runtime libraries, follow DT_NEEDED entries through RPATH/RUNPATH directories
+and any same-architecture shared object with a matching file name or SONAME.
+Every ELF shared object outside that closure is a candidate for pruning, except the
+glibc libraries nothing reaches through DT_NEEDED: modules glibc loads with dlopen,
+such as NSS, gconv and libgcc_s, and libraries only named on link command lines, such
+as librt and libpthread, which programs built with the toolchain still need.
+"""
+import os
+import fnmatch
+import logging
+from elf_info import read_elf
+logger = logging
+
+# file names of glibc libraries loaded with dlopen or linked by programs built with the toolchain
+GLIBC_KEEP = (
+    "ld-linux*.so*", "ld.so*", "ld64.so*",
+    "libc.so*", "libm.so*", "libmvec.so*", "libgcc_s.so*",
+    "libnss_*.so*", "libnsl.so*", "libresolv.so*", "libcidn.so*", "libidn*.so*",
+    "librt.so*", "libdl.so*", "libpthread.so*", "libutil.so*", "libanl.so*", "libcrypt.so*",
+    "libBrokenLocale.so*", "libthread_db.so*", "libc_malloc_debug.so*",
+    "libmemusage.so*", "libpcprofile.so*", "libSegFault.so*",
+)
+# directories of glibc modules loaded with dlopen
+GLIBC_KEEP_DIRS = ("gconv", "audit")
+
+def glibc_runtime(rel):
+    """
+    Whether a relative path is a glibc library that must be kept although nothing needs it
+    """
+    *dirs, name = rel.split("/")
+    return any(fnmatch.fnmatch(name, pattern) for pattern in GLIBC_KEEP) or \
+        any(d in GLIBC_KEEP_DIRS for d in dirs)
+
+class DependencyClosure():
+    """
+    The ELF dependency closure of a set of root files within a directory tree
+    """
+
+    def __init__(self, root, import_dir=None, tree=None):
+        """
+        import_dir is the directory the tree was imported from, so absolute RPATH entries
+        pointing into it can be mapped back into the tree.  tree is an optional
+        tree_scan.TreeScan of root, whose cached ELF information is used instead of walking it.
+        """
+        self.root = root
+        self.import_dir = import_dir
+        self.tree = tree
+        # relative path => ElfInfo for every regular ELF file
+        self.elf = {}
+        # relative path of a symbolic link => relative path of the file it resolves to
+        self.symlinks = {}
+        # file name or SONAME => relative paths of shared objects providing it
+        self.providers = {}
+        self.reached = set()
+        self.unresolved = {}
+        self._scan()
+
+    def _walk(self):
+        """
+        The relative paths of files and symbolic links under root, with a function parsing
+        a relative path as an ELF file
+        """
+        if self.tree is not None:
+            return list(self.tree.entries), self.tree.elf
+        paths = []
+        for dirpath, _, filenames in os.walk(self.root):
+            paths += [os.path.relpath(os.path.join(dirpath, name), self.root) for name in filenames]
+        return paths, lambda rel: read_elf(f"{self.root}/{rel}")
+
+    def _scan(self):
+        paths, parse = self._walk()
+        for rel in paths:
+            full = f"{self.root}/{rel}"
+            if os.path.islink(full):
+                target = os.path.relpath(os.path.realpath(full), os.path.realpath(self.root))
+                if not target.startswith(".."):
+                    self.symlinks[rel] = target
+                continue
+            info = parse(rel)
+            if info is None:
+                continue
+            self.elf[rel] = info
+            if info.soname:
+                self.providers.setdefault(info.soname, set()).add(rel)
+        for rel, info in self.elf.items():
+            self.providers.setdefault(os.path.basename(rel), set()).add(rel)
+        for rel, target in self.symlinks.items():
+            if target in self.elf:
+                self.providers.setdefault(os.path.basename(rel), set()).add(target)
+
+    def resolve(self, rel):
+        """
+        Follow a relative path through symbolic links to an ELF file in the tree, or None
+        """
+        rel = self.symlinks.get(rel, rel)
+        return rel if rel in self.elf else None
+
+    def close(self, roots):
+        """
+        Add the roots and everything they transitively need to self.reached
+        """
+        pending = []
+        for rel in roots:
+            resolved = self.resolve(rel)
+            if resolved is None:
+                logger.warning(f"dependency root {rel} is not an ELF file in {self.root}")
+                continue
+            pending.append(resolved)
+        while pending:
+            rel = pending.pop()
+            if rel in self.reached:
+                continue
+            self.reached.add(rel)
+            info = self.elf[rel]
+            for needed in info.needed:
+                found = self._find(rel, info, needed)
+                if not found:
+                    self.unresolved.setdefault(needed, set()).add(rel)
+                pending += [dep for dep in found if dep not in self.reached]
+        return self.reached
+
+    def _find(self, rel, info, needed):
+        """
+        The shared objects in the tree that could satisfy a DT_NEEDED entry of rel
+        """
+        origin = os.path.dirname(rel) or "."
+        for search_dir in info.rpath + info.runpath:
+            search_dir = search_dir.replace("${ORIGIN}", origin).replace("$ORIGIN", origin)
+            if os.path.isabs(search_dir):
+                if not self.import_dir or not search_dir.startswith(self.import_dir):
+                    continue
+                search_dir = os.path.relpath(search_dir, self.import_dir)
+            candidate = self.resolve(os.path.normpath(os.path.join(search_dir, needed)))
+            if candidate:
+                return {candidate}
+        # otherwise accept any provider built for the same architecture
+        return {provider for provider in self.providers.get(needed, ())
+                if self.elf[provider].machine == info.machine and
+                self.elf[provider].elf_class == info.elf_class}
+
+    def unreferenced(self, keep=()):
+        """
+        Shared objects outside the closure, and the symbolic links resolving to them,
+        skipping glibc's runtime libraries and any relative path matching a keep pattern
+        """
+        unused = {rel for rel, info in self.elf.items()
+                  if info.is_shared_object and rel not in self.reached and not glibc_runtime(rel) and
+                  not any(fnmatch.fnmatch(rel, pattern) for pattern in keep)}
+        unused |= {rel for rel, target in self.symlinks.items() if target in unused}
+        return sorted(unused)
@@ -0,0 +1,219 @@
+"""
+Read the few ELF header fields the generator needs, without binutils.
+
+Only the ELF header, program headers, notes, dynamic section and section names are
+parsed, giving the machine type, file type, program interpreter, GNU build-id, the
+dynamic linking entries DT_NEEDED, DT_SONAME, DT_RPATH and DT_RUNPATH, and whether
+the file carries DWARF debug information.
+"""
+import os
+import struct
+
+# e_machine values for the architectures we build suites for
+EM_386 = 3
+EM_X86_64 = 62
+EM_AARCH64 = 183
+EM_RISCV = 243
+MACHINE_NAMES = {
+    EM_386: "i386",
+    EM_X86_64: "x86_64",
+    EM_AARCH64: "aarch64",
+    EM_RISCV: "riscv64",
+}
+
+# e_type values
+ET_REL = 1
+ET_EXEC = 2
+ET_DYN = 3
+
+# program header and dynamic section entry types
+PT_LOAD = 1
+PT_DYNAMIC = 2
+PT_INTERP = 3
+PT_NOTE = 4
+NT_GNU_BUILD_ID = 3
+DT_NULL = 0
+DT_NEEDED = 1
+DT_STRTAB = 5
+DT_SONAME = 14
+DT_RPATH = 15
+DT_RUNPATH = 29
+
+class ElfInfo():
+    """
+    Machine type and dynamic linking information of an ELF file
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.elf_class = None
+        self.little_endian = True
+        self.machine = None
+        self.type = None
+        self.interpreter = None
+        self.needed = []
+        self.soname = None
+        self.rpath = []
+        self.runpath = []
+        # hex GNU build-id, if the file has one
+        self.build_id = None
+        # section names, empty when the file has no section headers
+        self.sections = []
+
+    @property
+    def machine_name(self):
+        """
+        A short name for the machine type, e.g. "riscv64"
+        """
+        return MACHINE_NAMES.get(self.machine, f"machine-{self.machine}")
+
+    @property
+    def has_debug_info(self):
+        """
+        Whether the file holds DWARF debug information worth extracting before stripping
+        """
+        return ".debug_info" in self.sections
+
+    @property
+    def is_executable(self):
+        """
+        Executables have a program interpreter (or are statically linked ET_EXEC files)
+        """
+        return self.interpreter is not None or self.type == ET_EXEC
+
+    @property
+    def is_shared_object(self):
+        """
+        Shared libraries are position independent files without a program interpreter
+        """
+        return self.type == ET_DYN and self.interpreter is None
+
+def read_elf(path):
+    """
+    Parse the ELF file at path, returning None if it is not an ELF file
+    """
+    try:
+        with open(path, "rb") as f:
+            ident = f.read(16)
+            if len(ident) < 16 or ident[:4] != b"\x7fELF":
+                return None
+            return _parse(f, path, ident)
+    except (OSError, struct.error, ValueError):
+        return None
+
+def _parse(f, path, ident):
+    info = ElfInfo(path)
+    info.elf_class = 64 if ident[4] == 2 else 32
+    info.little_endian = ident[5] == 1
+    order = "<" if info.little_endian else ">"
+    if info.elf_class == 64:
+        header = struct.unpack(order + "HHIQQQIHHHHHH", f.read(48))
+    else:
+        header = struct.unpack(order + "HHIIIIIHHHHHH", f.read(36))
+    phoff, phentsize, phnum = header[4], header[8], header[9]
+    info.type, info.machine = header[0], header[1]
+    loads = []
+    dynamic = None
+    notes = []
+    for i in range(phnum):
+        f.seek(phoff + i * phentsize)
+        if info.elf_class == 64:
+            p_type, _, p_offset, p_vaddr, _, p_filesz, _, _ = struct.unpack(order + "IIQQQQQQ",
+                                                                            f.read(56))
+        else:
+            p_type, p_offset, p_vaddr, _, p_filesz, _, _, _ = struct.unpack(order + "IIIIIIII",
+                                                                            f.read(32))
+        if p_type == PT_LOAD:
+            loads.append((p_vaddr, p_offset, p_filesz))
+        elif p_type == PT_DYNAMIC:
+            dynamic = (p_offset, p_filesz)
+        elif p_type == PT_INTERP:
+            f.seek(p_offset)
+            info.interpreter = f.read(p_filesz).rstrip(b"\0").decode("utf8", "replace")
+        elif p_type == PT_NOTE:
+            notes.append((p_offset, p_filesz))
+    for offset, size in notes:
+        _parse_notes(f, info, order, offset, size)
+    if dynamic:
+        _parse_dynamic(f, info, order, dynamic, loads)
+    _parse_section_names(f, info, order, header[5], header[10], header[11], header[12])
+    return info
+
+def _parse_notes(f, info, order, offset, size):
+    """
+    Find the NT_GNU_BUILD_ID note in a PT_NOTE segment
+    """
+    f.seek(offset)
+    data = f.read(size)
+    position = 0
+    while position + 12 <= len(data):
+        namesz, descsz, note_type = struct.unpack_from(order + "III", data, position)
+        name_start = position + 12
+        desc_start = name_start + (namesz + 3) // 4 * 4
+        if note_type == NT_GNU_BUILD_ID and data[name_start:name_start + namesz] == b"GNU\0":
+            info.build_id = data[desc_start:desc_start + descsz].hex()
+            return
+        position = desc_start + (descsz + 3) // 4 * 4
+
+def _parse_section_names(f, info, order, shoff, shentsize, shnum, shstrndx):
+    """
+    Collect the section names from the section header string table
+    """
+    if not shoff or not shnum or shstrndx >= shnum:
+        return
+    header_format = order + ("IIQQQQIIQQ" if info.elf_class == 64 else "IIIIIIIIII")
+    headers = []
+    for i in range(shnum):
+        f.seek(shoff + i * shentsize)
+        fields = struct.unpack(header_format, f.read(struct.calcsize(header_format)))
+        # sh_name, sh_offset and sh_size
+        headers.append((fields[0], fields[4], fields[5]))
+    f.seek(headers[shstrndx][1])
+    strings = f.read(headers[shstrndx][2])
+    info.sections = [strings[name:strings.find(b"\0", name)].decode("utf8", "replace")
+                     for name, _, _ in headers if name < len(strings)]
+
+def _parse_dynamic(f, info, order, dynamic, loads):
+    """
+    Collect DT_NEEDED, DT_SONAME, DT_RPATH and DT_RUNPATH strings from the dynamic section
+    """
+    entry_format = order + ("qQ" if info.elf_class == 64 else "iI")
+    entry_size = struct.calcsize(entry_format)
+    f.seek(dynamic[0])
+    data = f.read(dynamic[1])
+    entries = []
+    strtab = None
+    for offset in range(0, len(data) - entry_size + 1, entry_size):
+        tag, value = struct.unpack_from(entry_format, data, offset)
+        if tag == DT_NULL:
+            break
+        if tag == DT_STRTAB:
+            strtab = value
+        entries.append((tag, value))
+    # DT_STRTAB holds a virtual address, so map it back to a file offset
+    strtab_offset = None
+    for vaddr, offset, filesz in loads:
+        if strtab is not None and vaddr <= strtab < vaddr + filesz:
+            strtab_offset = strtab - vaddr + offset
+    if strtab_offset is None:
+        return
+
+    def string(index):
+        f.seek(strtab_offset + index)
+        raw = b""
+        while b"\0" not in raw:
+            chunk = f.read(256)
+            if not chunk:
+                break
+            raw += chunk
+        return raw.split(b"\0", 1)[0].decode("utf8", "replace")
+
+    for tag, value in entries:
+        if tag == DT_NEEDED:
+            info.needed.append(string(value))
+        elif tag == DT_SONAME:
+            info.soname = string(value)
+        elif tag == DT_RPATH:
+            info.rpath += [p for p in string(value).split(os.pathsep) if p]
+        elif tag == DT_RUNPATH:
+            info.runpath += [p for p in string(value).split(os.pathsep) if p]
@@ -0,0 +1,145 @@
+#!/usr/bin/python
+"""
+Generate compiler suite Bazel modules from declarative suite specifications.
+
+Every suite described by the given TOML files is generated, for instance both
+architectures at once:
+
+    scripts/generate_suites.py suites/gcc_riscv.toml suites/gcc_x86_64.toml
+
+Command line options override the compression and parallelism settings of every suite.
+Suites are generated concurrently, sharing a global budget of cores (--cores), so one
+suite's rsync import and deduplication overlap another suite's compression.  Suites with
+the same module name share a module source directory, so they run one after the other.
+"""
+import sys
+import argparse
+import logging
+import concurrent.futures
+from compiler_suite_generator import Generator
+from suite_spec import load_specs, SpecError
+from job_scheduler import JobScheduler
+from blob_store import BlobStore
+import repository_cache
+logger = logging
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Generate compiler suite Bazel modules")
+    parser.add_argument("specs", nargs="+", help="suite specification TOML files")
+    parser.add_argument("--incremental", action="store_true",
+                        help="reuse unchanged files from the previous run")
+    parser.add_argument("--jobs", type=int,
+                        help="concurrent workers per suite, by default the whole core budget")
+    parser.add_argument("--cores", type=int,
+                        help="global core budget shared by all suites, by default every core")
+    parser.add_argument("--parallel", type=int,
+                        help="suites generated at the same time, by default all of them")
+    parser.add_argument("--compression", choices=sorted(Generator.COMPRESSION_SUFFIXES),
+                        help="tarball compression backend")
+    parser.add_argument("--compression-level", type=int, help="compression level")
+    parser.add_argument("--long-range", action="store_true", help="zstd long distance matching")
+    parser.add_argument("--import-engine", choices=("native", "rsync"), default="native",
+                        help="import files natively, hard linking or cloning them, or with rsync")
+    parser.add_argument("--blob-store", default=f"{Generator.BZLMOD_DIR}/blobs", metavar="DIR",
+                        help="content-addressed store of stripped binaries shared by suite versions")
+    parser.add_argument("--no-blob-store", action="store_true",
+                        help="strip every binary rather than reusing stored copies")
+    parser.add_argument("--gc-blobs", action="store_true",
+                        help="after generating, remove stored blobs no module source directory links to")
+    parser.add_argument("--registry-url", metavar="URL",
+                        help="publish source.json URLs below this registry server URL rather than file://")
+    parser.add_argument("--registry-mirror", metavar="URL",
+                        help="add a registry server URL to the mirrors of bazel_registry.json")
+    parser.add_argument("--repository-cache", action="append", default=[], metavar="DIR",
+                        help="seed a Bazel --repository_cache directory with the generated tarballs")
+    parser.add_argument("--repository-cache-keep", type=int, metavar="N",
+                        help="remove all but the N most recent versions of the suites from the repository caches")
+    parser.add_argument("--only", action="append", default=[], metavar="NAME[@VERSION]",
+                        help="generate only the named suites")
+    return parser.parse_args(argv)
+
+def selected_specs(args):
+    """
+    Load the suites from every specification file, filtered by --only
+    """
+    specs = []
+    for path in args.specs:
+        try:
+            specs += load_specs(path)
+        except (OSError, SpecError) as e:
+            logger.error(f"unable to load suite specification: {e}")
+            sys.exit(1)
+    if args.only:
+        specs = [spec for spec in specs
+                 if spec.name in args.only or f"{spec.name}@{spec.version}" in args.only]
+    if not specs:
+        logger.error("no suites selected")
+        sys.exit(1)
+    return specs
+
+def configure(spec, args, scheduler, store=None, cpu_metrics=True):
+    """
+    Create a generator for a suite, applying command line overrides.  cpu_metrics is
+    False when other suites are generated concurrently in this process.
+    """
+    generator = Generator.from_spec(spec)
+    generator.set_cpu_metrics(cpu_metrics)
+    generator.set_incremental(args.incremental)
+    generator.set_scheduler(scheduler)
+    generator.set_blob_store(store)
+    generator.set_import_engine(args.import_engine)
+    generator.set_registry_url(args.registry_url)
+    generator.set_jobs(args.jobs or scheduler.cores)
+    if args.compression or args.compression_level is not None or args.long_range:
+        generator.set_compression(args.compression or spec.compression,
+                                  args.compression_level if args.compression_level is not None
+                                  else spec.compression_level,
+                                  args.long_range or spec.long_range)
+    return generator
+
+def generate_group(specs, args, scheduler, store, cpu_metrics=True):
+    """
+    Generate suites sharing a module source directory, one after the other, returning
+    the names of the modules published
+    """
+    modules = set()
+    caches = [repository_cache.RepositoryCache(path) for path in args.repository_cache]
+    for spec in specs:
+        logger.info(f"generating {spec.name} {spec.version} from {spec.source}")
+        generator = configure(spec, args, scheduler, store, cpu_metrics)
+        generator.generate(spec)
+        for module in generator.published_modules():
+            repository_cache.seed_version(caches, module, spec.version)
+        modules.update(generator.published_modules())
+    return modules
+
+def main(argv=None):
+    args = parse_args(argv)
+    groups = {}
+    for spec in selected_specs(args):
+        groups.setdefault(spec.name, []).append(spec)
+    if args.registry_mirror:
+        Generator.add_registry_mirror(args.registry_mirror)
+    scheduler = JobScheduler(args.cores)
+    store = None if args.no_blob_store else BlobStore(args.blob_store)
+    logger.info(f"generating {sum(len(g) for g in groups.values())} suites with a budget of " +
+                f"{scheduler.cores} cores")
+    workers = args.parallel or len(groups)
+    # stage CPU times are process-wide, so they are only recorded when suites run one at a time
+    cpu_metrics = min(workers, len(groups)) <= 1
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(generate_group, specs, args, scheduler, store, cpu_metrics)
+                   for specs in groups.values()]
+        modules = set()
+        for future in concurrent.futures.as_completed(futures):
+            # re-raise any failure, including the SystemExit of a failed stage
+            modules.update(future.result())
+    if store is not None and args.gc_blobs:
+        store.collect_garbage()
+    if args.repository_cache and args.repository_cache_keep is not None:
+        caches = [repository_cache.RepositoryCache(path) for path in args.repository_cache]
+        freed = repository_cache.prune(caches, sorted(modules), args.repository_cache_keep)
+        logger.info(f"pruned stale suite versions from the repository caches, freeing {freed} bytes")
+
+if __name__ == "__main__":
+    main()
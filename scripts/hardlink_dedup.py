@@ -0,0 +1,135 @@
+"""
+Replace duplicate files in a module source directory with hard links.
+
+Compiler suites carry many identical headers and several copies of the same
+shared objects, for instance under `lib`, `lib64` and `<target>/lib`.  Candidates
+are narrowed down in three steps, so most files are never read in full:
+
+* group regular files by size and permissions
+* split those groups by a cheap hash of the first and last few KiB
+* split the survivors by a full sha256 hash
+
+Hashing runs in parallel, and full hashes already known from other pipeline stages
+are reused rather than recomputed.
+"""
+import os
+import stat
+import hashlib
+import logging
+import concurrent.futures
+from suite_manifest import file_sha256
+logger = logging
+
+class Deduplicator():
+    """
+    Find identical files under a directory and replace all but one of them with hard links
+    """
+    # bytes read from each end of a file for the partial hash
+    PARTIAL_BYTES = 4096
+
+    def __init__(self, root, jobs=1, known_hashes=None, inodes=None):
+        """
+        known_hashes maps (st_dev, st_ino) to the hex sha256 of files whose content is already known.
+        inodes is the result of _scan() taken from an earlier walk, e.g. tree_scan.TreeScan.inodes().
+        """
+        self.root = root
+        self.jobs = jobs
+        # (st_dev, st_ino) => hex sha256, including every file hashed here
+        self.hashes = dict(known_hashes or {})
+        self.inodes = inodes
+        self.links = 0
+        self.bytes_saved = 0
+        # paths replaced by a hard link
+        self.relinked = []
+
+    def run(self):
+        """
+        Replace duplicates with hard links, returning the number of bytes saved
+        """
+        inodes = self.inodes if self.inodes is not None else self._scan()
+        by_size = {}
+        for key, (_, size, mode) in inodes.items():
+            by_size.setdefault((size, mode), []).append(key)
+        candidates = [keys for keys in by_size.values() if len(keys) > 1]
+        # only files without a known hash that share a size with another file need a partial hash
+        unknown = [key for keys in candidates for key in keys if key not in self.hashes]
+        partial = dict(zip(unknown, self._map(self._partial_hash, [inodes[k][0][0] for k in unknown])))
+        need_full = []
+        for keys in candidates:
+            known = any(key in self.hashes for key in keys)
+            groups = {}
+            for key in keys:
+                if key in partial:
+                    groups.setdefault(partial[key], []).append(key)
+            for group in groups.values():
+                # a lone partial hash can still match a file whose full hash is already known
+                if len(group) > 1 or known:
+                    need_full += group
+        for key, digest in zip(need_full, self._map(file_sha256, [inodes[k][0][0] for k in need_full])):
+            self.hashes[key] = digest
+        for keys in candidates:
+            groups = {}
+            for key in keys:
+                if key in self.hashes:
+                    groups.setdefault(self.hashes[key], []).append(key)
+            for group in groups.values():
+                if len(group) > 1:
+                    self._link_group(group, inodes)
+        logger.info(f"hashed {len(partial)} partial and {len(need_full)} full files under {self.root}")
+        return self.bytes_saved
+
+    def _scan(self):
+        """
+        Map the inode of every non-empty regular file to its paths, size and permissions
+        """
+        inodes = {}
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames.sort()
+            for name in sorted(filenames):
+                path = os.path.join(dirpath, name)
+                st = os.lstat(path)
+                if not stat.S_ISREG(st.st_mode) or st.st_size == 0:
+                    continue
+                entry = inodes.setdefault((st.st_dev, st.st_ino),
+                                          ([], st.st_size, stat.S_IMODE(st.st_mode)))
+                entry[0].append(path)
+        return inodes
+
+    def _map(self, function, paths):
+        """
+        Apply a hash function to paths across the worker threads
+        """
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.jobs) as pool:
+            return list(pool.map(function, paths))
+
+    def _partial_hash(self, path):
+        """
+        Hash the first and last PARTIAL_BYTES of a file
+        """
+        sha256 = hashlib.sha256()
+        with open(path, "rb") as f:
+            sha256.update(f.read(self.PARTIAL_BYTES))
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - self.PARTIAL_BYTES))
+            sha256.update(f.read(self.PARTIAL_BYTES))
+        return sha256.hexdigest()
+
+    def _link_group(self, group, inodes):
+        """
+        Keep the shallowest, then alphabetically first, file of a group and link every other path to it
+        """
+        def rank(key):
+            path = min(inodes[key][0])
+            return (path.count(os.sep), path)
+        keeper, *duplicates = sorted(group, key=rank)
+        keeper_path = min(inodes[keeper][0])
+        for key in duplicates:
+            paths, size, _ = inodes[key]
+            for path in paths:
+                tmp = path + ".dedup-tmp"
+                os.link(keeper_path, tmp)
+                os.replace(tmp, path)
+                self.relinked.append(path)
+                self.links += 1
+            inodes[keeper][0].extend(paths)
+            self.bytes_saved += size
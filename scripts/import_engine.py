@@ -0,0 +1,372 @@
+"""
+Import selected files from an installation directory into a module source directory
+without rsync.
+
+The suite specifications' rsync filter rules are evaluated natively, with the same
+semantics rsync gives them: the first matching rule decides, unmatched paths are
+included, an excluded directory is never descended into, patterns without a slash
+match the final path component, patterns starting with a slash are anchored at the
+transfer root, and a trailing slash only matches directories.  "P" rules protect
+destination files from deletion and "H" rules hide source files from the transfer.
+
+Files are imported as rsync -aH would import them, preserving permissions,
+modification times, symbolic links and hard links, but in parallel and mostly as
+metadata operations: a file the generator never modifies in place is hard linked
+to its source when both live on the same file system, other files are cloned with a
+reflink where the file system supports it, and copied with copy_file_range
+otherwise.  Unchanged files, by size and modification time, are left alone, as are
+files the previous import recorded with the same source and destination size and
+modification time, which later generator stages may have hard linked to a duplicate.
+"""
+import os
+import re
+import stat
+import errno
+import fcntl
+import shutil
+import threading
+import concurrent.futures
+import logging
+logger = logging
+
+# ioctl request cloning a whole file on btrfs, xfs and other copy-on-write file systems
+FICLONE = 0x40049409
+
+class FilterRule():
+    """
+    One rsync include, exclude, protect or hide rule
+    """
+
+    def __init__(self, action, pattern):
+        self.action = action
+        self.pattern = pattern
+        self.dir_only = pattern.endswith("/") and not pattern.endswith("/***/")
+        pattern = pattern.rstrip("/") if self.dir_only else pattern
+        anchored = pattern.startswith("/")
+        pattern = pattern.lstrip("/")
+        # dir/*** matches the directory itself and everything below it
+        suffix = ""
+        if pattern.endswith("/***"):
+            pattern, suffix = pattern[:-4], "(?:/.*)?"
+        self.full_path = anchored or "/" in pattern or "**" in pattern or suffix != ""
+        regex = _wildcard_regex(pattern) + suffix
+        if anchored:
+            regex = "^" + regex
+        elif self.full_path:
+            regex = "(?:^|.*/)" + regex
+        else:
+            regex = "^" + regex
+        self.regex = re.compile(regex + r"\Z", re.DOTALL)
+
+    def matches(self, rel, is_dir):
+        """
+        Whether the rule applies to a path relative to the transfer root
+        """
+        if self.dir_only and not is_dir:
+            return False
+        return bool(self.regex.match(rel if self.full_path else rel.rsplit("/", 1)[-1]))
+
+class FilterRules():
+    """
+    An ordered list of rsync filter rules, as found in suite specifications
+    """
+    ACTIONS = {"+": "include", "-": "exclude", "P": "protect", "H": "hide",
+               "include": "include", "exclude": "exclude", "protect": "protect", "hide": "hide"}
+
+    def __init__(self, text):
+        self.rules = []
+        for line in text.splitlines():
+            line = line.strip()
+            if not line or line.startswith(("#", ";")):
+                continue
+            action, _, pattern = line.partition(" ")
+            if action not in self.ACTIONS or not pattern:
+                raise ValueError(f"unsupported filter rule {line!r}")
+            self.rules.append(FilterRule(self.ACTIONS[action], pattern.strip()))
+
+    def sent(self, rel, is_dir):
+        """
+        Whether the sender transfers a path: include, exclude and hide rules apply
+        """
+        for rule in self.rules:
+            if rule.action != "protect" and rule.matches(rel, is_dir):
+                return rule.action == "include"
+        return True
+
+    def protected(self, rel, is_dir):
+        """
+        Whether the receiver keeps a path that isn't transferred.  With --delete-excluded
+        only protect rules apply on the receiving side.
+        """
+        for rule in self.rules:
+            if rule.action == "protect" and rule.matches(rel, is_dir):
+                return True
+        return False
+
+class ImportEngine():
+    """
+    Mirror the filtered contents of one directory tree into another
+    """
+
+    def __init__(self, src_dir, dst_dir, rules, jobs=1, delete=False, modified=(), previous=None):
+        """
+        rules is the text of rsync filter rules.  delete removes destination files that are
+        not transferred, as rsync --delete-excluded does, except protected ones.  modified
+        lists the relative paths later changed in place, for instance by strip, which are
+        copied rather than hard linked to their source.  previous maps relative paths to the
+        (source size, source mtime_ns, size, mtime_ns) recorded after the previous import.
+        """
+        self.src_dir = src_dir.rstrip("/")
+        self.dst_dir = dst_dir.rstrip("/")
+        self.rules = FilterRules(rules)
+        self.jobs = max(1, jobs)
+        self.delete = delete
+        self.modified = set(modified)
+        self.previous = previous or {}
+        # relative path => (size, mtime_ns) of the source of every file transferred
+        self.sources = {}
+        # rsync --itemize-changes style records of every change made
+        self.changes = []
+        self.lock = threading.Lock()
+        self.linked = 0
+        self.cloned = 0
+        self.copied = 0
+
+    def run(self):
+        """
+        Import the selected files, returning the list of itemized changes
+        """
+        dirs, files, symlinks = self._scan()
+        self.sources = {rel: (st.st_size, st.st_mtime_ns) for rel, st in files.items()}
+        same_device = os.stat(self.src_dir).st_dev == os.stat(self.dst_dir).st_dev
+        # hard linked source paths are imported once, then linked together as rsync -H does
+        groups = {}
+        for rel, st in files.items():
+            groups.setdefault((st.st_dev, st.st_ino), []).append(rel)
+        for rel in dirs:
+            self._make_dir(rel)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.jobs) as pool:
+            futures = [pool.submit(self._import_group, sorted(paths), files, same_device)
+                       for paths in groups.values()]
+            for future in futures:
+                future.result()
+        for rel, target in sorted(symlinks.items()):
+            self._import_symlink(rel, target[0], target[1])
+        if self.delete:
+            self._delete_untransferred(set(dirs) | set(files) | set(symlinks))
+        # directory times last, deepest first, since importing their contents changed them
+        for rel in sorted(dirs, key=lambda d: d.count("/"), reverse=True):
+            st = dirs[rel]
+            path = self._dst(rel)
+            os.chmod(path, stat.S_IMODE(st.st_mode))
+            os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns))
+        logger.info(f"imported {len(files)} files: {self.linked} hard linked, {self.cloned} cloned, " +
+                    f"{self.copied} copied, {len(self.changes)} changes")
+        return self.changes
+
+    def _dst(self, rel):
+        return f"{self.dst_dir}/{rel}" if rel != "." else self.dst_dir
+
+    def _record(self, change):
+        with self.lock:
+            self.changes.append(change)
+
+    def _scan(self):
+        """
+        Walk the source as the rsync sender would, returning the transferred directories and
+        files with their stat results, and symbolic links with their target and stat results
+        """
+        dirs = {".": os.stat(self.src_dir)}
+        files = {}
+        symlinks = {}
+        pending = [""]
+        while pending:
+            prefix = pending.pop()
+            with os.scandir(f"{self.src_dir}/{prefix}" if prefix else self.src_dir) as entries:
+                for entry in entries:
+                    rel = f"{prefix}{entry.name}"
+                    is_dir = entry.is_dir(follow_symlinks=False)
+                    if not self.rules.sent(rel, is_dir):
+                        continue
+                    st = entry.stat(follow_symlinks=False)
+                    if is_dir:
+                        dirs[rel] = st
+                        pending.append(rel + "/")
+                    elif entry.is_symlink():
+                        symlinks[rel] = (os.readlink(entry.path), st)
+                    elif entry.is_file(follow_symlinks=False):
+                        files[rel] = st
+        return dirs, files, symlinks
+
+    def _make_dir(self, rel):
+        path = self._dst(rel)
+        if os.path.isdir(path) and not os.path.islink(path):
+            return
+        if os.path.lexists(path):
+            os.remove(path)
+        os.makedirs(path, exist_ok=True)
+        self._record(f"cd+++++++++ {rel}/")
+
+    def _import_group(self, paths, files, same_device):
+        """
+        Import the first path of a hard linked group, then link the others to it
+        """
+        first = paths[0]
+        st = files[first]
+        src = f"{self.src_dir}/{first}"
+        dst = self._dst(first)
+        link = same_device and not self.modified.intersection(paths)
+        if not self._unchanged(first, st, src if link else None):
+            self._remove(dst)
+            tmp = f"{dst}.import{threading.get_ident()}"
+            self._copy(src, tmp, st, link)
+            os.replace(tmp, dst)
+            self._record(f">f+++++++++ {first}")
+        for rel in paths[1:]:
+            other = self._dst(rel)
+            if os.path.lexists(other) and not os.path.isdir(other) and os.path.samefile(dst, other):
+                continue
+            self._remove(other)
+            tmp = f"{other}.import{threading.get_ident()}"
+            os.link(dst, tmp)
+            os.replace(tmp, other)
+            self._record(f"hf+++++++++ {rel} => {first}")
+
+    def _unchanged(self, rel, st, link_source):
+        """
+        rsync's quick check: a regular file of the same size and modification time is unchanged.
+        A file that should be a hard link to its source must be one, unless the source and the
+        file are as the previous import recorded them: deduplication may since have replaced
+        the file with a hard link to an identical one, with that file's modification time.
+        """
+        dst = self._dst(rel)
+        try:
+            dst_st = os.lstat(dst)
+        except OSError:
+            return False
+        if not stat.S_ISREG(dst_st.st_mode):
+            return False
+        recorded = self.previous.get(rel) == (st.st_size, st.st_mtime_ns, dst_st.st_size, dst_st.st_mtime_ns)
+        if link_source and (dst_st.st_dev, dst_st.st_ino) != (st.st_dev, st.st_ino) and not recorded:
+            return False
+        if (dst_st.st_size, dst_st.st_mtime_ns) != (st.st_size, st.st_mtime_ns) and not recorded:
+            return False
+        if stat.S_IMODE(dst_st.st_mode) != stat.S_IMODE(st.st_mode):
+            os.chmod(dst, stat.S_IMODE(st.st_mode))
+        return True
+
+    def _copy(self, src, dst, st, link):
+        """
+        Hard link, clone or copy src to dst, preserving its permissions and times
+        """
+        if link:
+            try:
+                os.link(src, dst)
+                with self.lock:
+                    self.linked += 1
+                return
+            except OSError:
+                pass
+        with open(src, "rb") as sf, open(dst, "wb") as df:
+            try:
+                fcntl.ioctl(df.fileno(), FICLONE, sf.fileno())
+                cloned = True
+            except OSError:
+                cloned = False
+            if not cloned:
+                _copy_file_range(sf, df, st.st_size)
+        os.chmod(dst, stat.S_IMODE(st.st_mode))
+        if os.geteuid() == 0:
+            os.chown(dst, st.st_uid, st.st_gid)
+        os.utime(dst, ns=(st.st_atime_ns, st.st_mtime_ns))
+        with self.lock:
+            if cloned:
+                self.cloned += 1
+            else:
+                self.copied += 1
+
+    def _import_symlink(self, rel, target, st):
+        dst = self._dst(rel)
+        if os.path.islink(dst) and os.readlink(dst) == target:
+            return
+        self._remove(dst)
+        os.symlink(target, dst)
+        os.utime(dst, ns=(st.st_atime_ns, st.st_mtime_ns), follow_symlinks=False)
+        self._record(f"cL+++++++++ {rel} -> {target}")
+
+    @staticmethod
+    def _remove(path):
+        if os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path)
+        elif os.path.lexists(path):
+            os.remove(path)
+
+    def _delete_untransferred(self, transferred):
+        """
+        Remove destination paths the sender didn't transfer, keeping protected paths and
+        the directories holding them
+        """
+        for dirpath, dirnames, filenames in os.walk(self.dst_dir, topdown=False):
+            for name in filenames + dirnames:
+                path = os.path.join(dirpath, name)
+                rel = os.path.relpath(path, self.dst_dir)
+                is_dir = os.path.isdir(path) and not os.path.islink(path)
+                if rel in transferred or self.rules.protected(rel, is_dir):
+                    continue
+                if is_dir and os.listdir(path):
+                    # still holds protected files
+                    continue
+                self._remove(path)
+                self._record(f"*deleting   {rel}{'/' if is_dir else ''}")
+
+def _copy_file_range(sf, df, size):
+    """
+    Copy a whole file within the kernel, falling back to a user space copy
+    """
+    offset = 0
+    try:
+        while offset < size:
+            copied = os.copy_file_range(sf.fileno(), df.fileno(), size - offset)
+            if copied == 0:
+                break
+            offset += copied
+    except OSError as e:
+        if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EOPNOTSUPP, errno.EINVAL):
+            raise
+        sf.seek(offset)
+        df.seek(offset)
+        shutil.copyfileobj(sf, df, 1 << 20)
+
+def _wildcard_regex(pattern):
+    """
+    Convert rsync wildcards into a regular expression: ** crosses slashes, * and ? don't
+    """
+    regex = ""
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if pattern.startswith("**", i):
+            regex += ".*"
+            i += 2
+            continue
+        if c == "*":
+            regex += "[^/]*"
+        elif c == "?":
+            regex += "[^/]"
+        elif c == "[":
+            end = pattern.find("]", i + 2)
+            if end == -1:
+                regex += re.escape(c)
+            else:
+                body = pattern[i + 1:end]
+                if body.startswith("!"):
+                    body = "^" + body[1:]
+                regex += f"[{body}]"
+                i = end
+        elif c == "\\" and i + 1 < len(pattern):
+            i += 1
+            regex += re.escape(pattern[i])
+        else:
+            regex += re.escape(c)
+        i += 1
+    return regex
@@ -0,0 +1,133 @@
+"""
+Find the headers in a module source directory that no source in a user corpus reaches.
+
+The module's own compiler preprocesses every corpus source with -M, searching only the
+module's include directories, and the dependency lists it prints are merged into the
+reachable header closure.  Any header under those include directories outside the
+closure is a candidate for exclusion from a slim module variant.
+
+A corpus entry is either a source file, or a header name in angle brackets such as
+<vector> or <stdio.h>, which is preprocessed from a one line source including it.
+Header names with a .h suffix are preprocessed as C, others as C++.
+"""
+import os
+import fnmatch
+import tempfile
+import subprocess
+import concurrent.futures
+import logging
+logger = logging
+
+C_SUFFIXES = (".c", ".h")
+
+class IncludeClosure():
+    """
+    The headers reached from a corpus of sources, compiled with a module's own compiler
+    """
+
+    def __init__(self, root, include_dirs, tool_prefix="", flags=()):
+        """
+        include_dirs are relative to root and searched in order, as the toolchain's -isystem
+        options do; flags are added to every preprocessor command
+        """
+        self.root = root
+        self.include_dirs = list(include_dirs)
+        self.tool_prefix = tool_prefix
+        self.flags = list(flags)
+        # relative paths of the headers reached from the corpus
+        self.reached = set()
+        # corpus entry => compiler error output, for entries that failed to preprocess
+        self.failed = {}
+
+    def command(self, source, cplusplus):
+        """
+        The preprocessor command listing the dependencies of a source file
+        """
+        compiler = f"{self.root}/bin/{self.tool_prefix}{'g++' if cplusplus else 'gcc'}"
+        command = [compiler, "-M", "-nostdinc", f"--sysroot={self.root}"]
+        for include_dir in self.include_dirs:
+            command += ["-isystem", f"{self.root}/{include_dir}"]
+        return command + self.flags + [source]
+
+    def scan(self, corpus, jobs=1):
+        """
+        Preprocess every corpus entry, adding the headers each reaches to self.reached
+        """
+        with tempfile.TemporaryDirectory() as workdir:
+            requests = []
+            for i, entry in enumerate(corpus):
+                if entry.startswith("<") and entry.endswith(">"):
+                    cplusplus = not entry.endswith(".h>")
+                    source = os.path.join(workdir, f"header{i}.{'cc' if cplusplus else 'c'}")
+                    with open(source, "w", encoding="utf8") as sf:
+                        sf.write(f"#include {entry}\n")
+                else:
+                    source = entry
+                    cplusplus = not source.endswith(C_SUFFIXES)
+                requests.append((entry, self.command(source, cplusplus)))
+            with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+                for entry, result in zip((r[0] for r in requests),
+                                         pool.map(lambda r: subprocess.run(r[1], capture_output=True,
+                                                                           encoding="utf8"), requests)):
+                    if result.returncode != 0:
+                        self.failed[entry] = result.stderr.strip()
+                        continue
+                    for path in parse_dependencies(result.stdout)[1:]:
+                        self._reach(path)
+        return self.reached
+
+    def _reach(self, path):
+        """
+        Add a header path printed by the compiler, and the file it links to, if inside root
+        """
+        path = os.path.normpath(path)
+        if not os.path.isabs(path):
+            return
+        for candidate in (path, os.path.realpath(path)):
+            rel = os.path.relpath(candidate, self.root)
+            if not rel.startswith(".."):
+                self.reached.add(rel)
+
+    def headers(self):
+        """
+        The relative paths of every file and symbolic link under the include directories
+        """
+        found = set()
+        for include_dir in self.include_dirs:
+            for dirpath, dirnames, filenames in os.walk(f"{self.root}/{include_dir}"):
+                links = [d for d in dirnames if os.path.islink(os.path.join(dirpath, d))]
+                for name in filenames + links:
+                    found.add(os.path.relpath(os.path.join(dirpath, name), self.root))
+        return found
+
+    def unreachable(self, keep=()):
+        """
+        The headers outside the closure, excluding those matching a keep fnmatch pattern
+        """
+        return sorted(rel for rel in self.headers() - self.reached
+                      if not any(fnmatch.fnmatch(rel, pattern) for pattern in keep))
+
+def parse_dependencies(text):
+    """
+    Split make-style dependency output into its target and prerequisite paths
+    """
+    words = []
+    word = ""
+    escaped = False
+    for c in text.replace("\\\n", " "):
+        if escaped:
+            word += c
+            escaped = False
+        elif c == "\\":
+            escaped = True
+        elif c.isspace():
+            if word:
+                words.append(word)
+            word = ""
+        else:
+            word += c
+    if word:
+        words.append(word)
+    if words and words[0].endswith(":"):
+        words[0] = words[0][:-1]
+    return [w.replace("$$", "$") for w in words]
@@ -0,0 +1,43 @@
+"""
+Share a global budget of cores between suites generated concurrently.
+
+Each generator stage reserves cores before starting work: one for a strip or rsync
+process, as many as it can get for multithreaded stages like compression and
+hashing.  While one suite is importing or deduplicating, another can compress
+with the remaining cores, without the total ever exceeding the budget.
+Stages never hold more than one reservation at a time, so they can't deadlock.
+"""
+import os
+import threading
+import contextlib
+import logging
+logger = logging
+
+class JobScheduler():
+    """
+    A bounded pool of cores, reserved and released by generator stages
+    """
+
+    def __init__(self, cores=None):
+        self.cores = max(1, cores or os.cpu_count() or 1)
+        self.available = self.cores
+        self.condition = threading.Condition()
+
+    @contextlib.contextmanager
+    def reserve(self, wanted, minimum=None):
+        """
+        Reserve up to wanted cores, waiting until at least minimum (by default all wanted)
+        are free, and yield the number actually reserved
+        """
+        wanted = max(1, min(wanted, self.cores))
+        minimum = wanted if minimum is None else max(1, min(minimum, wanted))
+        with self.condition:
+            self.condition.wait_for(lambda: self.available >= minimum)
+            granted = min(wanted, self.available)
+            self.available -= granted
+        try:
+            yield granted
+        finally:
+            with self.condition:
+                self.available += granted
+                self.condition.notify_all()
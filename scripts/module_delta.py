@@ -0,0 +1,239 @@
+#!/usr/bin/python
+"""
+Publish and apply file-level deltas between two versions of a module.
+
+Patch versions of a suite, e.g. gcc_riscv_suite 15.2.0.0 and 15.2.0.1, usually differ
+in a handful of files.  The generator compares the manifests of the two versions and
+writes a delta tarball holding only the files and symbolic links that were added or
+changed, plus a json description of the delta: the paths removed, the directories and
+hard link topology of the new version, the integrity of both full tarballs, and the
+tar and compressor command lines that made the new tarball.
+
+Because module tarballs are reproducible, a client holding the base tarball can rebuild
+the new tarball byte for byte: extract the base, remove and replace files as the delta
+says, and recompress.  The result is checked against the new version's integrity, so
+it can be dropped into a Bazel --distdir, and only the delta is downloaded:
+
+    scripts/module_delta.py /opt/bazel/bzlmod/modules/gcc_riscv_suite/15.2.0.1/delta-from-15.2.0.0.json \\
+        ~/Downloads/gcc_riscv_suite-15.2.0.0.tar.xz ~/distdir
+
+Bazel's own source.json patches only apply unified text diffs, which can't express
+changes to binaries, so deltas are published alongside the registry entry instead.
+"""
+import os
+import sys
+import json
+import base64
+import shutil
+import hashlib
+import tempfile
+import argparse
+import subprocess
+import urllib.parse
+import urllib.request
+import concurrent.futures
+import logging
+from suite_manifest import Manifest
+logger = logging
+
+VERSION = 1
+
+def published_manifest(manifest, excluded, path):
+    """
+    A copy of a suite_manifest.Manifest, saved to path, listing only the files of the main
+    tarball: excluded holds collections of relative paths published in component modules.
+    Hard links are relinked to the first remaining path sharing their inode.
+    """
+    excluded = set().union(*excluded)
+    published = Manifest(path)
+    published.tarball = manifest.tarball
+    published.integrity = manifest.integrity
+    published.fingerprint = manifest.fingerprint
+    published.symlinks = {rel: link for rel, link in manifest.symlinks.items() if rel not in excluded}
+    leaders = {}
+    for rel in sorted(manifest.files):
+        if rel in excluded:
+            continue
+        entry = dict(manifest.files[rel])
+        group = entry["link"] or rel
+        entry["link"] = leaders.setdefault(group, rel)
+        if entry["link"] == rel:
+            entry["link"] = None
+        published.files[rel] = entry
+    return published
+
+def changed_paths(base, target):
+    """
+    The paths added or changed between two suite_manifest.Manifest objects, files and
+    symbolic links together, and the paths removed
+    """
+    changed = []
+    for rel, entry in target.files.items():
+        old = base.files.get(rel)
+        if old is None or (old["sha256"], old["mode"]) != (entry["sha256"], entry["mode"]):
+            changed.append(rel)
+    for rel, link in target.symlinks.items():
+        if base.symlinks.get(rel) != link:
+            changed.append(rel)
+    removed = [rel for rel in list(base.files) + list(base.symlinks)
+               if rel not in target.files and rel not in target.symlinks]
+    return sorted(changed), sorted(removed)
+
+def make_delta(base, target, root, delta_tarball, tar_options, compressor, target_name):
+    """
+    Write the delta tarball between the base and target manifests, taking changed files
+    from root, and return the json description of the delta.  tar_options and compressor
+    are the command line options and compressor that made the target tarball, target_name.
+    """
+    changed, removed = changed_paths(base, target)
+    directories = []
+    for dirpath, dirnames, _ in os.walk(root):
+        for name in dirnames:
+            path = os.path.join(dirpath, name)
+            if not os.path.islink(path):
+                directories.append(os.path.relpath(path, root))
+    with tempfile.NamedTemporaryFile("w", encoding="utf8", suffix=".files") as lf:
+        # directories are archived without their contents, so new empty ones are created too
+        lf.writelines(f"./{rel}\n" for rel in sorted(directories + changed))
+        lf.flush()
+        tar = ["tar", "cf", "-", "-C", root] + tar_options + ["--no-recursion", f"--files-from={lf.name}"]
+        delta_integrity = compress(tar, compressor, delta_tarball)
+    return {
+        "version": VERSION,
+        "base_integrity": base.integrity,
+        "target_integrity": target.integrity,
+        "target_tarball": target_name,
+        "delta_url": "file://" + delta_tarball,
+        "delta_integrity": delta_integrity,
+        "changed": changed,
+        "removed": removed,
+        "directories": sorted(directories),
+        "hard_links": {rel: entry["link"] for rel, entry in target.files.items() if entry["link"]},
+        "tar_options": tar_options,
+        "compressor": compressor,
+    }
+
+def compress(tar_command, compressor, path):
+    """
+    Pipe a tar command through a compressor into path, returning the SRI sha256 integrity
+    """
+    sha256 = hashlib.sha256()
+    with open(path, "wb") as tf:
+        tar = subprocess.Popen(tar_command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        compressing = subprocess.Popen(compressor, stdin=tar.stdout, stdout=subprocess.PIPE,
+                                       stderr=subprocess.PIPE)
+        tar.stdout.close()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as pool:
+            tar_err = pool.submit(tar.stderr.read)
+            compress_err = pool.submit(compressing.stderr.read)
+            while chunk := compressing.stdout.read(1 << 20):
+                sha256.update(chunk)
+                tf.write(chunk)
+            tar.wait()
+            compressing.wait()
+    if tar.returncode != 0 or compressing.returncode != 0:
+        raise RuntimeError("compression failed: " + tar_err.result().decode("utf8", "replace") +
+                           compress_err.result().decode("utf8", "replace"))
+    return "sha256-" + base64.b64encode(sha256.digest()).decode("ascii")
+
+def file_integrity(path):
+    """
+    The SRI sha256 integrity of a file
+    """
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1 << 20):
+            sha256.update(chunk)
+    return "sha256-" + base64.b64encode(sha256.digest()).decode("ascii")
+
+def apply_delta(delta, base_tarball, output_dir, delta_tarball=None):
+    """
+    Rebuild the target tarball described by a delta from the base tarball, writing it to
+    output_dir and returning its path.  delta_tarball is a local copy of the delta tarball,
+    otherwise it is fetched from the delta's URL.
+    """
+    if file_integrity(base_tarball) != delta["base_integrity"]:
+        raise ValueError(f"{base_tarball} is not the base version of this delta")
+    with tempfile.TemporaryDirectory() as workdir:
+        if delta_tarball is None:
+            delta_tarball = os.path.join(workdir, "delta")
+            with urllib.request.urlopen(delta["delta_url"]) as response, open(delta_tarball, "wb") as df:
+                shutil.copyfileobj(response, df)
+        if file_integrity(delta_tarball) != delta["delta_integrity"]:
+            raise ValueError(f"{delta_tarball} does not match the delta's integrity")
+        tree = os.path.join(workdir, "tree")
+        os.mkdir(tree)
+        subprocess.run(["tar", "xf", base_tarball, "-C", tree], check=True)
+        for rel in delta["removed"] + delta["changed"]:
+            path = os.path.join(tree, rel)
+            if os.path.lexists(path) and not (os.path.isdir(path) and not os.path.islink(path)):
+                os.remove(path)
+        directories = set(delta["directories"])
+        for dirpath, dirnames, _ in os.walk(tree, topdown=False):
+            for name in dirnames:
+                path = os.path.join(dirpath, name)
+                if not os.path.islink(path) and os.path.relpath(path, tree) not in directories:
+                    shutil.rmtree(path)
+        subprocess.run(["tar", "xf", delta_tarball, "-C", tree], check=True)
+        _restore_hard_links(tree, delta["hard_links"])
+        output = os.path.join(output_dir, delta["target_tarball"])
+        tar = ["tar", "cf", "-", "-C", tree] + delta["tar_options"] + ["."]
+        integrity = compress(tar, delta["compressor"], output + ".tmp")
+        if integrity != delta["target_integrity"]:
+            os.remove(output + ".tmp")
+            raise ValueError(f"rebuilt tarball has integrity {integrity}, not {delta['target_integrity']}; " +
+                             "the local tar or compressor differs from the generator's")
+        os.replace(output + ".tmp", output)
+    return output
+
+def _restore_hard_links(tree, hard_links):
+    """
+    Give the tree exactly the target's hard link topology: every path in hard_links is a
+    link to the path it names, and no other paths share an inode
+    """
+    leaders = {}
+    for dirpath, _, filenames in os.walk(tree):
+        for name in sorted(filenames):
+            path = os.path.join(dirpath, name)
+            if os.path.islink(path):
+                continue
+            rel = os.path.relpath(path, tree)
+            leader = hard_links.get(rel, rel)
+            st = os.stat(path)
+            inode = (st.st_dev, st.st_ino)
+            if leaders.setdefault(inode, leader) != leader:
+                # shares an inode with a file it isn't linked to in the target, so separate it
+                shutil.copy2(path, path + ".split")
+                os.replace(path + ".split", path)
+                st = os.stat(path)
+                leaders[(st.st_dev, st.st_ino)] = leader
+    for rel, leader in hard_links.items():
+        path, leader_path = os.path.join(tree, rel), os.path.join(tree, leader)
+        if not os.path.samefile(path, leader_path):
+            os.link(leader_path, path + ".link")
+            os.replace(path + ".link", path)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rebuild a module tarball from a base tarball and a delta")
+    parser.add_argument("delta", help="delta json file, delta-from-<base version>.json in the registry")
+    parser.add_argument("base_tarball", help="the base version's module tarball")
+    parser.add_argument("output_dir", help="directory receiving the rebuilt tarball, e.g. a Bazel --distdir")
+    parser.add_argument("--delta-tarball", help="local copy of the delta tarball")
+    args = parser.parse_args(argv)
+    with open(args.delta, encoding="utf8") as df:
+        delta = json.load(df)
+    if delta.get("version") != VERSION:
+        logger.error(f"unsupported delta version {delta.get('version')}")
+        sys.exit(1)
+    if args.delta_tarball is None and urllib.parse.urlparse(delta["delta_url"]).scheme == "file":
+        args.delta_tarball = urllib.parse.urlparse(delta["delta_url"]).path
+    try:
+        output = apply_delta(delta, args.base_tarball, args.output_dir, args.delta_tarball)
+    except (OSError, ValueError, RuntimeError, subprocess.CalledProcessError) as e:
+        logger.error(f"unable to apply delta: {e}")
+        sys.exit(1)
+    logger.info(f"rebuilt {output}")
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,151 @@
+"""
+Build precompiled headers for a module with the module's own C++ compiler.
+
+GCC looks for <header>.gch before <header> in each include directory, and when
+<header>.gch is a directory it uses the first precompiled header inside that was
+compiled with compatible options.  A module can therefore ship one variant per set of
+compile flags its toolchains use, say fastbuild, opt and dbg, for headers such as
+bits/stdc++.h:
+
+    {target}/include/c++/15.2.0/{target}/bits/stdc++.h
+    {target}/include/c++/15.2.0/{target}/bits/stdc++.h.gch/fastbuild.gch
+    {target}/include/c++/15.2.0/{target}/bits/stdc++.h.gch/opt.gch
+
+A variant is only used when the code generation options, -g level, -march and the
+macros defined ahead of the header match those it was compiled with, so each variant's
+flags repeat the C++ compile flags of the toolchain feature selecting it.  Compiling
+with -Winvalid-pch reports variants GCC rejects.
+
+Headers are compiled from the module root with relative include directories, and
+-fdebug-prefix-map maps any remaining absolute path to ".", so variants with debug
+information don't name the generating machine's module directory and work from
+wherever Bazel's sandbox places the module.
+
+GCC's precompiled headers are not reproducible, differing in a few bytes from one
+compilation to the next.  With a blob_store.BlobStore, variants are therefore stored
+by the contents of the compiler proper, the flags and the header's include closure,
+and later runs and suite versions link the stored variant rather than compiling anew.
+"""
+import os
+import hashlib
+import subprocess
+import concurrent.futures
+import logging
+from include_closure import parse_dependencies
+logger = logging
+
+class PrecompiledHeaders():
+    """
+    The precompiled header variants of headers found in a module's include directories
+    """
+
+    def __init__(self, root, include_dirs, tool_prefix=""):
+        """
+        include_dirs are relative to root and searched in order, as the toolchain's -isystem
+        options do
+        """
+        self.root = root
+        self.include_dirs = list(include_dirs)
+        self.tool_prefix = tool_prefix
+        # relative paths of the precompiled headers written, and those linked from a blob store
+        self.built = []
+        self.reused = []
+        # (header, variant) => compiler error output, for variants that failed to compile
+        self.failed = {}
+
+    def locate(self, header):
+        """
+        The relative path of the file an #include <header> reaches, or None
+        """
+        for include_dir in self.include_dirs:
+            rel = os.path.normpath(f"{include_dir}/{header}")
+            if os.path.isfile(f"{self.root}/{rel}"):
+                return rel
+        return None
+
+    def command(self, header_path, flags, output=None):
+        """
+        The command compiling a header into a precompiled header, or without an output,
+        listing the header's dependencies, run from the module root
+        """
+        compiler = f"{self.root}/bin/{self.tool_prefix}g++"
+        command = [compiler, "-x", "c++-header", "-nostdinc", "--sysroot=.", f"-fdebug-prefix-map={self.root}=."]
+        for include_dir in self.include_dirs:
+            command += ["-isystem", include_dir]
+        command += list(flags) + [header_path]
+        return command + (["-o", output] if output else ["-M"])
+
+    def compiler_proper(self):
+        """
+        The path of cc1plus, whose contents decide which precompiled headers it accepts
+        """
+        result = subprocess.run([f"{self.root}/bin/{self.tool_prefix}g++", "-print-prog-name=cc1plus"],
+                                capture_output=True, encoding="utf8")
+        path = result.stdout.strip()
+        return path if result.returncode == 0 and os.path.isabs(path) else f"{self.root}/bin/{self.tool_prefix}g++"
+
+    def closure_key(self, header_path, flags, store):
+        """
+        A blob store key from the contents of every file in a header's include closure, or
+        None if the dependencies can't be listed
+        """
+        result = subprocess.run(self.command(header_path, flags), capture_output=True, encoding="utf8",
+                                cwd=self.root)
+        if result.returncode != 0:
+            return None
+        sha256 = hashlib.sha256()
+        dependencies = parse_dependencies(result.stdout)[1:]
+        for path in sorted(set(os.path.normpath(os.path.join(self.root, p)) for p in dependencies)):
+            sha256.update(f"{os.path.relpath(path, self.root)}\0{store.source_key(path)}\n".encode("utf8"))
+        return sha256.hexdigest()
+
+    def build(self, headers, variants, jobs=1, store=None):
+        """
+        Compile every header with every (name, flags) variant into <header>.gch/<name>.gch,
+        replacing any earlier variants, and return the relative paths written.  Variants
+        found in a blob store are linked rather than compiled, and new ones are stored.
+        """
+        requests = []
+        for header in headers:
+            header_path = self.locate(header)
+            if header_path is None:
+                logger.warning(f"precompiled header {header} is not in the module's include directories")
+                continue
+            gch_dir = f"{header_path}.gch"
+            if os.path.isdir(f"{self.root}/{gch_dir}"):
+                for name in os.listdir(f"{self.root}/{gch_dir}"):
+                    os.remove(f"{self.root}/{gch_dir}/{name}")
+            os.makedirs(f"{self.root}/{gch_dir}", exist_ok=True)
+            for name, flags in variants:
+                requests.append((header, name, flags, header_path, f"{gch_dir}/{name}.gch"))
+        compiler = self.compiler_proper() if store is not None and requests else None
+
+        def make(request):
+            _, name, flags, header_path, rel = request
+            output = f"{self.root}/{rel}"
+            operation = key = None
+            if store is not None:
+                operation = store.operation(f"pch-{name}", compiler, *flags)
+                key = self.closure_key(header_path, flags, store)
+                if key and store.lookup(operation, key) is not None:
+                    store.link(operation, key, [output])
+                    return "reused", None
+            result = subprocess.run(self.command(header_path, flags, output), capture_output=True,
+                                    encoding="utf8", cwd=self.root)
+            if result.returncode != 0:
+                if os.path.exists(output):
+                    os.remove(output)
+                return "failed", result.stderr.strip()
+            if key:
+                store.put(operation, key, output)
+            return "built", None
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+            for (header, name, _, _, rel), (outcome, error) in zip(requests, pool.map(make, requests)):
+                if outcome == "failed":
+                    self.failed[(header, name)] = error
+                elif outcome == "reused":
+                    self.reused.append(rel)
+                else:
+                    self.built.append(rel)
+        return self.built + self.reused
@@ -0,0 +1,210 @@
+#!/usr/bin/python
+"""
+Serve the local Bazel module registry and its tarballs over HTTP.
+
+Build agents without access to /opt/bazel/bzlmod can use a registry served by this
+lightweight asyncio server, run on the machine generating the modules:
+
+    scripts/registry_server.py --port 8765
+
+    bazel build --registry=http://buildhost:8765 ...
+
+It serves bazel_registry.json, modules/ and tarballs/ below the registry root with
+ETag and Last-Modified validators, If-None-Match and single Range requests (so
+interrupted downloads resume, while requests for several ranges get the whole file, as
+RFC 9110 allows), and streams files with sendfile, so many agents can
+fetch multi-hundred-MB tarballs at once without copying them through Python.
+
+Paths may also carry the registry root's absolute path, as in
+/opt/bazel/bzlmod/tarballs/<tarball>: Bazel forms mirror URLs from the authority and
+path of each source URL, so listing the server in bazel_registry.json's mirrors also
+serves modules whose source.json still holds a file:// URL.
+"""
+import os
+import argparse
+import asyncio
+import email.utils
+import urllib.parse
+import logging
+from compiler_suite_generator import Generator
+logger = logging
+
+# top level entries of the registry root that are served
+SERVED = ("bazel_registry.json", "modules", "tarballs")
+# the longest request head accepted
+MAX_HEAD = 16384
+
+class RegistryServer():
+    """
+    An HTTP/1.1 server for the files of a registry directory
+    """
+
+    def __init__(self, root):
+        self.root = os.path.realpath(root)
+        self.requests = 0
+        self.bytes_sent = 0
+
+    def resolve(self, target):
+        """
+        The file a request target names, or None if it is outside the served directories
+        """
+        path = urllib.parse.unquote(urllib.parse.urlsplit(target).path)
+        path = os.path.normpath("/" + path.lstrip("/"))
+        if path.startswith(self.root + "/"):
+            path = path[len(self.root):]
+        rel = path.lstrip("/")
+        if rel.split("/", 1)[0] not in SERVED:
+            return None
+        full = os.path.realpath(os.path.join(self.root, rel))
+        if not full.startswith(self.root + "/") or not os.path.isfile(full):
+            return None
+        return full
+
+    async def handle(self, reader, writer):
+        """
+        Serve the requests of one connection until the client closes it
+        """
+        peer = writer.get_extra_info("peername")
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    return
+                keep_alive = await self._respond(head, writer, peer)
+                if not keep_alive:
+                    return
+        except ConnectionError:
+            return
+        finally:
+            writer.close()
+
+    async def _respond(self, head, writer, peer):
+        """
+        Answer a single request, returning whether the connection stays open
+        """
+        lines = head.decode("latin-1").split("\r\n")
+        try:
+            method, target, version = lines[0].split(" ")
+        except ValueError:
+            await self._send_status(writer, 400, "Bad Request", False)
+            return False
+        headers = {}
+        for line in lines[1:]:
+            name, _, value = line.partition(":")
+            if name:
+                headers[name.strip().lower()] = value.strip()
+        connection = headers.get("connection", "").lower()
+        keep_alive = connection != "close" if version == "HTTP/1.1" else connection == "keep-alive"
+        self.requests += 1
+        if method not in ("GET", "HEAD"):
+            await self._send_status(writer, 405, "Method Not Allowed", keep_alive, {"Allow": "GET, HEAD"})
+            return keep_alive
+        path = self.resolve(target)
+        if path is None:
+            logger.info(f"{peer[0] if peer else '-'} {method} {target} 404")
+            await self._send_status(writer, 404, "Not Found", keep_alive)
+            return keep_alive
+        st = os.stat(path)
+        etag = f'"{st.st_size:x}-{st.st_mtime_ns:x}"'
+        common = {
+            "ETag": etag,
+            "Last-Modified": email.utils.formatdate(st.st_mtime, usegmt=True),
+            "Accept-Ranges": "bytes",
+            "Content-Type": "application/json" if path.endswith(".json") else "application/octet-stream",
+        }
+        if etag in [tag.strip() for tag in headers.get("if-none-match", "").split(",")]:
+            await self._send_status(writer, 304, "Not Modified", keep_alive, common, body=False)
+            return keep_alive
+        start, end = 0, st.st_size - 1
+        status, reason = 200, "OK"
+        byte_range = headers.get("range")
+        # Bazel only ever asks for one range; several are answered with the whole file
+        if byte_range and "," not in byte_range and headers.get("if-range", etag) == etag:
+            parsed = parse_range(byte_range, st.st_size)
+            if parsed is None:
+                await self._send_status(writer, 416, "Range Not Satisfiable", keep_alive,
+                                        {"Content-Range": f"bytes */{st.st_size}"})
+                return keep_alive
+            start, end = parsed
+            status, reason = 206, "Partial Content"
+            common["Content-Range"] = f"bytes {start}-{end}/{st.st_size}"
+        count = max(0, end - start + 1)
+        common["Content-Length"] = str(count)
+        common["Connection"] = "keep-alive" if keep_alive else "close"
+        writer.write(_head(status, reason, common))
+        await writer.drain()
+        if method == "GET" and count:
+            with open(path, "rb") as f:
+                # sendfile where the transport supports it, otherwise buffered copies
+                await asyncio.get_running_loop().sendfile(writer.transport, f, start, count)
+            self.bytes_sent += count
+        logger.info(f"{peer[0] if peer else '-'} {method} {target} {status} {count}")
+        return keep_alive
+
+    async def _send_status(self, writer, status, reason, keep_alive, headers=None, body=True):
+        """
+        Send a response without file contents
+        """
+        headers = dict(headers or {})
+        text = f"{status} {reason}\n".encode("utf8") if body else b""
+        headers["Content-Length"] = str(len(text))
+        headers.setdefault("Content-Type", "text/plain")
+        headers["Connection"] = "keep-alive" if keep_alive else "close"
+        writer.write(_head(status, reason, headers) + text)
+        await writer.drain()
+
+def parse_range(value, size):
+    """
+    The inclusive (start, end) of a single "bytes=" range, or None if it can't be satisfied
+    """
+    unit, _, byte_range = value.partition("=")
+    if unit.strip() != "bytes" or not byte_range or "," in byte_range:
+        return None
+    first, _, last = byte_range.strip().partition("-")
+    try:
+        if not first:
+            # a suffix range, the last N bytes
+            length = int(last)
+            if length <= 0:
+                return None
+            return max(0, size - length), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start:
+        return None
+    return start, min(end, size - 1)
+
+def _head(status, reason, headers):
+    lines = [f"HTTP/1.1 {status} {reason}", f"Date: {email.utils.formatdate(usegmt=True)}",
+             "Server: bazel_compiler_modules registry_server"]
+    lines += [f"{name}: {value}" for name, value in headers.items()]
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+async def serve(root, host, port):
+    """
+    Serve a registry directory until cancelled
+    """
+    registry = RegistryServer(root)
+    server = await asyncio.start_server(registry.handle, host, port, limit=MAX_HEAD)
+    addresses = ", ".join(str(sock.getsockname()) for sock in server.sockets)
+    logger.info(f"serving {registry.root} on {addresses}")
+    async with server:
+        await server.serve_forever()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the local Bazel module registry over HTTP")
+    parser.add_argument("--root", default=Generator.BZLMOD_DIR, help="registry directory")
+    parser.add_argument("--host", default="0.0.0.0", help="address to listen on")
+    parser.add_argument("--port", type=int, default=8765, help="port to listen on")
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args.root, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,241 @@
+#!/usr/bin/python
+"""
+Seed Bazel repository caches with generated module tarballs, and prune stale suite versions.
+
+Bazel's repository cache (--repository_cache) stores downloads by content hash:
+
+    <cache>/content_addressable/sha256/<hex digest>/file
+
+A tarball placed there under the digest of its source.json integrity is never downloaded
+or checksummed again, so a fresh CI worker whose cache was seeded starts with warm
+toolchains.  When a download carries a canonical id, Bazel also wants a marker file
+id-<sha256 of the canonical id> next to the file; the URLs of the module's source.json,
+with and without the registry's mirrors, are recorded that way too.
+
+    scripts/repository_cache.py seed ~/.cache/bazel/_bazel_$USER/cache/repos/v1 gcc_riscv_suite@15.2.0.1
+    scripts/repository_cache.py prune ~/.cache/bazel/_bazel_$USER/cache/repos/v1 gcc_riscv_suite --keep 2
+
+Pruning only touches entries whose digest belongs to a version of the named modules in
+the local registry, or whose canonical ids name the URL of such a version while their
+digest no longer matches its source.json, as after a version was regenerated, so
+anything else Bazel cached stays.
+"""
+import os
+import sys
+import json
+import base64
+import shutil
+import hashlib
+import argparse
+import urllib.parse
+import logging
+from compiler_suite_generator import Generator
+logger = logging
+
+class RepositoryCache():
+    """
+    The content addressable part of a Bazel repository cache
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def entry_dir(self, digest):
+        """
+        The directory holding the file with a hex sha256 digest
+        """
+        return f"{self.root}/content_addressable/sha256/{digest}"
+
+    def contains(self, digest):
+        return os.path.exists(f"{self.entry_dir(digest)}/file")
+
+    def digests(self):
+        """
+        The hex sha256 digests of every entry
+        """
+        try:
+            return sorted(os.listdir(f"{self.root}/content_addressable/sha256"))
+        except OSError:
+            return []
+
+    def canonical_ids(self, digest):
+        """
+        The canonical ids recorded by the id- markers of an entry
+        """
+        entry = self.entry_dir(digest)
+        ids = []
+        for name in sorted(os.listdir(entry)) if os.path.isdir(entry) else []:
+            if name.startswith("id-"):
+                with open(f"{entry}/{name}", encoding="utf8") as mf:
+                    ids.append(mf.read())
+        return ids
+
+    def seed(self, tarball, integrity, ids=()):
+        """
+        Add a tarball under the digest of its SRI integrity, with a marker for each canonical
+        id, hard linking it when the cache shares the tarball's file system, returning False
+        if the cache already held it
+        """
+        digest = integrity_hex(integrity)
+        entry = self.entry_dir(digest)
+        os.makedirs(entry, exist_ok=True)
+        for canonical_id in ids:
+            marker = f"{entry}/id-{hashlib.sha256(canonical_id.encode('utf8')).hexdigest()}"
+            if not os.path.exists(marker):
+                with open(marker, "w", encoding="utf8") as mf:
+                    mf.write(canonical_id)
+        if self.contains(digest):
+            return False
+        tmp = f"{entry}/file.{os.getpid()}.tmp"
+        try:
+            os.link(tarball, tmp)
+        except OSError:
+            shutil.copyfile(tarball, tmp)
+        os.replace(tmp, f"{entry}/file")
+        return True
+
+    def remove(self, digest):
+        """
+        Remove the entry of a hex sha256 digest, returning the bytes freed
+        """
+        entry = self.entry_dir(digest)
+        if not os.path.isdir(entry):
+            return 0
+        freed = os.path.getsize(f"{entry}/file") if self.contains(digest) else 0
+        shutil.rmtree(entry)
+        return freed
+
+def integrity_hex(integrity):
+    """
+    The hex digest of an SRI "sha256-<base64>" integrity string
+    """
+    algorithm, _, value = integrity.partition("-")
+    if algorithm != "sha256":
+        raise ValueError(f"unsupported integrity algorithm {algorithm}")
+    return base64.b64decode(value).hex()
+
+def canonical_ids(url, mirrors):
+    """
+    The canonical ids Bazel may use for a source.json URL: the URL alone, and the URL
+    after the mirror URLs Bazel derives from the registry's mirrors
+    """
+    parsed = urllib.parse.urlsplit(url)
+    mirrored = [mirror.rstrip("/") + "/" + parsed.netloc + parsed.path for mirror in mirrors]
+    ids = [url]
+    if mirrored:
+        ids.append(" ".join(mirrored + [url]))
+    return ids
+
+def version_key(version):
+    """
+    Sort module versions numerically where they are numeric, e.g. 15.2.0.10 after 15.2.0.9
+    """
+    return [(0, int(part), "") if part.isdigit() else (1, 0, part) for part in version.split(".")]
+
+def registry_versions(module):
+    """
+    The versions of a module in the local registry, oldest first
+    """
+    module_dir = f"{Generator.MOD_DIR}/{module}"
+    if not os.path.isdir(module_dir):
+        return []
+    return sorted((v for v in os.listdir(module_dir) if os.path.exists(f"{module_dir}/{v}/source.json")),
+                  key=version_key)
+
+def registry_source(module, version):
+    """
+    The source.json of a module version in the local registry
+    """
+    with open(f"{Generator.MOD_DIR}/{module}/{version}/source.json", encoding="utf8") as sf:
+        return json.load(sf)
+
+def registry_mirrors():
+    """
+    The mirrors listed in the local registry's bazel_registry.json
+    """
+    try:
+        with open(f"{Generator.BZLMOD_DIR}/bazel_registry.json", encoding="utf8") as cf:
+            return json.load(cf).get("mirrors", [])
+    except (OSError, ValueError):
+        return []
+
+def seed_version(caches, module, version):
+    """
+    Seed every cache with the tarball of a module version in the local registry,
+    returning the number of caches that didn't hold it yet
+    """
+    source = registry_source(module, version)
+    name = urllib.parse.unquote(os.path.basename(urllib.parse.urlsplit(source["url"]).path))
+    tarball = f"{Generator.TARBALL_DIR}/{name}"
+    ids = canonical_ids(source["url"], registry_mirrors())
+    added = 0
+    for cache in caches:
+        if cache.seed(tarball, source["integrity"], ids):
+            added += 1
+            logger.info(f"seeded {cache.root} with {module} {version}")
+    return added
+
+def prune(caches, modules, keep):
+    """
+    Remove all but the keep most recent registry versions of each module from the caches,
+    and entries downloaded from a registry version's URL whose digest no longer matches
+    its source.json, returning the bytes freed
+    """
+    freed = 0
+    for module in modules:
+        versions = registry_versions(module)
+        sources = {version: registry_source(module, version) for version in versions}
+        stale = versions[:-keep] if keep else versions
+        for version in stale:
+            digest = integrity_hex(sources[version]["integrity"])
+            for cache in caches:
+                removed = cache.remove(digest)
+                if removed:
+                    logger.info(f"removed {module} {version} from {cache.root}")
+                freed += removed
+        current = {integrity_hex(source["integrity"]) for source in sources.values()}
+        urls = {source["url"]: version for version, source in sources.items()}
+        for cache in caches:
+            for digest in cache.digests():
+                if digest in current:
+                    continue
+                # a canonical id ends with the source.json URL, after any mirror URLs
+                owners = [urls[url] for url in (i.split()[-1] for i in cache.canonical_ids(digest) if i.strip())
+                          if url in urls]
+                if owners:
+                    freed += cache.remove(digest)
+                    logger.info(f"removed a superseded {module} {owners[0]} from {cache.root}")
+    return freed
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Seed and prune Bazel repository caches")
+    commands = parser.add_subparsers(dest="command", required=True)
+    seed_parser = commands.add_parser("seed", help="add module versions from the local registry")
+    seed_parser.add_argument("cache", help="repository cache directory, as given to --repository_cache")
+    seed_parser.add_argument("modules", nargs="+", metavar="NAME[@VERSION]",
+                             help="modules to add, by default their latest version")
+    prune_parser = commands.add_parser("prune", help="remove stale module versions")
+    prune_parser.add_argument("cache", help="repository cache directory, as given to --repository_cache")
+    prune_parser.add_argument("modules", nargs="+", metavar="NAME")
+    prune_parser.add_argument("--keep", type=int, default=1, help="most recent versions to keep")
+    args = parser.parse_args(argv)
+    caches = [RepositoryCache(args.cache)]
+    try:
+        if args.command == "seed":
+            for entry in args.modules:
+                module, _, version = entry.partition("@")
+                versions = [version] if version else registry_versions(module)[-1:]
+                if not versions:
+                    logger.error(f"{module} is not in the registry {Generator.MOD_DIR}")
+                    sys.exit(1)
+                seed_version(caches, module, versions[0])
+        else:
+            freed = prune(caches, args.modules, args.keep)
+            logger.info(f"freed {freed} bytes")
+    except (OSError, ValueError, KeyError) as e:
+        logger.error(f"unable to update {args.cache}: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
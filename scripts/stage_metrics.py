@@ -0,0 +1,130 @@
+"""
+Measure each stage of the generator pipeline.
+
+Every instrumented stage records wall and CPU time (including child processes such
+as strip, rsync, tar and the compressors), the number of files and bytes in the
+module source directory before and after the stage, and any stage-specific values
+like the bytes saved by stripping or the compression ratio.  The records are
+written as a json report next to the module's source.json, so regeneration costs
+can be compared across GCC versions.
+
+File and byte counts normally come from the generator's shared tree scan.  Stages that
+run before there is one, cleaning and importing, are instrumented with walk=True and
+walk the tree themselves instead.
+
+CPU time comes from getrusage, which only measures the whole process.  When several
+generators run in one process, as generate_suites.py does with concurrent suites, each
+stage would also count the others' work, so CPU time is then left out of the report.
+"""
+import os
+import json
+import stat
+import time
+import resource
+import datetime
+import functools
+import contextlib
+
+class StageMetrics():
+    """
+    Timing and size records for the stages run over a module source directory
+    """
+
+    def __init__(self, root, sizer=None):
+        self.root = root
+        # returns the (files, bytes) of the tree, or None when they are unknown, by default walking it
+        self.sizer = sizer or (lambda: tree_size(root))
+        self.stages = []
+        # the record of the stage currently running, if any
+        self.current = None
+        # record process-wide CPU time, only meaningful while no other generator runs in the process
+        self.process_cpu = True
+
+    @contextlib.contextmanager
+    def stage(self, name, walk=False):
+        """
+        Measure the enclosed block as a pipeline stage, yielding its record.  With walk, the
+        tree is walked for its size whenever the sizer doesn't know it.
+        """
+        record = {"stage": name}
+        self._sample(record, "before", walk)
+        outer = self.current
+        self.current = record
+        wall = time.perf_counter()
+        cpu = cpu_time() if self.process_cpu else None
+        try:
+            yield record
+        finally:
+            record["wall_s"] = round(time.perf_counter() - wall, 3)
+            if cpu is not None:
+                record["cpu_s"] = round(cpu_time() - cpu, 3)
+            self._sample(record, "after", walk)
+            self.current = outer
+            self.stages.append(record)
+
+    def _sample(self, record, when, walk=False):
+        """
+        Add the files and bytes of the tree to a record, if they are known or walk is set
+        """
+        size = self.sizer()
+        if size is None and walk:
+            size = tree_size(self.root)
+        if size is not None:
+            record[f"files_{when}"], record[f"bytes_{when}"] = size
+
+    def note(self, **values):
+        """
+        Add stage-specific values, e.g. files=12 or bytes_saved=4096, to the current stage
+        """
+        if self.current is not None:
+            self.current.update(values)
+
+    def write(self, path, **extra):
+        """
+        Write the json report of all stages recorded so far
+        """
+        report = dict(extra)
+        report["generated"] = datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds")
+        report["stages"] = self.stages
+        report["total_wall_s"] = round(sum(s["wall_s"] for s in self.stages), 3)
+        if all("cpu_s" in s for s in self.stages):
+            report["total_cpu_s"] = round(sum(s["cpu_s"] for s in self.stages), 3)
+        with open(path, "w", encoding="utf8") as rf:
+            json.dump(report, rf, indent=4)
+            rf.write("\n")
+
+def instrumented(name, walk=False):
+    """
+    Decorate a Generator method so it runs as a measured stage of self.metrics
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with self.metrics.stage(name, walk):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+def cpu_time():
+    """
+    User plus system time of this process and its terminated children
+    """
+    usage = 0.0
+    for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN):
+        ru = resource.getrusage(who)
+        usage += ru.ru_utime + ru.ru_stime
+    return usage
+
+def tree_size(root):
+    """
+    The number of regular files under root and their total size, counting hard links once
+    """
+    files = 0
+    inodes = {}
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            st = os.lstat(os.path.join(dirpath, name))
+            if stat.S_ISREG(st.st_mode):
+                files += 1
+                inodes[(st.st_dev, st.st_ino)] = st.st_size
+    return files, sum(inodes.values())
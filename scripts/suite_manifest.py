@@ -0,0 +1,191 @@
+"""
+Track the state of a module source directory between generator runs.
+
+The manifest records, for every file imported into `src/<module>`:
+
+* size, modification time and mode
+* the sha256 content hash
+* the hard link topology, as the first path sharing the same inode
+* whether and how the file was stripped, along with the size and modification time
+  of the unstripped source file it came from
+* the size and modification time of the source file it was imported from, if the
+  native import engine imported it
+* hard links the generator added after importing files
+* a hash of the settings the module's BUILD file was generated from
+
+plus a fingerprint of the whole tree and the tarball and digest generated from it.
+An incremental generator run uses this to avoid restripping, rededuplicating, or
+recompressing files that have not changed.
+"""
+import os
+import json
+import stat
+import hashlib
+import logging
+import concurrent.futures
+logger = logging
+
+class Manifest():
+    """
+    Per-file hashes, stripped state and link topology of a module source directory
+    """
+    VERSION = 1
+
+    def __init__(self, path):
+        """
+        path is the json file holding the manifest, normally src/<module>.manifest.json
+        """
+        self.path = path
+        # relative path => dict of file attributes
+        self.files = {}
+        # relative path => symbolic link target
+        self.symlinks = {}
+        # hard links added by the generator, destination => source relative path
+        self.added_links = {}
+        self.fingerprint = ""
+        self.tarball = ""
+        self.integrity = ""
+        # component name => {"tarball": ..., "integrity": ...} of the split component archives
+        self.components = {}
+        # hash of the settings the BUILD file was written from
+        self.build_inputs = ""
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load a previously saved manifest, returning an empty manifest if there is none
+        or if it was written by an incompatible generator
+        """
+        manifest = cls(path)
+        if not os.path.exists(path):
+            return manifest
+        with open(path, encoding="utf8") as mf:
+            data = json.load(mf)
+        if data.get("version") != cls.VERSION:
+            logger.warning(f"ignoring manifest {path} with unsupported version {data.get('version')}")
+            return manifest
+        manifest.files = data["files"]
+        manifest.symlinks = data["symlinks"]
+        manifest.added_links = data["added_links"]
+        manifest.fingerprint = data["fingerprint"]
+        manifest.tarball = data["tarball"]
+        manifest.integrity = data["integrity"]
+        manifest.components = data.get("components", {})
+        manifest.build_inputs = data.get("build_inputs", "")
+        return manifest
+
+    def save(self):
+        """
+        Write the manifest, replacing any previous version atomically
+        """
+        data = {
+            "version": self.VERSION,
+            "fingerprint": self.fingerprint,
+            "tarball": self.tarball,
+            "integrity": self.integrity,
+            "components": self.components,
+            "files": self.files,
+            "symlinks": self.symlinks,
+            "added_links": self.added_links,
+            "build_inputs": self.build_inputs,
+        }
+        with open(self.path + ".tmp", "w", encoding="utf8") as mf:
+            json.dump(data, mf, indent=1, sort_keys=True)
+        os.replace(self.path + ".tmp", self.path)
+
+    def scan(self, root, previous=None, stripped=None, jobs=1, known_hashes=None, tree=None, sources=None):
+        """
+        Record the current state of the tree under root.  Content hashes are reused from
+        known_hashes, keyed by (st_dev, st_ino) and trusted to match the files' current
+        contents, or from the previous manifest when a file's size and modification time
+        are unchanged.  stripped maps relative paths to their stripped state.  tree is an
+        optional tree_scan.TreeScan of root, supplying the stat results and the cached
+        hashes still valid for them instead of walking the tree again; pass hashes known
+        elsewhere through its add_hashes() rather than known_hashes.  sources maps relative
+        paths to the (size, mtime_ns) of the source files they were imported from.
+        """
+        previous = previous or Manifest(self.path)
+        stripped = stripped or {}
+        sources = sources or {}
+        known_hashes = known_hashes or {}
+        self.files = {}
+        self.symlinks = {}
+        inodes = {}
+        to_hash = []
+        if tree is not None:
+            known_hashes = {**known_hashes, **tree.known_hashes()}
+            hash_file = tree.sha256
+        else:
+            hash_file = lambda rel: file_sha256(os.path.join(root, rel))
+        for rel, st in (tree.ordered() if tree is not None else walk(root)):
+            if stat.S_ISLNK(st.st_mode):
+                self.symlinks[rel] = os.readlink(os.path.join(root, rel))
+                continue
+            if not stat.S_ISREG(st.st_mode):
+                continue
+            entry = {
+                "size": st.st_size,
+                "mtime_ns": st.st_mtime_ns,
+                "mode": stat.S_IMODE(st.st_mode),
+                "link": inodes.setdefault((st.st_dev, st.st_ino), rel),
+                "stripped": stripped.get(rel),
+                "source": list(sources[rel]) if rel in sources else None,
+            }
+            if entry["link"] == rel:
+                entry["link"] = None
+            old = previous.files.get(rel)
+            if (st.st_dev, st.st_ino) in known_hashes:
+                entry["sha256"] = known_hashes[(st.st_dev, st.st_ino)]
+            elif old and old["size"] == st.st_size and old["mtime_ns"] == st.st_mtime_ns:
+                entry["sha256"] = old["sha256"]
+            elif entry["link"]:
+                # a hard link has the same content as the first path sharing its inode
+                entry["sha256"] = None
+            else:
+                to_hash.append(rel)
+            self.files[rel] = entry
+        with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as pool:
+            for rel, digest in zip(to_hash, pool.map(hash_file, to_hash)):
+                self.files[rel]["sha256"] = digest
+        for entry in self.files.values():
+            if entry["link"]:
+                entry["sha256"] = self.files[entry["link"]]["sha256"]
+        logger.info(f"scanned {len(self.files)} files under {root}, hashing {len(to_hash)} of them")
+
+    def compute_fingerprint(self, *extra):
+        """
+        Hash the tree contents, permissions, link topology and any extra settings
+        affecting the generated tarball, like the compression backend
+        """
+        sha256 = hashlib.sha256()
+        for value in extra:
+            sha256.update(f"{value}\0".encode("utf8"))
+        for rel in sorted(self.files):
+            entry = self.files[rel]
+            sha256.update(f"f\0{rel}\0{entry['sha256']}\0{entry['mode']}\0{entry['link']}\0".encode("utf8"))
+        for rel in sorted(self.symlinks):
+            sha256.update(f"l\0{rel}\0{self.symlinks[rel]}\0".encode("utf8"))
+        self.fingerprint = sha256.hexdigest()
+        return self.fingerprint
+
+def walk(root):
+    """
+    Yield the relative path and lstat result of every file, symbolic link and linked
+    directory under root, directories in sorted order and each directory's entries before
+    its subdirectories - the order manifests record files in
+    """
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames) + [d for d in dirnames if os.path.islink(os.path.join(dirpath, d))]:
+            full = os.path.join(dirpath, name)
+            yield os.path.relpath(full, root), os.lstat(full)
+
+def file_sha256(path):
+    """
+    The hex sha256 digest of a file
+    """
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1 << 20):
+            sha256.update(chunk)
+    return sha256.hexdigest()
@@ -0,0 +1,176 @@
+"""
+Load declarative compiler suite specifications.
+
+A suite specification is a TOML file (see suites/*.toml) describing what goes into a
+module: the module name and version, the compiler target, the installation directory
+to import from, the rsync filter rules selecting files, the host and target strip
+lists, the ELF pruning roots, the header corpus for include closure analysis, the
+precompiled header variants, any hard links to add, and the components published as
+separate modules.  String values may refer to the file's scalar settings as {name},
+for instance {gcc_version} or {target}.
+
+A file may describe several suites with [[suite]] tables.  Top level settings then
+act as defaults for every [[suite]] table, so GCC 14 and 15 variants of the same
+architecture can share their rules:
+
+    gcc_version = "15.2.0"
+    import = '''...'''
+
+    [[suite]]
+    name = "gcc_riscv_suite"
+    version = "15.2.0.1"
+
+    [[suite]]
+    name = "gcc_riscv_suite"
+    version = "14.3.0.0"
+    gcc_version = "14.3.0"
+"""
+import os
+import re
+import tomllib
+
+class SpecError(Exception):
+    """
+    A suite specification is incomplete or malformed
+    """
+
+class SuiteSpec():
+    """
+    The settings of one compiler suite module
+    """
+    REQUIRED = ("name", "version", "target", "sysroot", "import")
+    # optional settings and their defaults
+    DEFAULTS = {
+        "gcc_version": "",
+        "tool_prefix": "",
+        "target_strip_prefix": "",
+        "strip": "",
+        "strip_target": "",
+        "strip_auto": False,
+        "strip_exclude": "",
+        "prune_roots": "",
+        "prune_remove": False,
+        "links": [],
+        "include_dirs": "",
+        "header_corpus": "",
+        "header_flags": "",
+        "header_keep": "",
+        "header_prune_remove": False,
+        "pch_headers": "",
+        "pch_variants": [],
+        "components": {},
+        "split_debug": False,
+        "delta_base": "",
+        "compression": "xz",
+        "compression_level": None,
+        "long_range": False,
+        "reproducible": True,
+    }
+
+    def __init__(self, fields, source):
+        """
+        fields is the merged table of settings, source names the file they came from
+        """
+        self.source = source
+        # relative header corpus paths are relative to the specification file
+        base_dir = os.path.dirname(os.path.abspath(source.split("[")[0]))
+        missing = [key for key in self.REQUIRED if key not in fields]
+        if missing:
+            raise SpecError(f"{source}: suite is missing required settings {', '.join(missing)}")
+        unknown = set(fields) - set(self.REQUIRED) - set(self.DEFAULTS)
+        if unknown:
+            raise SpecError(f"{source}: unknown suite settings {', '.join(sorted(unknown))}")
+        fields = {**self.DEFAULTS, **fields}
+        variables = _resolve_variables(fields, source)
+        values = {key: _expand(value, variables, source) for key, value in fields.items()}
+        self.name = values["name"]
+        self.version = values["version"]
+        self.target = values["target"]
+        self.gcc_version = values["gcc_version"]
+        self.tool_prefix = values["tool_prefix"]
+        self.sysroot = values["sysroot"]
+        self.target_strip_prefix = values["target_strip_prefix"]
+        self.import_rules = values["import"]
+        self.strip = values["strip"]
+        self.strip_target = values["strip_target"]
+        self.prune_roots = values["prune_roots"]
+        self.prune_remove = values["prune_remove"]
+        self.links = [tuple(link) for link in values["links"]]
+        self.include_dirs = values["include_dirs"]
+        self.header_corpus = [entry if entry.startswith("<") else os.path.join(base_dir, entry)
+                              for entry in values["header_corpus"].split()]
+        self.header_flags = values["header_flags"].split()
+        self.header_keep = values["header_keep"]
+        self.header_prune_remove = values["header_prune_remove"]
+        # (variant name, flags) precompiled header variants of the pch_headers
+        self.pch_headers = values["pch_headers"]
+        self.pch_variants = []
+        for variant in values["pch_variants"]:
+            if len(variant) != 2 or not re.fullmatch(r"[A-Za-z0-9_.+-]+", variant[0]):
+                raise SpecError(f"{source}: precompiled header variant {variant!r} is not a [name, flags] pair")
+            self.pch_variants.append((variant[0], variant[1].split()))
+        # component name => multiline string of path patterns selecting its files
+        self.components = values["components"]
+        for component in self.components:
+            if not re.fullmatch(r"[a-z][a-z0-9_]*", component):
+                raise SpecError(f"{source}: component name {component!r} is not a valid module name suffix")
+            if component == "debug":
+                raise SpecError(f"{source}: the debug component is reserved for split_debug")
+        self.split_debug = values["split_debug"]
+        self.delta_base = values["delta_base"]
+        self.strip_auto = values["strip_auto"]
+        self.strip_exclude = values["strip_exclude"]
+        self.compression = values["compression"]
+        self.compression_level = values["compression_level"]
+        self.long_range = values["long_range"]
+        self.reproducible = values["reproducible"]
+
+    def __repr__(self):
+        return f"SuiteSpec({self.name} {self.version} from {self.source})"
+
+def load_specs(path):
+    """
+    Load every suite described in a TOML specification file
+    """
+    with open(path, "rb") as sf:
+        try:
+            data = tomllib.load(sf)
+        except tomllib.TOMLDecodeError as e:
+            raise SpecError(f"{path}: {e}") from e
+    suites = data.pop("suite", None)
+    if suites is None:
+        return [SuiteSpec(data, path)]
+    return [SuiteSpec({**data, **suite}, f"{path}[{i}]") for i, suite in enumerate(suites)]
+
+def _resolve_variables(fields, source):
+    """
+    Expand the scalar settings, which may themselves refer to other scalar settings
+    """
+    variables = {key: value for key, value in fields.items() if isinstance(value, str)}
+    for _ in range(len(variables)):
+        expanded = {key: _expand(value, variables, source) for key, value in variables.items()}
+        if expanded == variables:
+            break
+        variables = expanded
+    return variables
+
+def _expand(value, variables, source):
+    """
+    Substitute {name} references in strings, including strings nested in lists and tables
+    """
+    if isinstance(value, str):
+        try:
+            return value.format_map(variables)
+        except (KeyError, ValueError, IndexError) as e:
+            raise SpecError(f"{source}: can't expand {value!r}: {e}") from e
+    if isinstance(value, list):
+        return [_expand(item, variables, source) for item in value]
+    if isinstance(value, dict):
+        return {key: _expand(item, variables, source) for key, item in value.items()}
+    return value
+
+def spec_dir():
+    """
+    The directory holding the suite specifications shipped with this project
+    """
+    return os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "suites")
@@ -0,0 +1,358 @@
+#!/usr/bin/python
+"""
+Index the contents of module tarballs, and check archives and module trees against the index.
+
+The generator feeds the uncompressed tar stream of every tarball through a TarIndexer on
+its way to the compressor, and writes a sidecar index next to the tarball,
+<tarball>.index.json, listing for every archive member
+
+* path, type (file, hardlink, symlink or directory), size and permission bits
+* the sha256 of the member's contents, taken from the stream itself
+* the link target of hard and symbolic links
+* offset, the position of the member's header in the uncompressed tar stream, with its
+  data starting 512 bytes later
+* stripped, the kind of strip applied ("host" or "target") or null
+
+plus the paths of the module source directory left out of the tarball because they are
+published in component modules, by component module name.
+
+Questions about a tarball then need no decompression:
+
+    scripts/tarball_index.py query /opt/bazel/bzlmod/tarballs/gcc_riscv_suite-15.2.0.1.tar.xz '*/crt1.o' '*/cc1'
+
+and a module source directory can be checked for drift against its tarball, hashing only
+the files named, or every file with --full:
+
+    scripts/tarball_index.py verify-tree /opt/bazel/bzlmod/tarballs/gcc_riscv_suite-15.2.0.1.tar.xz \\
+        src/gcc_riscv_suite 'bin/*'
+
+verify-tarball decompresses the tarball once, checking its integrity and every member
+against the index.
+"""
+import os
+import sys
+import json
+import stat
+import base64
+import fnmatch
+import hashlib
+import argparse
+import subprocess
+import logging
+from suite_manifest import file_sha256
+logger = logging
+
+VERSION = 1
+BLOCK = 512
+# decompressors by tarball suffix
+DECOMPRESSORS = {
+    ".xz": ["xz", "-dc"],
+    ".zst": ["zstd", "-dcq", "--long=31"],
+    ".gz": ["gzip", "-dc"],
+}
+
+class TarIndexer():
+    """
+    Incrementally parse a GNU or POSIX tar stream, hashing member contents as they pass
+    """
+
+    def __init__(self):
+        # archive path => entry dict
+        self.entries = {}
+        self.position = 0
+        self.header = bytearray()
+        self.header_offset = 0
+        self.data_left = 0
+        self.pad_left = 0
+        self.padding = 0
+        # the member whose data is being read, and its hash or collected metadata payload
+        self.current = None
+        self.sha256 = None
+        self.payload = None
+        # GNU long name and long link name, or pax path and linkpath, for the next member
+        self.long_name = None
+        self.long_link = None
+        self.zero_blocks = 0
+
+    def feed(self, data):
+        """
+        Parse the next chunk of the tar stream
+        """
+        view = memoryview(data)
+        i = 0
+        while i < len(view):
+            if self.data_left:
+                n = min(self.data_left, len(view) - i)
+                if self.payload is not None:
+                    self.payload += view[i:i + n]
+                else:
+                    self.sha256.update(view[i:i + n])
+                self.data_left -= n
+                if not self.data_left:
+                    self._finish_member()
+            elif self.pad_left:
+                n = min(self.pad_left, len(view) - i)
+                self.pad_left -= n
+            elif self.zero_blocks >= 2:
+                # trailing blocks after the end of archive marker
+                n = len(view) - i
+            else:
+                if not self.header:
+                    self.header_offset = self.position
+                n = min(BLOCK - len(self.header), len(view) - i)
+                self.header += view[i:i + n]
+                if len(self.header) == BLOCK:
+                    header = bytes(self.header)
+                    self.header.clear()
+                    self._parse_header(header)
+            i += n
+            self.position += n
+
+    def _parse_header(self, header):
+        if not any(header):
+            self.zero_blocks += 1
+            return
+        self.zero_blocks = 0
+        size = _number(header[124:136])
+        flag = chr(header[156]) if header[156] else "0"
+        self.data_left = size
+        self.padding = -size % BLOCK
+        if flag in "LKxg":
+            # GNU long names and pax headers describe the next member
+            self.current = {"type": flag}
+            self.payload = bytearray()
+        else:
+            name = self.long_name or _string(header[0:100])
+            if header[257:263] == b"ustar\0" and header[345] and not self.long_name:
+                name = _string(header[345:500]) + "/" + name
+            link = self.long_link or _string(header[157:257])
+            self.long_name = self.long_link = None
+            path = os.path.normpath(name)
+            entry = {"path": path, "mode": _number(header[100:108]) & 0o7777, "offset": self.header_offset,
+                     "size": size, "sha256": None, "link": None}
+            if flag in "07":
+                entry["type"] = "file"
+                self.sha256 = hashlib.sha256()
+            elif flag == "1":
+                entry["type"] = "hardlink"
+                entry["link"] = os.path.normpath(link)
+                target = self.entries.get(entry["link"], {})
+                entry["size"], entry["sha256"] = target.get("size", 0), target.get("sha256")
+            elif flag == "2":
+                entry["type"] = "symlink"
+                entry["link"] = link
+            elif flag == "5":
+                entry["type"] = "directory"
+            else:
+                entry["type"] = f"type-{flag}"
+            self.current = entry
+            self.payload = None
+            if path != ".":
+                self.entries[path] = entry
+        if not self.data_left:
+            self._finish_member()
+
+    def _finish_member(self):
+        entry = self.current
+        if self.payload is not None:
+            payload = bytes(self.payload)
+            if entry["type"] == "L":
+                self.long_name = _string(payload)
+            elif entry["type"] == "K":
+                self.long_link = _string(payload)
+            elif entry["type"] == "x":
+                records = _pax_records(payload)
+                self.long_name = records.get("path", self.long_name)
+                self.long_link = records.get("linkpath", self.long_link)
+            self.payload = None
+        elif entry["type"] == "file":
+            entry["sha256"] = self.sha256.hexdigest()
+        self.pad_left = self.padding
+
+    def index(self, integrity, stripped=None, components=None):
+        """
+        The index of the parsed archive, its entries annotated with their stripped state.
+        components maps component module names to the relative paths split into them.
+        """
+        stripped = stripped or {}
+        entries = []
+        for path in sorted(self.entries):
+            entry = dict(self.entries[path])
+            state = stripped.get(path)
+            entry["stripped"] = state["kind"] if state else None
+            entries.append(entry)
+        return {"version": VERSION, "integrity": integrity, "entries": entries,
+                "components": {module: sorted(paths) for module, paths in (components or {}).items()}}
+
+def _number(field):
+    """
+    A tar header number, in octal or GNU base-256
+    """
+    if field[0] & 0x80:
+        return int.from_bytes(field[1:], "big")
+    digits = field.strip(b"\0 ")
+    return int(digits, 8) if digits else 0
+
+def _string(field):
+    return bytes(field).split(b"\0", 1)[0].decode("utf8", "surrogateescape")
+
+def _pax_records(payload):
+    """
+    The key=value records of a pax extended header
+    """
+    records = {}
+    position = 0
+    while position < len(payload):
+        space = payload.index(b" ", position)
+        length = int(payload[position:space])
+        key, _, value = payload[space + 1:position + length - 1].partition(b"=")
+        records[key.decode("utf8")] = value.decode("utf8", "surrogateescape")
+        position += length
+    return records
+
+def index_path(tarball):
+    """
+    The sidecar index file of a tarball
+    """
+    return tarball + ".index.json"
+
+def save(index, tarball):
+    """
+    Write a tarball's sidecar index
+    """
+    path = index_path(tarball)
+    with open(path + ".tmp", "w", encoding="utf8") as jf:
+        json.dump(index, jf, indent=0, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+def load(tarball):
+    """
+    Load a tarball's sidecar index
+    """
+    with open(index_path(tarball), encoding="utf8") as jf:
+        index = json.load(jf)
+    if index.get("version") != VERSION:
+        raise ValueError(f"{index_path(tarball)} has unsupported version {index.get('version')}")
+    return index
+
+def query(index, patterns):
+    """
+    The entries whose path matches any fnmatch pattern
+    """
+    return [entry for entry in index["entries"]
+            if any(fnmatch.fnmatch(entry["path"], pattern) for pattern in patterns)]
+
+def verify_tree(index, root, patterns=(), full=False):
+    """
+    Compare a module tree with a tarball index, returning a list of differences.  Paths,
+    types, sizes and link targets are always compared; contents are hashed for files
+    matching patterns, or for every file when full is set.  Paths published in component
+    modules are expected in the tree but not in the tarball.
+    """
+    problems = []
+    expected = {entry["path"]: entry for entry in index["entries"]}
+    split = set()
+    for paths in index.get("components", {}).values():
+        split.update(paths)
+    found = set()
+    for dirpath, dirnames, filenames in os.walk(root):
+        for name in dirnames + filenames:
+            found.add(os.path.relpath(os.path.join(dirpath, name), root))
+    for path in sorted(found - set(expected) - split):
+        problems.append(f"{path}: not in the tarball")
+    for path, entry in sorted(expected.items()):
+        full_path = os.path.join(root, path)
+        try:
+            st = os.lstat(full_path)
+        except OSError:
+            problems.append(f"{path}: missing from {root}")
+            continue
+        if entry["type"] == "symlink":
+            if not stat.S_ISLNK(st.st_mode) or os.readlink(full_path) != entry["link"]:
+                problems.append(f"{path}: not a symbolic link to {entry['link']}")
+        elif entry["type"] == "directory":
+            if not stat.S_ISDIR(st.st_mode):
+                problems.append(f"{path}: not a directory")
+        elif not stat.S_ISREG(st.st_mode):
+            problems.append(f"{path}: not a regular file")
+        elif st.st_size != entry["size"]:
+            problems.append(f"{path}: size {st.st_size}, expected {entry['size']}")
+        elif (full or any(fnmatch.fnmatch(path, p) for p in patterns)) and file_sha256(full_path) != entry["sha256"]:
+            problems.append(f"{path}: contents differ")
+    return problems
+
+def verify_tarball(index, tarball):
+    """
+    Decompress a tarball once, comparing its integrity and members with its index,
+    returning a list of differences
+    """
+    suffix = os.path.splitext(tarball)[1]
+    if suffix not in DECOMPRESSORS:
+        return [f"{tarball}: unknown compression suffix {suffix}"]
+    indexer = TarIndexer()
+    with open(tarball, "rb") as tf:
+        decompress = subprocess.Popen(DECOMPRESSORS[suffix], stdin=tf, stdout=subprocess.PIPE)
+        while chunk := decompress.stdout.read(1 << 20):
+            indexer.feed(chunk)
+        decompress.wait()
+    sha256 = hashlib.sha256()
+    with open(tarball, "rb") as tf:
+        while chunk := tf.read(1 << 20):
+            sha256.update(chunk)
+    problems = []
+    if decompress.returncode != 0:
+        problems.append(f"{tarball}: decompression failed")
+    integrity = "sha256-" + base64.b64encode(sha256.digest()).decode("ascii")
+    if integrity != index["integrity"]:
+        problems.append(f"{tarball}: integrity {integrity}, expected {index['integrity']}")
+    found = indexer.index(integrity)["entries"]
+    expected = {entry["path"]: entry for entry in index["entries"]}
+    for entry in found:
+        indexed = expected.pop(entry["path"], None)
+        if indexed is None:
+            problems.append(f"{entry['path']}: not in the index")
+            continue
+        for key in ("type", "size", "sha256", "link", "offset"):
+            if entry[key] != indexed[key]:
+                problems.append(f"{entry['path']}: {key} {entry[key]}, indexed as {indexed[key]}")
+    for path in sorted(expected):
+        problems.append(f"{path}: indexed but not in the tarball")
+    return problems
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query and verify module tarball indexes")
+    commands = parser.add_subparsers(dest="command", required=True)
+    query_parser = commands.add_parser("query", help="print the indexed entries matching fnmatch patterns")
+    query_parser.add_argument("tarball")
+    query_parser.add_argument("patterns", nargs="+")
+    tree_parser = commands.add_parser("verify-tree", help="check a module tree against a tarball's index")
+    tree_parser.add_argument("tarball")
+    tree_parser.add_argument("root")
+    tree_parser.add_argument("patterns", nargs="*", help="hash the files matching these fnmatch patterns")
+    tree_parser.add_argument("--full", action="store_true", help="hash every file")
+    tarball_parser = commands.add_parser("verify-tarball", help="check a tarball against its index")
+    tarball_parser.add_argument("tarball")
+    args = parser.parse_args(argv)
+    try:
+        index = load(args.tarball)
+    except (OSError, ValueError) as e:
+        logger.error(f"unable to load the index of {args.tarball}: {e}")
+        sys.exit(1)
+    if args.command == "query":
+        matches = query(index, args.patterns)
+        for entry in matches:
+            print(json.dumps(entry, sort_keys=True))
+        sys.exit(0 if matches else 1)
+    if args.command == "verify-tree":
+        problems = verify_tree(index, args.root, args.patterns, args.full)
+    else:
+        problems = verify_tarball(index, args.tarball)
+    for problem in problems:
+        logger.error(problem)
+    if problems:
+        sys.exit(1)
+    logger.info(f"{args.tarball} matches its index")
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
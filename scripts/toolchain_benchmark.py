@@ -0,0 +1,369 @@
+#!/usr/bin/python
+"""
+Benchmark Bazel build latency with the compiler suite modules of the local registry.
+
+The examples workspace is copied to a scratch directory, given a private output base
+and repository cache, and extended with a synthetic workload: many small C and C++
+sources spread over several libraries and linked into one executable.  For each
+platform the benchmark measures
+
+* cold fetch - fetching the platform's suite module with an empty repository cache,
+  which copies and extracts the tarball
+* extract - fetching it again with the tarball already in the repository cache
+* analysis - loading and analyzing the workload with `build --nobuild`
+* build - a clean build of the workload, with per-mnemonic sandbox setup and
+  execution latency taken from Bazel's execution log
+
+Each run appends a record to a json history, by default benchmarks/history.json, along
+with the module versions and tarball integrities used, so module versions and
+packaging changes can be compared:
+
+    scripts/toolchain_benchmark.py --files 400
+    scripts/toolchain_benchmark.py --module gcc_x86_64_suite@15.2.0.0 --platform x86_64
+"""
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import socket
+import argparse
+import datetime
+import tempfile
+import statistics
+import subprocess
+import logging
+from compiler_suite_generator import Generator
+logger = logging
+
+# the suite module each example platform compiles with
+SUITES = {
+    "riscv64": "gcc_riscv_suite",
+    "x86_64": "gcc_x86_64_suite",
+}
+C_HEADERS = ("stdio.h", "stdlib.h", "string.h", "math.h")
+CXX_HEADERS = ("vector", "string", "map", "algorithm", "memory")
+
+class BenchmarkWorkspace():
+    """
+    A copy of the examples workspace with a private output base and a synthetic workload
+    """
+
+    def __init__(self, workdir, examples_dir, modules=None):
+        """
+        modules maps module names to the versions to depend on instead of those in the
+        examples MODULE.bazel
+        """
+        self.workdir = workdir
+        self.root = f"{workdir}/workspace"
+        self.output_base = f"{workdir}/output_base"
+        self.repository_cache = f"{workdir}/repository_cache"
+        self.examples_dir = examples_dir
+        self.modules = dict(modules or {})
+
+    def create(self):
+        """
+        Copy the examples workspace, pointing it at the private output base
+        """
+        shutil.rmtree(self.root, ignore_errors=True)
+        shutil.copytree(self.examples_dir, self.root, symlinks=True,
+                        ignore=shutil.ignore_patterns("bazel-*", "MODULE.bazel.lock"))
+        bazelversion = f"{os.path.dirname(self.examples_dir)}/.bazelversion"
+        if os.path.exists(bazelversion):
+            shutil.copy(bazelversion, self.root)
+        # toolchains find the suites through absolute paths below the output base
+        with open(f"{self.root}/variables.bzl", encoding="utf8") as vf:
+            variables = vf.read()
+        with open(f"{self.root}/variables.bzl", "w", encoding="utf8") as vf:
+            vf.write(re.sub(r'^OUTPUT_BASE = ".*"$', f'OUTPUT_BASE = "{self.output_base}"',
+                            variables, flags=re.MULTILINE))
+        # keep the registries, but not the shared output base or distdir
+        with open(f"{self.root}/.bazelrc", encoding="utf8") as rf:
+            registries = [line for line in rf if "--registry" in line]
+        with open(f"{self.root}/.bazelrc", "w", encoding="utf8") as rf:
+            rf.writelines(registries)
+            rf.write(f"common --repository_cache={self.repository_cache}\n")
+            # every action runs, rather than coming from a cache
+            rf.write("build --disk_cache=\n")
+        with open(f"{self.root}/MODULE.bazel", encoding="utf8") as mf:
+            module = mf.read()
+        for name, version in self.modules.items():
+            module, count = re.subn(rf'(bazel_dep\(\s*name\s*=\s*"{name}",\s*version\s*=\s*)"[^"]*"',
+                                    rf'\1"{version}"', module)
+            if not count:
+                raise ValueError(f"the examples MODULE.bazel has no bazel_dep on {name}")
+        with open(f"{self.root}/MODULE.bazel", "w", encoding="utf8") as mf:
+            mf.write(module)
+        self.modules = dict(re.findall(r'bazel_dep\(\s*name\s*=\s*"([^"]+)",\s*version\s*=\s*"([^"]+)"', module))
+
+    def write_workload(self, files, libraries):
+        """
+        Write the bench package: files sources, alternately C and C++, split over libraries
+        cc_library targets and linked into the bench executable
+        """
+        package = f"{self.root}/bench"
+        os.makedirs(package, exist_ok=True)
+        with open(f"{package}/bench.h", "w", encoding="utf8") as hf:
+            hf.write("#pragma once\n#ifdef __cplusplus\nextern \"C\" {\n#endif\n")
+            hf.writelines(f"int bench_{i}(int);\n" for i in range(files))
+            hf.write("#ifdef __cplusplus\n}\n#endif\n")
+        sources = {lib: [] for lib in range(libraries)}
+        for i in range(files):
+            if i % 2:
+                name = f"source_{i}.cc"
+                includes = "".join(f"#include <{h}>\n" for h in CXX_HEADERS)
+                body = (f'extern "C" int bench_{i}(int n) {{\n'
+                        "    std::vector<int> v(n + 1);\n"
+                        f"    for (int k = 0; k <= n; ++k) v[k] = (k * {i + 7}) % 13;\n"
+                        "    std::sort(v.begin(), v.end());\n"
+                        "    std::map<int, std::string> m{{v.back(), std::to_string(v.front())}};\n"
+                        "    return static_cast<int>(m.begin()->second.size());\n"
+                        "}\n")
+            else:
+                name = f"source_{i}.c"
+                includes = "".join(f"#include <{h}>\n" for h in C_HEADERS)
+                body = (f"int bench_{i}(int n) {{\n"
+                        "    char buffer[32];\n"
+                        f'    snprintf(buffer, sizeof(buffer), "%d", n * {i + 3});\n'
+                        "    return (int)strlen(buffer) + (int)sqrt((double)abs(n));\n"
+                        "}\n")
+            with open(f"{package}/{name}", "w", encoding="utf8") as sf:
+                sf.write(f'{includes}#include "bench/bench.h"\n\n{body}')
+            sources[i % libraries].append(name)
+        with open(f"{package}/main.cc", "w", encoding="utf8") as sf:
+            sf.write('#include <cstdio>\n#include "bench/bench.h"\n\nint main() {\n    int total = 0;\n')
+            sf.writelines(f"    total += bench_{i}({i});\n" for i in range(files))
+            sf.write('    std::printf("%d\\n", total);\n    return 0;\n}\n')
+        with open(f"{package}/BUILD", "w", encoding="utf8") as bf:
+            bf.write('load("@rules_cc//cc:cc_binary.bzl", "cc_binary")\n')
+            bf.write('load("@rules_cc//cc:cc_library.bzl", "cc_library")\n\n')
+            bf.write("# Generated by scripts/toolchain_benchmark.py\n")
+            for lib, names in sources.items():
+                bf.write(f'\ncc_library(\n    name = "lib_{lib}",\n    srcs = {json.dumps(names)},\n'
+                         '    hdrs = ["bench.h"],\n    linkopts = ["-lm"],\n)\n')
+            deps = json.dumps([f":lib_{lib}" for lib in sources])
+            bf.write(f'\ncc_binary(\n    name = "bench",\n    srcs = ["main.cc"],\n    deps = {deps},\n)\n')
+
+class Bazel():
+    """
+    Run and time Bazel commands in a benchmark workspace
+    """
+
+    def __init__(self, workspace, bazel, flags=()):
+        self.workspace = workspace
+        self.bazel = bazel
+        self.flags = list(flags)
+
+    def run(self, command, *args):
+        """
+        Run a Bazel command, returning its wall time in seconds
+        """
+        argv = [self.bazel, f"--output_base={self.workspace.output_base}", command]
+        if command in ("build", "fetch"):
+            argv += self.flags
+        argv += list(args)
+        logger.info(" ".join(argv))
+        start = time.perf_counter()
+        result = subprocess.run(argv, cwd=self.workspace.root, capture_output=True, encoding="utf8")
+        elapsed = time.perf_counter() - start
+        if result.returncode != 0:
+            raise RuntimeError(f"{' '.join(argv)} failed:\n{result.stderr[-4000:]}")
+        return round(elapsed, 3)
+
+    def shutdown(self):
+        """
+        Stop the workspace's Bazel server, ignoring failures
+        """
+        subprocess.run([self.bazel, f"--output_base={self.workspace.output_base}", "shutdown"],
+                       cwd=self.workspace.root, capture_output=True)
+
+    def version(self):
+        """
+        The Bazel release used, e.g. "release 9.2.0"
+        """
+        result = subprocess.run([self.bazel, f"--output_base={self.workspace.output_base}", "info", "release"],
+                                cwd=self.workspace.root, capture_output=True, encoding="utf8")
+        return result.stdout.strip()
+
+def measure_platform(bazel, platform, workdir):
+    """
+    Measure the fetch, analysis and build latencies of one platform
+    """
+    workspace = bazel.workspace
+    suite = SUITES[platform]
+    targets = ["//bench:all"]
+    platforms = f"--platforms=//platforms:{platform}"
+    results = {"suite": suite}
+    bazel.run("clean", "--expunge")
+    shutil.rmtree(workspace.repository_cache, ignore_errors=True)
+    # start the server outside the timed commands
+    bazel.run("info", "release")
+    results["cold_fetch_s"] = bazel.run("fetch", f"--repo=@{suite}")
+    bazel.run("clean", "--expunge")
+    bazel.run("info", "release")
+    results["extract_s"] = bazel.run("fetch", f"--repo=@{suite}")
+    bazel.run("clean")
+    results["analysis_s"] = bazel.run("build", "--nobuild", platforms, *targets)
+    execution_log = f"{workdir}/execution_{platform}.json"
+    bazel.run("clean")
+    results["build_s"] = bazel.run("build", platforms, f"--execution_log_json_file={execution_log}",
+                                   "--execution_log_sort=false", *targets)
+    results["actions"] = summarize_spawns(read_execution_log(execution_log))
+    return results
+
+def read_execution_log(path):
+    """
+    The spawns of a Bazel json execution log, a stream of concatenated json objects
+    """
+    decoder = json.JSONDecoder()
+    with open(path, encoding="utf8") as lf:
+        text = lf.read()
+    spawns = []
+    position = 0
+    while True:
+        while position < len(text) and text[position].isspace():
+            position += 1
+        if position >= len(text):
+            return spawns
+        spawn, position = decoder.raw_decode(text, position)
+        spawns.append(spawn)
+
+def duration(value):
+    """
+    Seconds in a protobuf json duration such as "0.012s", 0 when missing
+    """
+    if not value:
+        return 0.0
+    return float(str(value).rstrip("s"))
+
+def summarize_spawns(spawns):
+    """
+    Per mnemonic action counts and sandbox setup, execution and total latencies in seconds
+    """
+    by_mnemonic = {}
+    for spawn in spawns:
+        metrics = spawn.get("metrics", {})
+        by_mnemonic.setdefault(spawn.get("mnemonic", "unknown"), []).append({
+            "setup": duration(metrics.get("setupTime")),
+            "execution": duration(metrics.get("executionWallTime") or spawn.get("walltime")),
+            "total": duration(metrics.get("totalTime") or spawn.get("walltime")),
+        })
+    summary = {}
+    for mnemonic, records in sorted(by_mnemonic.items()):
+        summary[mnemonic] = {"count": len(records)}
+        for key in ("setup", "execution", "total"):
+            values = sorted(r[key] for r in records)
+            summary[mnemonic][key] = {
+                "median_s": round(statistics.median(values), 4),
+                "p90_s": round(values[min(len(values) - 1, int(len(values) * 0.9))], 4),
+                "sum_s": round(sum(values), 3),
+            }
+    return summary
+
+def module_integrities(modules):
+    """
+    The registry integrity of each module version, so repackaged versions can be told apart
+    """
+    integrities = {}
+    for name, version in modules.items():
+        try:
+            with open(f"{Generator.MOD_DIR}/{name}/{version}/source.json", encoding="utf8") as sf:
+                integrities[name] = json.load(sf)["integrity"]
+        except (OSError, ValueError, KeyError):
+            continue
+    return integrities
+
+def load_history(path):
+    """
+    The previous benchmark records, oldest first
+    """
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf8") as hf:
+        return json.load(hf)
+
+def compare(previous, record):
+    """
+    Log each platform's latencies against the previous record of the same workload
+    """
+    for platform, results in record["platforms"].items():
+        old = previous["platforms"].get(platform)
+        if old is None:
+            continue
+        changes = []
+        for key in ("cold_fetch_s", "extract_s", "analysis_s", "build_s"):
+            if key in old:
+                changes.append(f"{key} {old[key]} -> {results[key]}")
+        logger.info(f"{platform} compared with {previous['date']}: " + ", ".join(changes))
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Benchmark Bazel build latency with the suite modules")
+    parser.add_argument("--platform", action="append", choices=sorted(SUITES),
+                        help="platforms to benchmark, by default all of them")
+    parser.add_argument("--files", type=int, default=200, help="synthetic source files")
+    parser.add_argument("--libraries", type=int, default=8, help="cc_library targets holding the sources")
+    parser.add_argument("--module", action="append", default=[], metavar="NAME@VERSION",
+                        help="module version to benchmark instead of the examples' version")
+    parser.add_argument("--bazel", default=shutil.which("bazelisk") and "bazelisk" or "bazel",
+                        help="Bazel launcher, by default bazelisk when installed")
+    parser.add_argument("--bazel-flag", action="append", default=[], metavar="FLAG",
+                        help="extra flag for build and fetch commands, e.g. --spawn_strategy=linux-sandbox")
+    parser.add_argument("--examples", default=f"{Generator.TOP_DIR}/examples",
+                        help="workspace copied for the benchmark")
+    parser.add_argument("--workdir", help="scratch directory, by default a temporary directory")
+    parser.add_argument("--history", default=f"{Generator.TOP_DIR}/benchmarks/history.json",
+                        help="json file the results are appended to")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    modules = {}
+    for entry in args.module:
+        name, _, version = entry.partition("@")
+        if not version:
+            logger.error(f"expected NAME@VERSION, not {entry}")
+            sys.exit(1)
+        modules[name] = version
+    with tempfile.TemporaryDirectory(prefix="toolchain_benchmark.") as scratch:
+        workdir = os.path.abspath(args.workdir or scratch)
+        workspace = BenchmarkWorkspace(workdir, os.path.abspath(args.examples), modules)
+        try:
+            workspace.create()
+        except ValueError as e:
+            logger.error(e)
+            sys.exit(1)
+        workspace.write_workload(args.files, args.libraries)
+        bazel = Bazel(workspace, args.bazel, args.bazel_flag)
+        record = {
+            "date": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            "host": socket.gethostname(),
+            "bazel": bazel.version(),
+            "modules": workspace.modules,
+            "integrity": module_integrities(workspace.modules),
+            "workload": {"files": args.files, "libraries": args.libraries, "bazel_flags": args.bazel_flag},
+            "platforms": {},
+        }
+        try:
+            for platform in args.platform or sorted(SUITES):
+                record["platforms"][platform] = measure_platform(bazel, platform, workdir)
+        except RuntimeError as e:
+            logger.error(e)
+            sys.exit(1)
+        finally:
+            bazel.shutdown()
+    history = load_history(args.history)
+    same_workload = [r for r in history if r["workload"] == record["workload"] and r["host"] == record["host"]]
+    if same_workload:
+        compare(same_workload[-1], record)
+    history.append(record)
+    os.makedirs(os.path.dirname(os.path.abspath(args.history)), exist_ok=True)
+    with open(args.history + ".tmp", "w", encoding="utf8") as hf:
+        json.dump(history, hf, indent=4)
+        hf.write("\n")
+    os.replace(args.history + ".tmp", args.history)
+    logger.info(f"appended results to {args.history}")
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,232 @@
+"""
+Walk a module source directory once and share what is learned with every generator stage.
+
+A TreeScan holds the lstat result of every file and symbolic link under the module
+source directory, in the order suite_manifest.Manifest records them, plus two caches
+filled on demand:
+
+* the ELF header information of regular files, keyed by inode, size and modification
+  time, so dependency pruning and strip classification parse each binary once
+* content hashes, keyed by inode and checked against the size and modification time
+  they were computed for, shared by deduplication and the manifest
+
+Stages that change files tell the scan which paths they touched with refresh(), so
+the tree is not walked again.  classify() sorts ELF executables and shared objects
+into host and target binaries by machine type, the basis of automatic strip lists.
+"""
+import os
+import sys
+import stat
+import fnmatch
+import threading
+import concurrent.futures
+import logging
+from elf_info import read_elf, ET_EXEC, ET_DYN, MACHINE_NAMES
+from suite_manifest import file_sha256, walk
+logger = logging
+
+class TreeScan():
+    """
+    Cached stat, ELF and content hash information for every file under a directory
+    """
+
+    def __init__(self, root, jobs=1):
+        self.root = root
+        self.jobs = jobs
+        # relative path => lstat result of regular files and symbolic links, in walk order
+        self.entries = {}
+        # symbolic links to directories, which walks list after a directory's files
+        self.dir_links = set()
+        # (st_dev, st_ino, st_size, st_mtime_ns) => ElfInfo, or None for other files
+        self.elf_cache = {}
+        # (st_dev, st_ino) => hex sha256, and the (st_size, st_mtime_ns) it was computed for
+        self.hashes = {}
+        self.hashed = {}
+        self.lock = threading.Lock()
+
+    def scan(self):
+        """
+        Walk the tree, recording every regular file and symbolic link
+        """
+        self.entries = {}
+        self.dir_links = set()
+        for rel, st in walk(self.root):
+            if stat.S_ISREG(st.st_mode) or stat.S_ISLNK(st.st_mode):
+                self.entries[rel] = st
+                if stat.S_ISLNK(st.st_mode) and os.path.isdir(f"{self.root}/{rel}"):
+                    self.dir_links.add(rel)
+        logger.info(f"scanned {len(self.entries)} files under {self.root}")
+        return self
+
+    def refresh(self, paths):
+        """
+        Update the entries of relative paths a stage created, replaced or removed.  New paths
+        are added at the end of self.entries; ordered() lists them in walk order.
+        """
+        for rel in paths:
+            self.dir_links.discard(rel)
+            try:
+                st = os.lstat(f"{self.root}/{rel}")
+            except OSError:
+                self.entries.pop(rel, None)
+                continue
+            if stat.S_ISREG(st.st_mode) or stat.S_ISLNK(st.st_mode):
+                self.entries[rel] = st
+                if stat.S_ISLNK(st.st_mode) and os.path.isdir(f"{self.root}/{rel}"):
+                    self.dir_links.add(rel)
+            else:
+                self.entries.pop(rel, None)
+
+    def forget(self, paths):
+        """
+        Drop the cached hashes of relative paths rewritten in place, whose size and
+        modification time need not change with their contents
+        """
+        for rel in paths:
+            try:
+                st = os.lstat(f"{self.root}/{rel}")
+            except OSError:
+                continue
+            with self.lock:
+                self.hashes.pop((st.st_dev, st.st_ino), None)
+                self.hashed.pop((st.st_dev, st.st_ino), None)
+
+    def ordered(self):
+        """
+        The (relative path, lstat result) of every entry, in suite_manifest.walk order
+        """
+        def walk_key(rel):
+            *dirs, name = rel.split("/")
+            return tuple((1, d) for d in dirs) + ((0, rel in self.dir_links, name),)
+        return sorted(self.entries.items(), key=lambda item: walk_key(item[0]))
+
+    def files(self):
+        """
+        The relative paths of regular files
+        """
+        return [rel for rel, st in self.entries.items() if stat.S_ISREG(st.st_mode)]
+
+    def symlinks(self):
+        """
+        The relative paths of symbolic links
+        """
+        return [rel for rel, st in self.entries.items() if stat.S_ISLNK(st.st_mode)]
+
+    def size(self):
+        """
+        The number of regular files and their total size, counting hard links once
+        """
+        inodes = {}
+        files = 0
+        for st in self.entries.values():
+            if stat.S_ISREG(st.st_mode):
+                files += 1
+                inodes[(st.st_dev, st.st_ino)] = st.st_size
+        return files, sum(inodes.values())
+
+    def inodes(self):
+        """
+        Map the inode of every non-empty regular file to its absolute paths, size and
+        permissions, as hardlink_dedup.Deduplicator expects
+        """
+        inodes = {}
+        for rel, st in self.entries.items():
+            if stat.S_ISREG(st.st_mode) and st.st_size:
+                entry = inodes.setdefault((st.st_dev, st.st_ino), ([], st.st_size, stat.S_IMODE(st.st_mode)))
+                entry[0].append(f"{self.root}/{rel}")
+        return inodes
+
+    def elf(self, rel):
+        """
+        The ElfInfo of a regular file, or None if it is not an ELF file
+        """
+        st = self.entries.get(rel)
+        if st is None or not stat.S_ISREG(st.st_mode):
+            return None
+        key = (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+        with self.lock:
+            if key in self.elf_cache:
+                return self.elf_cache[key]
+        info = read_elf(f"{self.root}/{rel}")
+        with self.lock:
+            self.elf_cache[key] = info
+        return info
+
+    def add_hashes(self, hashes):
+        """
+        Record hashes computed elsewhere, keyed by (st_dev, st_ino), for the current entries
+        """
+        for st in self.entries.values():
+            key = (st.st_dev, st.st_ino)
+            if key in hashes and stat.S_ISREG(st.st_mode):
+                self.hashes[key] = hashes[key]
+                self.hashed[key] = (st.st_size, st.st_mtime_ns)
+
+    def known_hashes(self):
+        """
+        The cached hashes still valid for the current entries, keyed by (st_dev, st_ino)
+        """
+        known = {}
+        for st in self.entries.values():
+            key = (st.st_dev, st.st_ino)
+            if key in self.hashes and self.hashed[key] == (st.st_size, st.st_mtime_ns):
+                known[key] = self.hashes[key]
+        return known
+
+    def sha256(self, rel):
+        """
+        The hex sha256 of a regular file, hashing it only if no valid hash is cached
+        """
+        st = self.entries[rel]
+        key = (st.st_dev, st.st_ino)
+        with self.lock:
+            if key in self.hashes and self.hashed[key] == (st.st_size, st.st_mtime_ns):
+                return self.hashes[key]
+        digest = file_sha256(f"{self.root}/{rel}")
+        with self.lock:
+            self.hashes[key] = digest
+            self.hashed[key] = (st.st_size, st.st_mtime_ns)
+        return digest
+
+    def classify(self, target_machine, exclude=()):
+        """
+        Sort the ELF executables and shared objects into binaries to strip with the host
+        strip and with the target strip, returning (host, target) lists of relative paths.
+        Files matching an exclude fnmatch pattern, relocatable objects like crt1.o, and
+        binaries for other machines are left out.  Hard linked paths are all listed.
+        """
+        host_machine = host_elf_machine()
+        candidates = [rel for rel in self.files()
+                      if not any(fnmatch.fnmatch(rel, pattern) for pattern in exclude)]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, self.jobs)) as pool:
+            infos = list(pool.map(self.elf, candidates))
+        host, target, foreign = [], [], []
+        for rel, info in zip(candidates, infos):
+            if info is None or info.type not in (ET_EXEC, ET_DYN):
+                continue
+            if info.machine == host_machine:
+                host.append(rel)
+            elif info.machine == target_machine:
+                target.append(rel)
+            else:
+                foreign.append(rel)
+        for rel in foreign:
+            logger.info(f"not stripping {rel}, built for neither the host nor the target machine")
+        return host, target
+
+def host_elf_machine():
+    """
+    The ELF machine type of the running Python interpreter, and so of the host
+    """
+    info = read_elf(os.path.realpath(sys.executable))
+    return info.machine if info else None
+
+def target_elf_machine(triple):
+    """
+    The ELF machine type of a GNU target triple such as riscv64-unknown-linux-gnu, or None
+    """
+    arch = triple.split("-", 1)[0]
+    for machine, name in MACHINE_NAMES.items():
+        if name == arch:
+            return machine
+    return None
@@ -0,0 +1,61 @@
+"""
+Fixtures shared by the tests of scripts/, which run against temporary module trees and
+a temporary local registry rather than /opt/bazel/bzlmod.
+"""
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts"))
+from compiler_suite_generator import Generator
+from suite_spec import SuiteSpec
+
+IMPORT_RULES = """
++ bin
++ bin/gcc
++ bin/cpp
+- bin/**
++ include/***
++ lib
++ lib/libc.so.6
+- lib/*.a
+- *
+"""
+
+def write(path, contents):
+    """
+    Write a text file, creating its directory
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf8") as f:
+        f.write(contents)
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    """
+    Point the generator's source tree and local registry at a temporary directory
+    """
+    monkeypatch.setattr(Generator, "TOP_DIR", str(tmp_path))
+    monkeypatch.setattr(Generator, "BZLMOD_DIR", str(tmp_path / "bzlmod"))
+    monkeypatch.setattr(Generator, "MOD_DIR", str(tmp_path / "bzlmod" / "modules"))
+    monkeypatch.setattr(Generator, "TARBALL_DIR", str(tmp_path / "bzlmod" / "tarballs"))
+    os.makedirs(Generator.TARBALL_DIR)
+    return tmp_path
+
+@pytest.fixture
+def suite(registry):
+    """
+    A small installation to import, with its module source directory and specification
+    """
+    sysroot = f"{registry}/sysroot"
+    write(f"{sysroot}/bin/gcc", "driver\n")
+    write(f"{sysroot}/bin/cpp", "driver\n")
+    write(f"{sysroot}/bin/gdb", "not imported\n")
+    write(f"{sysroot}/include/stdio.h", "int printf(const char *, ...);\n")
+    write(f"{sysroot}/include/sys/types.h", "typedef long ssize_t;\n")
+    write(f"{sysroot}/lib/libc.so.6", "libc\n")
+    write(f"{sysroot}/lib/libc.a", "not imported\n")
+    write(f"{sysroot}/share/man/gcc.1", "not imported\n")
+    write(f"{registry}/src/test_suite/MODULE.bazel", 'module(\n    name = "test_suite",\n    version = "0",\n)\n')
+    return SuiteSpec({"name": "test_suite", "version": "1.0", "target": "x86_64-pc-linux-gnu",
+                      "gcc_version": "15", "sysroot": sysroot, "import": IMPORT_RULES}, "test_suite.toml")
@@ -0,0 +1,33 @@
+"""
+Check that stored blobs are reused by later module trees and collected once unreferenced.
+"""
+import os
+from conftest import write
+from blob_store import BlobStore
+from suite_manifest import file_sha256
+
+def test_blobs_are_shared_and_collected(tmp_path):
+    store = BlobStore(f"{tmp_path}/store")
+    write(f"{tmp_path}/v1/bin/gcc", "stripped driver\n")
+    operation = store.operation("strip", "strip", "--strip-unneeded")
+    assert operation.startswith("strip-")
+    assert store.operation("strip", "strip", "--strip-debug") != operation
+    key = store.source_key(f"{tmp_path}/v1/bin/gcc")
+    assert store.lookup(operation, key) is None
+    metadata = store.put(operation, key, f"{tmp_path}/v1/bin/gcc", build_id="abc")
+    assert metadata["sha256"] == file_sha256(f"{tmp_path}/v1/bin/gcc")
+    assert store.lookup(operation, key) == metadata
+    write(f"{tmp_path}/v2/bin/gcc", "unstripped driver\n")
+    store.link(operation, key, [f"{tmp_path}/v2/bin/gcc"])
+    assert os.path.samefile(f"{tmp_path}/v2/bin/gcc", store.path(operation, key))
+    store.save()
+    assert BlobStore(f"{tmp_path}/store").index == store.index
+    # still linked from a module tree
+    assert store.collect_garbage() == 0
+    os.remove(f"{tmp_path}/v1/bin/gcc")
+    os.remove(f"{tmp_path}/v2/bin/gcc")
+    # only the store links to it now
+    assert store.collect_garbage() == len("stripped driver\n")
+    assert store.lookup(operation, key) is None
+    assert not os.path.exists(store.path(operation, key) + ".json")
+    assert os.path.exists(store.index_file)
@@ -0,0 +1,45 @@
+"""
+Check the path patterns and filegroup assignment behind generated BUILD files.
+"""
+from build_writer import pattern_regex, classify, render
+
+VARIABLES = {"target": "x86_64-pc-linux-gnu", "gcc_version": "15", "tool_prefix": "x86_64-pc-linux-gnu-"}
+
+def test_pattern_regex():
+    assert pattern_regex("**/*.gch").match("stdio.h.gch")
+    assert pattern_regex("**/*.gch").match("include/bits/stdc++.h.gch")
+    assert pattern_regex("include/**").match("include/sys/types.h")
+    assert not pattern_regex("include/**").match("usr/include/stdio.h")
+    assert pattern_regex("bin/*").match("bin/gcc")
+    assert not pattern_regex("bin/*").match("bin/sub/gcc")
+    assert pattern_regex("lib/libc.so.?").match("lib/libc.so.6")
+    # regular expression characters in paths are literal
+    assert not pattern_regex("include/c++/**").match("include/cc/vector")
+    assert pattern_regex("include/c++/**").match("include/c++/15/vector")
+
+def test_classify_and_render():
+    files = [
+        "BUILD", "MODULE.bazel",
+        "bin/x86_64-pc-linux-gnu-gcc",
+        "bin/x86_64-pc-linux-gnu-ar",
+        "include/stdio.h",
+        "include/stdio.h.gch",
+        "share/info/gcc.info",
+    ]
+    groups, unused = classify(files, VARIABLES)
+    assert "include/stdio.h" in groups["preprocess_files"]
+    assert "include/stdio.h.gch" not in groups["preprocess_files"]
+    assert groups["pch_files"] == ["include/stdio.h.gch"]
+    assert all("MODULE.bazel" not in members and "BUILD" not in members for members in groups.values())
+    assert unused == ["share/info/gcc.info"]
+    text = render(groups, unused, "generated\n")
+    assert text.startswith("# generated\n")
+    assert '        "include/stdio.h.gch",' in text
+    assert '        ":preprocess_files",' in text
+    assert "#   share/info/gcc.info" in text
+
+def test_assemble_files_stage_the_driver():
+    # assemble actions invoke gcc, not as
+    files = ["bin/x86_64-pc-linux-gnu-gcc", "bin/x86_64-pc-linux-gnu-as", "bin/x86_64-pc-linux-gnu-ld"]
+    groups, _ = classify(files, VARIABLES)
+    assert groups["assemble_files"] == ["bin/x86_64-pc-linux-gnu-as", "bin/x86_64-pc-linux-gnu-gcc"]
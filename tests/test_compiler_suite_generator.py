@@ -0,0 +1,84 @@
+"""
+Run the generator pipeline over a small installation and check what it publishes.
+"""
+import os
+import json
+import base64
+import hashlib
+from compiler_suite_generator import Generator
+import tarball_index
+
+def read_bytes(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+def test_generation_is_reproducible(suite):
+    generator = Generator.from_spec(suite)
+    generator.generate(suite)
+    first = read_bytes(generator.tarball_name())
+    first_build = read_bytes(f"{generator.mod_src_dir}/BUILD")
+    # a second non-incremental run finds the first run's BUILD file in the module directory
+    generator = Generator.from_spec(suite)
+    generator.generate(suite)
+    assert read_bytes(f"{generator.mod_src_dir}/BUILD") == first_build
+    assert read_bytes(generator.tarball_name()) == first
+    assert "bin/gdb" not in generator.tree_scan().entries
+    assert os.path.exists(f"{generator.mod_src_dir}/include/sys/types.h")
+
+def test_source_json_integrity_matches_the_tarball(suite):
+    generator = Generator.from_spec(suite)
+    generator.generate(suite)
+    with open(f"{generator.bzlmod_module_dir}/source.json", encoding="utf8") as sf:
+        source = json.load(sf)
+    tarball = generator.tarball_name()
+    assert source["url"] == f"file://{tarball}"
+    integrity = "sha256-" + base64.b64encode(hashlib.sha256(read_bytes(tarball)).digest()).decode("ascii")
+    assert source["integrity"] == integrity
+    index = tarball_index.load(tarball)
+    assert index["integrity"] == integrity
+    assert tarball_index.verify_tarball(index, tarball) == []
+    assert tarball_index.verify_tree(index, generator.mod_src_dir, full=True) == []
+
+def test_incremental_import_keeps_deduplicated_files(suite):
+    generator = Generator.from_spec(suite)
+    generator.generate(suite)
+    gcc = os.stat(f"{generator.mod_src_dir}/bin/gcc")
+    assert os.path.samefile(f"{generator.mod_src_dir}/bin/gcc", f"{generator.mod_src_dir}/bin/cpp")
+    generator = Generator.from_spec(suite)
+    generator.set_incremental(True)
+    generator.rsync_to_mod_src(suite.sysroot, suite.import_rules)
+    assert not generator.tree_changed
+    assert os.stat(f"{generator.mod_src_dir}/bin/gcc").st_ino == gcc.st_ino
+
+def test_unchanged_incremental_run_skips_stages(suite, caplog):
+    suite.prune_roots = "bin/*"
+    generator = Generator.from_spec(suite)
+    generator.generate(suite)
+    build = os.stat(f"{generator.mod_src_dir}/BUILD")
+    generator = Generator.from_spec(suite)
+    generator.set_incremental(True)
+    with caplog.at_level("INFO"):
+        generator.generate(suite)
+    for stage in ("dependency pruning", "stripping", "duplicate removal", "writing the BUILD file"):
+        assert f"no imported files changed, skipping {stage}" in caplog.text
+    assert "module contents are unchanged" in caplog.text
+    assert os.stat(f"{generator.mod_src_dir}/BUILD").st_mtime_ns == build.st_mtime_ns
+
+def test_incremental_run_rewrites_build_for_a_new_version(suite):
+    Generator.from_spec(suite).generate(suite)
+    suite.version = "1.1"
+    generator = Generator.from_spec(suite)
+    generator.set_incremental(True)
+    generator.generate(suite)
+    with open(f"{generator.mod_src_dir}/BUILD", encoding="utf8") as bf:
+        assert "test_suite 1.1" in bf.read()
+
+def test_clean_and_import_stages_record_sizes(suite):
+    generator = Generator.from_spec(suite)
+    generator.generate(suite)
+    stages = {record["stage"]: record for record in generator.metrics.stages}
+    # the module's MODULE.bazel stays for update_module_version
+    assert stages["clean"]["files_after"] == 1
+    # bin/gcc, bin/cpp, include/stdio.h, include/sys/types.h, lib/libc.so.6 and MODULE.bazel
+    assert stages["import"]["files_after"] == 6
+    assert stages["import"]["bytes_after"] > stages["import"]["bytes_before"]
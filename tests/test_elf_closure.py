@@ -0,0 +1,29 @@
+"""
+Check the ELF dependency closure with small shared objects built by the host compiler.
+"""
+import os
+import shutil
+import subprocess
+import pytest
+from conftest import write
+from elf_closure import DependencyClosure
+
+def compile_c(root, output, *args):
+    os.makedirs(os.path.dirname(f"{root}/{output}"), exist_ok=True)
+    subprocess.run(["gcc", "-o", f"{root}/{output}", *args], check=True, cwd=root)
+
+@pytest.mark.skipif(shutil.which("gcc") is None, reason="needs a host gcc")
+def test_unreferenced_keeps_glibc_runtime_libraries(tmp_path):
+    root = str(tmp_path)
+    write(f"{root}/empty.c", "int unused(void) { return 0; }\n")
+    write(f"{root}/main.c", "int unused(void);\nint main(void) { return unused(); }\n")
+    compile_c(root, "lib/libfoo.so", "-shared", "-fPIC", "-Wl,-soname,libfoo.so", "empty.c")
+    compile_c(root, "bin/tool", "main.c", "-Llib", "-lfoo", "-Wl,-rpath,$ORIGIN/../lib")
+    for name in ("lib/libbar.so", "lib/libnss_files.so.2", "lib/librt.so.1", "lib/gconv/UTF-16.so"):
+        compile_c(root, name, "-shared", "-fPIC", "empty.c")
+    os.symlink("libbar.so", f"{root}/lib/libbar.so.1")
+    closure = DependencyClosure(root)
+    assert closure.close(["bin/tool"]) == {"bin/tool", "lib/libfoo.so"}
+    assert "libc.so.6" in closure.unresolved
+    assert closure.unreferenced() == ["lib/libbar.so", "lib/libbar.so.1"]
+    assert closure.unreferenced(keep=["lib/libbar.so*"]) == []
@@ -0,0 +1,27 @@
+"""
+Check that duplicate files are replaced with hard links to the shallowest copy.
+"""
+import os
+from conftest import write
+from hardlink_dedup import Deduplicator
+
+def test_duplicates_are_linked_to_the_shallowest_copy(tmp_path):
+    root = str(tmp_path)
+    write(f"{root}/bin/gcc", "driver\n")
+    write(f"{root}/libexec/gcc/x86_64/gcc", "driver\n")
+    write(f"{root}/bin/cpp", "driver\n")
+    # same size and partial hash as the driver, different mode
+    write(f"{root}/bin/gcc-script", "driver\n")
+    os.chmod(f"{root}/bin/gcc-script", 0o755)
+    write(f"{root}/bin/other", "differs\n")
+    write(f"{root}/empty1", "")
+    write(f"{root}/empty2", "")
+    deduplicator = Deduplicator(root, jobs=2)
+    assert deduplicator.run() == 2 * len("driver\n")
+    assert os.path.samefile(f"{root}/bin/cpp", f"{root}/bin/gcc")
+    assert os.path.samefile(f"{root}/libexec/gcc/x86_64/gcc", f"{root}/bin/cpp")
+    assert sorted(deduplicator.relinked) == [f"{root}/bin/gcc", f"{root}/libexec/gcc/x86_64/gcc"]
+    assert not os.path.samefile(f"{root}/bin/gcc-script", f"{root}/bin/cpp")
+    assert not os.path.samefile(f"{root}/bin/other", f"{root}/bin/cpp")
+    assert not os.path.samefile(f"{root}/empty1", f"{root}/empty2")
+    assert Deduplicator(root).run() == 0
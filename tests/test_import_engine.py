@@ -0,0 +1,61 @@
+"""
+Check the native import against the rsync filter semantics the suite specifications rely on.
+"""
+import os
+from conftest import write
+from import_engine import FilterRules, ImportEngine
+
+def test_filter_rules_follow_rsync_semantics():
+    rules = FilterRules("""
+        # the first matching rule decides
+        + bin/gcc
+        - bin/*
+        - *.a
+        + /include/***
+        - share/
+        P *.gch
+        H secret
+    """)
+    assert rules.sent("bin/gcc", False)
+    assert not rules.sent("bin/gdb", False)
+    # a pattern without a slash matches the final component at any depth
+    assert not rules.sent("lib/gcc/libgcc.a", False)
+    # dir/*** matches the directory itself and everything below it, anchored at the root
+    assert rules.sent("include", True)
+    assert rules.sent("include/sys/types.h", False)
+    # a trailing slash only matches directories
+    assert not rules.sent("share", True)
+    assert rules.sent("share", False)
+    assert not rules.sent("lib/secret", False)
+    # unmatched paths are included
+    assert rules.sent("lib/libc.so.6", False)
+    assert rules.protected("include/stdio.h.gch", False)
+    assert not rules.protected("include/stdio.h", False)
+
+def test_import_links_copies_and_deletes(tmp_path):
+    src, dst = f"{tmp_path}/src", f"{tmp_path}/dst"
+    write(f"{src}/bin/gcc", "driver\n")
+    os.link(f"{src}/bin/gcc", f"{src}/bin/cc")
+    write(f"{src}/lib/libc.so.6", "libc\n")
+    write(f"{src}/lib/libc.a", "archive\n")
+    write(f"{src}/share/man/gcc.1", "manual\n")
+    os.symlink("libc.so.6", f"{src}/lib/libc.so")
+    write(f"{dst}/stale", "removed\n")
+    write(f"{dst}/include/stdio.h.gch", "protected\n")
+    os.makedirs(f"{src}/include")
+    engine = ImportEngine(src, dst, "- share/\n- *.a\nP *.gch\n", delete=True, modified=["lib/libc.so.6"])
+    engine.run()
+    # files never modified in place are hard linked to their source, hard link groups are kept
+    assert os.path.samefile(f"{src}/bin/gcc", f"{dst}/bin/gcc")
+    assert os.path.samefile(f"{dst}/bin/gcc", f"{dst}/bin/cc")
+    # files modified in place are copies
+    assert not os.path.samefile(f"{src}/lib/libc.so.6", f"{dst}/lib/libc.so.6")
+    assert os.stat(f"{dst}/lib/libc.so.6").st_mtime_ns == os.stat(f"{src}/lib/libc.so.6").st_mtime_ns
+    assert os.readlink(f"{dst}/lib/libc.so") == "libc.so.6"
+    assert not os.path.exists(f"{dst}/lib/libc.a")
+    assert not os.path.exists(f"{dst}/share")
+    assert not os.path.exists(f"{dst}/stale")
+    assert os.path.exists(f"{dst}/include/stdio.h.gch")
+    # a second run finds nothing to do
+    engine = ImportEngine(src, dst, "- share/\n- *.a\nP *.gch\n", delete=True, modified=["lib/libc.so.6"])
+    assert engine.run() == []
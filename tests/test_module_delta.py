@@ -0,0 +1,62 @@
+"""
+Generate two versions of a small module and rebuild the second version's tarball from
+the first with the published delta, as scripts/module_delta.py does for clients.
+
+    python -m pytest tests
+"""
+import os
+import json
+import hashlib
+from compiler_suite_generator import Generator
+from conftest import write
+import module_delta
+
+def generate(version, delta_base=None):
+    """
+    Run the generator stages that follow the import over the module source directory
+    """
+    generator = Generator("delta_suite", version, "x86_64-pc-linux-gnu")
+    if delta_base:
+        generator.set_delta_base(delta_base)
+    generator.remove_duplicates()
+    generator.write_build_file("15", "")
+    generator.make_tarball()
+    return generator
+
+def test_delta_round_trip(registry):
+    root = f"{registry}/src/delta_suite"
+    write(f"{root}/MODULE.bazel", 'module(name = "delta_suite")\n')
+    write(f"{root}/BUILD", "# replaced by the generator\n")
+    write(f"{root}/bin/gcc", "driver 1\n")
+    write(f"{root}/bin/x86_64-pc-linux-gnu-gcc", "driver 1\n")
+    write(f"{root}/include/stdio.h", "stdio 1\n")
+    write(f"{root}/lib/gcc/old.a", "removed in 1.1\n")
+    os.symlink("stdio.h", f"{root}/include/cstdio.h")
+    generate("1.0")
+
+    write(f"{root}/include/stdio.h", "stdio 2\n")
+    write(f"{root}/include/stdlib.h", "stdlib 2\n")
+    os.remove(f"{root}/lib/gcc/old.a")
+    generator = generate("1.1", delta_base="1.0")
+
+    manifest = json.load(open(generator.manifest_file, encoding="utf8"))
+    with open(f"{root}/BUILD", "rb") as bf:
+        assert manifest["files"]["BUILD"]["sha256"] == hashlib.sha256(bf.read()).hexdigest()
+    delta_file = f"{generator.bzlmod_module_dir}/delta-from-1.0.json"
+    delta = json.load(open(delta_file, encoding="utf8"))
+    assert "BUILD" in delta["changed"]
+    assert "lib/gcc/old.a" in delta["removed"]
+
+    output_dir = registry / "distdir"
+    output_dir.mkdir()
+    output = module_delta.apply_delta(delta, f"{Generator.TARBALL_DIR}/delta_suite-1.0.tar.xz",
+                                      str(output_dir), urlpath(delta["delta_url"]))
+    with open(output, "rb") as rebuilt, open(f"{Generator.TARBALL_DIR}/{delta['target_tarball']}", "rb") as published:
+        assert rebuilt.read() == published.read()
+
+def urlpath(url):
+    """
+    The local path of a file:// delta URL
+    """
+    assert url.startswith("file://")
+    return url[len("file://"):]
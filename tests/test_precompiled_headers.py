@@ -0,0 +1,22 @@
+"""
+Compile a precompiled header with the host g++ standing in for the module's compiler.
+"""
+import os
+import shutil
+import pytest
+from conftest import write
+from precompiled_headers import PrecompiledHeaders
+
+@pytest.mark.skipif(shutil.which("g++") is None, reason="needs a host g++")
+def test_variants_do_not_name_the_module_directory(tmp_path):
+    root = f"{tmp_path}/src/test_suite"
+    write(f"{root}/include/api.h", '#include "detail.h"\ninline int answer() { return detail(); }\n')
+    write(f"{root}/include/detail.h", "inline int detail() { return 42; }\n")
+    os.makedirs(f"{root}/bin")
+    os.symlink(shutil.which("g++"), f"{root}/bin/g++")
+    pch = PrecompiledHeaders(root, ["include"])
+    assert pch.build(["api.h", "missing.h"], [("dbg", ["-g"]), ("opt", ["-O2"])]) == \
+        ["include/api.h.gch/dbg.gch", "include/api.h.gch/opt.gch"]
+    assert pch.failed == {}
+    with open(f"{root}/include/api.h.gch/dbg.gch", "rb") as gf:
+        assert root.encode("utf8") not in gf.read()
@@ -0,0 +1,98 @@
+"""
+Serve a temporary registry over HTTP and check validators, Range requests and path checks.
+"""
+import asyncio
+import threading
+import http.client
+import pytest
+from conftest import write
+from registry_server import RegistryServer, parse_range
+
+TARBALL = bytes(range(256)) * 4
+
+@pytest.fixture
+def server(tmp_path):
+    """
+    A RegistryServer for a temporary registry, listening on a free local port in a thread,
+    returning the registry root and a function opening a connection to it
+    """
+    root = tmp_path / "bzlmod"
+    write(f"{root}/bazel_registry.json", "{}\n")
+    write(f"{root}/modules/test_suite/1.0/source.json", "{}\n")
+    write(f"{tmp_path}/secret", "not served\n")
+    (root / "tarballs").mkdir()
+    (root / "tarballs" / "test_suite-1.0.tar.xz").write_bytes(TARBALL)
+    loop = asyncio.new_event_loop()
+    started = loop.run_until_complete(asyncio.start_server(RegistryServer(str(root)).handle, "127.0.0.1", 0))
+    port = started.sockets[0].getsockname()[1]
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    yield root, lambda: http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    asyncio.run_coroutine_threadsafe(shutdown(started), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    loop.close()
+
+async def shutdown(started):
+    """
+    Stop listening and end the connection handlers still waiting for a request
+    """
+    started.close()
+    await started.wait_closed()
+    handlers = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+    for task in handlers:
+        task.cancel()
+    await asyncio.gather(*handlers, return_exceptions=True)
+
+def get(connect, path, **headers):
+    connection = connect()
+    connection.request("GET", path, headers=headers)
+    response = connection.getresponse()
+    body = response.read()
+    connection.close()
+    return response, body
+
+def test_parse_range():
+    assert parse_range("bytes=0-99", 1024) == (0, 99)
+    assert parse_range("bytes=1000-", 1024) == (1000, 1023)
+    assert parse_range("bytes=1000-5000", 1024) == (1000, 1023)
+    assert parse_range("bytes=-24", 1024) == (1000, 1023)
+    assert parse_range("bytes=-5000", 1024) == (0, 1023)
+    assert parse_range("bytes=1024-", 1024) is None
+    assert parse_range("bytes=10-5", 1024) is None
+    assert parse_range("bytes=-0", 1024) is None
+    assert parse_range("items=0-1", 1024) is None
+
+def test_ranges_and_validators(server):
+    root, connect = server
+    response, body = get(connect, "/tarballs/test_suite-1.0.tar.xz")
+    assert response.status == 200 and body == TARBALL
+    etag = response.getheader("ETag")
+    response, body = get(connect, "/tarballs/test_suite-1.0.tar.xz", Range="bytes=1000-")
+    assert response.status == 206 and body == TARBALL[1000:]
+    assert response.getheader("Content-Range") == f"bytes 1000-1023/{len(TARBALL)}"
+    # several ranges are answered with the whole file rather than a multipart response
+    response, body = get(connect, "/tarballs/test_suite-1.0.tar.xz", Range="bytes=0-9,1000-")
+    assert response.status == 200 and body == TARBALL
+    assert response.getheader("Content-Range") is None
+    response, body = get(connect, "/tarballs/test_suite-1.0.tar.xz", Range="bytes=2000-")
+    assert response.status == 416
+    assert response.getheader("Content-Range") == f"bytes */{len(TARBALL)}"
+    # a range for another version of the file is answered with the whole file
+    response, body = get(connect, "/tarballs/test_suite-1.0.tar.xz", Range="bytes=1000-", **{"If-Range": '"0-0"'})
+    assert response.status == 200 and body == TARBALL
+    response, body = get(connect, "/tarballs/test_suite-1.0.tar.xz", **{"If-None-Match": etag})
+    assert response.status == 304 and body == b""
+    # the registry root's absolute path may prefix a request, as in mirror URLs
+    response, body = get(connect, f"{root}/modules/test_suite/1.0/source.json")
+    assert response.status == 200 and body == b"{}\n"
+
+def test_paths_outside_the_registry_are_not_served(server):
+    root, connect = server
+    for path in ("/../secret", "/tarballs/../../secret", "/tarballs/%2e%2e/%2e%2e/secret",
+                 "/secret", "/tarballs", "/tarballs/missing.tar.xz"):
+        response, _ = get(connect, path)
+        assert response.status == 404, path
+    (root / "tarballs" / "escape").symlink_to(root.parent / "secret")
+    response, _ = get(connect, "/tarballs/escape")
+    assert response.status == 404
@@ -0,0 +1,62 @@
+"""
+Seed a repository cache from a temporary local registry and prune old versions from it.
+"""
+import os
+import json
+import base64
+import hashlib
+from compiler_suite_generator import Generator
+from conftest import write
+import repository_cache
+from repository_cache import RepositoryCache
+
+def publish(module, version, contents):
+    """
+    Write a tarball and its source.json into the local registry, returning the hex digest
+    """
+    name = f"{module}-{version}.tar.xz"
+    # a new tarball replaces the old one, which the cache may hard link
+    write(f"{Generator.TARBALL_DIR}/{name}.tmp", contents)
+    os.replace(f"{Generator.TARBALL_DIR}/{name}.tmp", f"{Generator.TARBALL_DIR}/{name}")
+    digest = hashlib.sha256(contents.encode("utf8")).digest()
+    source = {"url": f"file://{Generator.TARBALL_DIR}/{name}",
+              "integrity": "sha256-" + base64.b64encode(digest).decode("ascii")}
+    write(f"{Generator.MOD_DIR}/{module}/{version}/source.json", json.dumps(source))
+    return digest.hex()
+
+def test_seed_and_prune(registry):
+    write(f"{Generator.BZLMOD_DIR}/bazel_registry.json", json.dumps({"mirrors": ["http://buildhost:8765/"]}))
+    digests = {version: publish("test_suite", version, f"tarball {version}\n") for version in ("1.9", "1.10", "1.2")}
+    cache = RepositoryCache(f"{registry}/cache")
+    for version in digests:
+        assert repository_cache.seed_version([cache], "test_suite", version) == 1
+    assert repository_cache.seed_version([cache], "test_suite", "1.10") == 0
+    entry = cache.entry_dir(digests["1.10"])
+    with open(f"{entry}/file", encoding="utf8") as ff:
+        assert ff.read() == "tarball 1.10\n"
+    url = f"file://{Generator.TARBALL_DIR}/test_suite-1.10.tar.xz"
+    mirrored = f"http://buildhost:8765/{Generator.TARBALL_DIR}/test_suite-1.10.tar.xz {url}"
+    for canonical_id in (url, mirrored):
+        assert os.path.exists(f"{entry}/id-{hashlib.sha256(canonical_id.encode('utf8')).hexdigest()}")
+    # entries of other downloads are left alone
+    os.makedirs(cache.entry_dir("0" * 64))
+    write(f"{cache.entry_dir('0' * 64)}/file", "other\n")
+    # versions sort numerically, so 1.10 is the newest
+    assert repository_cache.registry_versions("test_suite") == ["1.2", "1.9", "1.10"]
+    assert repository_cache.prune([cache], ["test_suite"], 1) == 2 * len("tarball 1.9\n")
+    assert [cache.contains(digests[v]) for v in ("1.2", "1.9", "1.10")] == [False, False, True]
+    assert cache.contains("0" * 64)
+
+def test_prune_removes_regenerated_versions(registry):
+    cache = RepositoryCache(f"{registry}/cache")
+    old = publish("test_suite", "1.0", "first build\n")
+    repository_cache.seed_version([cache], "test_suite", "1.0")
+    # regenerating a version publishes a new tarball under the same URL
+    new = publish("test_suite", "1.0", "second build\n")
+    repository_cache.seed_version([cache], "test_suite", "1.0")
+    os.makedirs(cache.entry_dir("0" * 64))
+    write(f"{cache.entry_dir('0' * 64)}/file", "other\n")
+    assert repository_cache.prune([cache], ["test_suite"], 1) == len("first build\n")
+    assert not os.path.exists(cache.entry_dir(old))
+    assert cache.contains(new)
+    assert cache.contains("0" * 64)
@@ -0,0 +1,51 @@
+"""
+Index a tarball from its tar stream and check trees and archives against the index.
+"""
+import os
+import gzip
+import base64
+import hashlib
+import subprocess
+from conftest import write
+from suite_manifest import file_sha256
+import tarball_index
+
+def test_index_matches_tree_and_tarball(tmp_path):
+    root = f"{tmp_path}/src"
+    long_name = "include/" + "c" * 120 + ".h"
+    write(f"{root}/bin/gcc", "driver\n")
+    os.link(f"{root}/bin/gcc", f"{root}/bin/cc")
+    write(f"{root}/{long_name}", "long\n")
+    os.symlink("gcc", f"{root}/bin/x86_64-pc-linux-gnu-gcc")
+    stream = subprocess.run(["tar", "--format=gnu", "--sort=name", "-cf", "-", "-C", root, "."],
+                            check=True, stdout=subprocess.PIPE).stdout
+    tarball = f"{tmp_path}/suite.tar.gz"
+    with open(tarball, "wb") as tf:
+        tf.write(gzip.compress(stream, mtime=0))
+    with open(tarball, "rb") as tf:
+        integrity = "sha256-" + base64.b64encode(hashlib.sha256(tf.read()).digest()).decode("ascii")
+    indexer = tarball_index.TarIndexer()
+    # odd sized chunks split headers and contents across feeds
+    for i in range(0, len(stream), 700):
+        indexer.feed(stream[i:i + 700])
+    index = indexer.index(integrity, {"bin/gcc": {"kind": "host"}})
+    tarball_index.save(index, tarball)
+    index = tarball_index.load(tarball)
+    entries = {entry["path"]: entry for entry in index["entries"]}
+    assert entries[long_name]["sha256"] == file_sha256(f"{root}/{long_name}")
+    # sorted by name, bin/cc is archived first and bin/gcc links to it
+    assert entries["bin/gcc"]["type"] == "hardlink" and entries["bin/gcc"]["link"] == "bin/cc"
+    assert entries["bin/gcc"]["sha256"] == entries["bin/cc"]["sha256"]
+    assert entries["bin/x86_64-pc-linux-gnu-gcc"]["link"] == "gcc"
+    assert entries["bin/gcc"]["stripped"] == "host"
+    offset = entries["bin/cc"]["offset"]
+    assert stream[offset + 512:offset + 512 + len("driver\n")] == b"driver\n"
+    assert [e["path"] for e in tarball_index.query(index, ["bin/*gcc"])] == ["bin/gcc", "bin/x86_64-pc-linux-gnu-gcc"]
+    assert tarball_index.verify_tree(index, root, full=True) == []
+    assert tarball_index.verify_tarball(index, tarball) == []
+    # same size, different contents: only found when the file is hashed
+    write(f"{root}/bin/gcc", "DRIVER\n")
+    assert tarball_index.verify_tree(index, root) == []
+    assert tarball_index.verify_tree(index, root, ["bin/*"]) == ["bin/cc: contents differ", "bin/gcc: contents differ"]
+    write(f"{root}/bin/extra", "\n")
+    assert "bin/extra: not in the tarball" in tarball_index.verify_tree(index, root)
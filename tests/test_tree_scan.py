@@ -0,0 +1,32 @@
+"""
+Check that the shared tree scan stays in step with the tree as stages change it.
+"""
+import os
+from conftest import write
+from suite_manifest import file_sha256, walk
+from tree_scan import TreeScan
+
+def test_refresh_keeps_walk_order_and_hashes(tmp_path):
+    root = str(tmp_path)
+    write(f"{root}/bin/gcc", "driver\n")
+    write(f"{root}/include/stdio.h", "stdio\n")
+    write(f"{root}/lib/libc.so.6", "libc\n")
+    os.symlink("libc.so.6", f"{root}/lib/libc.so")
+    scan = TreeScan(root).scan()
+    assert scan.sha256("bin/gcc") == file_sha256(f"{root}/bin/gcc")
+    os.link(f"{root}/bin/gcc", f"{root}/bin/cc")
+    write(f"{root}/a.txt", "new\n")
+    os.remove(f"{root}/include/stdio.h")
+    scan.refresh(["bin/cc", "a.txt", "include/stdio.h"])
+    assert [rel for rel, _ in scan.ordered()] == [rel for rel, _ in walk(root)]
+    assert scan.size() == (4, len("driver\nnew\nlibc\n"))
+    assert scan.symlinks() == ["lib/libc.so"]
+    # the hard link shares the driver's hash until the file is rewritten in place
+    assert scan.sha256("bin/cc") == file_sha256(f"{root}/bin/gcc")
+    st = os.stat(f"{root}/bin/gcc")
+    with open(f"{root}/bin/gcc", "w", encoding="utf8") as f:
+        f.write("DRIVER\n")
+    os.utime(f"{root}/bin/gcc", ns=(st.st_atime_ns, st.st_mtime_ns))
+    scan.forget(["bin/gcc"])
+    assert (st.st_dev, st.st_ino) not in scan.known_hashes()
+    assert scan.sha256("bin/cc") == file_sha256(f"{root}/bin/gcc")